@@ -1,45 +1,264 @@
 from app.core.redis_client import redis_client
+from app.core.metrics import metrics
+from app.core.audit import audit_log
+from app.core.config import settings
+import numpy as np
+import json
+import os
 import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Ordered from least to most severe; index == decision band
+ACTIONS = ("SAFE", "WARNING", "REQUIRE_REAUTH", "FORCE_LOGOUT", "LOCK_ACCOUNT")
+
+DECISION_CACHE_CHANNEL = "decision-cache"
+
+class DecisionPolicy:
+    """
+    Score thresholds + grace period.
+    A score strictly above a threshold moves it into the next band.
+    """
+    __slots__ = ("warning", "reauth", "force_logout", "lock", "grace_period", "version")
+    FIELDS = ("warning", "reauth", "force_logout", "lock", "grace_period")
+
+    def __init__(self, warning, reauth, force_logout, lock, grace_period, version="default"):
+        if not warning <= reauth <= force_logout <= lock:
+            raise ValueError("Thresholds must be ordered warning <= reauth <= force_logout <= lock")
+        if grace_period < 0:
+            raise ValueError("grace_period must not be negative")
+        self.warning = warning
+        self.reauth = reauth
+        self.force_logout = force_logout
+        self.lock = lock
+        self.grace_period = grace_period
+        self.version = version
+
+    @classmethod
+    def from_dict(cls, data, base=None, version="custom"):
+        """
+        Missing fields fall back to `base`.
+        Raises: ValueError on unknown fields or bad values
+        """
+        unknown = set(data) - set(cls.FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown policy fields: {sorted(unknown)}")
+        values = {field: float(data[field]) if field in data else getattr(base, field) for field in cls.FIELDS}
+        return cls(version=version, **values)
+
+    def thresholds(self):
+        return (self.warning, self.reauth, self.force_logout, self.lock)
+
+    def to_dict(self):
+        return {**{field: getattr(self, field) for field in self.FIELDS}, "version": self.version}
+
+class GraceCache:
+    """
+    Per-user last_reauth timestamps in front of `user:{id}:last_reauth`.
+    Read-through: a miss (including "no re-auth") is cached for `ttl` seconds.
+    Write-through: record() writes the store first, then the cache, and tells
+    other workers to drop their copy over pub/sub.
+    """
+    def __init__(self, store=None, ttl=30, max_size=100000):
+        self.redis = store or redis_client
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = {} # user_id -> (expires_at, last_reauth_ts or None)
+        self.hits = 0
+        self.misses = 0
+        self.redis.subscribe(DECISION_CACHE_CHANNEL, self._on_message)
+
+    def key(self, user_id):
+        return f"user:{user_id}:last_reauth"
+
+    async def get(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] > time.time():
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        value = await self.redis.get(self.key(user_id))
+        self._put(user_id, value)
+        return value
+
+    def peek(self, user_id):
+        """
+        Cache lookup without a store read.
+        Returns: (hit, last_reauth_ts or None)
+        """
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] > time.time():
+            return True, entry[1]
+        return False, None
+
+    def prime(self, user_id, value):
+        """
+        Caches a last_reauth value the caller read from the store itself
+        (e.g. pipelined with other reads).
+        """
+        self._put(user_id, value)
+
+    def _put(self, user_id, value):
+        if len(self._entries) >= self.max_size:
+            self._entries.clear()
+        self._entries[user_id] = (time.time() + self.ttl, value)
+
+    async def record(self, user_id, timestamp, ttl):
+        value = str(timestamp)
+        await self.redis.setex(self.key(user_id), max(1, int(ttl)), value)
+        self._put(user_id, value)
+        await self.redis.publish(DECISION_CACHE_CHANNEL, json.dumps({"invalidate": user_id}))
+
+    def invalidate(self, user_id):
+        self._entries.pop(user_id, None)
+
+    def _on_message(self, message):
+        user_id = json.loads(message).get("invalidate")
+        if user_id is not None:
+            self.invalidate(user_id)
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
 
 class AutoDecisionAgent:
-    def __init__(self):
+    # Default policy. A score strictly above a threshold moves it into the next band
+    WARNING_THRESHOLD = 50
+    REAUTH_THRESHOLD = 65
+    FORCE_LOGOUT_THRESHOLD = 85
+    LOCK_THRESHOLD = 95
+    GRACE_PERIOD = 900 # 15 minutes
+    POLICY_CHECK_INTERVAL = 2.0 # seconds between policy file mtime checks
+
+    def __init__(self, policy_path=None):
         self.redis = redis_client
+        self.grace = GraceCache(self.redis, ttl=settings.GRACE_CACHE_TTL)
+        self.default_policy = DecisionPolicy(
+            self.WARNING_THRESHOLD, self.REAUTH_THRESHOLD, self.FORCE_LOGOUT_THRESHOLD,
+            self.LOCK_THRESHOLD, self.GRACE_PERIOD,
+        )
+        self.policy = self.default_policy
+        self.policy_path = settings.DECISION_POLICY_PATH if policy_path is None else policy_path
+        self._policy_mtime = None
+        self._last_policy_check = 0.0
+        self.reload_policy(force=True)
+
+    def reload_policy(self, force=False):
+        """
+        Hot reload: re-reads the JSON policy file when its mtime changes
+        (checked at most every POLICY_CHECK_INTERVAL unless forced).
+        A broken file keeps the current policy.
+        Returns: the active DecisionPolicy
+        """
+        now = time.time()
+        if not self.policy_path or (not force and now - self._last_policy_check < self.POLICY_CHECK_INTERVAL):
+            return self.policy
+        self._last_policy_check = now
+        try:
+            mtime = os.path.getmtime(self.policy_path)
+        except OSError:
+            return self.policy
+        if mtime == self._policy_mtime:
+            return self.policy
+        self._policy_mtime = mtime
+        try:
+            with open(self.policy_path) as f:
+                self.set_policy(json.load(f), version=f"file@{int(mtime)}")
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(f"❌ [Judge] Policy file {self.policy_path} rejected ({e}), keeping {self.policy.version}")
+        return self.policy
+
+    def set_policy(self, data, version="custom"):
+        """
+        Replaces the active policy; fields not given keep their default.
+        Raises: ValueError
+        """
+        self.policy = DecisionPolicy.from_dict(data, base=self.default_policy, version=version)
+        logger.info(f"⚖️ [Judge] Decision policy {self.policy.version}: {self.policy.to_dict()}")
+        return self.policy
+
+    def current_policy(self):
+        return self.reload_policy()
 
+    @metrics.timed("agent_call_seconds", agent="decision", method="evaluate_risk")
     async def evaluate_risk(self, user_id, session_id, current_score):
         """
         Evaluates risk score and determines action.
         Returns: Action String (SAFE, WARNING, REQUIRE_REAUTH, FORCE_LOGOUT, LOCK_ACCOUNT)
         """
-        # Get Last Reauth Timestamp
-        last_reauth_key = f"user:{user_id}:last_reauth"
-        last_reauth_ts = await self.redis.get_client().get(last_reauth_key)
+        policy = self.current_policy()
         
         is_in_grace_period = False
+        if policy.reauth < current_score <= policy.force_logout:
+            # Only the re-auth band depends on the grace period (cached read)
+            last_reauth_ts = await self.grace.get(user_id)
+            is_in_grace_period = self.in_grace_period(last_reauth_ts, policy)
+        
+        action = self.decide(current_score, is_in_grace_period, policy)
+        if action in ("REQUIRE_REAUTH", "FORCE_LOGOUT", "LOCK_ACCOUNT"):
+            audit_log.emit("decision", user_id, session_id=session_id, score=current_score,
+                           action=action, policy=policy.version)
+        return action
+
+    def last_reauth_key(self, user_id):
+        return self.grace.key(user_id)
+
+    def in_grace_period(self, last_reauth_ts, policy=None):
+        policy = policy or self.policy
         if last_reauth_ts:
             diff = time.time() - float(last_reauth_ts)
-            if diff < 900: # 15 minutes
-                is_in_grace_period = True
-        
-        action = "SAFE"
+            if diff < policy.grace_period:
+                return True
+        return False
+
+    async def record_reauth(self, user_id):
+        """
+        Starts the grace period (write-through to the store and every worker's cache).
+        """
+        await self.grace.record(user_id, time.time(), ttl=self.policy.grace_period)
+
+    def decide(self, current_score, is_in_grace_period=False, policy=None):
+        """
+        Pure decision for a score (no store access).
+        Returns: Action String
+        """
+        policy = policy or self.policy
         
-        if current_score > 95:
+        if current_score > policy.lock:
             return "LOCK_ACCOUNT"
         
-        if current_score > 85:
+        if current_score > policy.force_logout:
             # Critical Level - IGNORE Grace Period
             return "FORCE_LOGOUT"
             
-        if current_score > 65:
+        if current_score > policy.reauth:
             # Soft Level - Check Grace Period
             if is_in_grace_period:
-                print(f"⚖️ [Judge] Grace Period Active. Downgrading REAUTH to WARNING.")
+                logger.debug(f"⚖️ [Judge] Grace Period Active. Downgrading REAUTH to WARNING.")
                 return "WARNING"
             else:
                 return "REQUIRE_REAUTH"
                 
-        if current_score > 50:
+        if current_score > policy.warning:
             return "WARNING"
             
         return "SAFE"
 
+    def classify_batch(self, scores, in_grace=None):
+        """
+        Vectorized evaluate_risk over an array of scores (no store access).
+        in_grace: optional bool array; downgrades REQUIRE_REAUTH to WARNING.
+        Returns: int8 array of bands (index into ACTIONS)
+        """
+        thresholds = np.array(self.current_policy().thresholds())
+        # Number of thresholds strictly below the score == band
+        bands = np.searchsorted(thresholds, scores, side='left').astype(np.int8)
+        if in_grace is not None:
+            reauth = ACTIONS.index("REQUIRE_REAUTH")
+            bands[(bands == reauth) & np.asarray(in_grace, dtype=bool)] = ACTIONS.index("WARNING")
+        return bands
+
+    def get_metrics(self):
+        return {"policy": self.policy.to_dict(), "grace_cache": self.grace.stats()}
+
 decision_agent = AutoDecisionAgent()
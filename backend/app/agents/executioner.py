@@ -1,5 +1,12 @@
 from app.core.redis_client import redis_client
-import time
+from app.core.metrics import metrics
+from app.core.audit import audit_log
+from app.auth.revocation import revocation_index
+from app.agents.decision import decision_agent
+from app.agents.token_lifecycle import token_lifecycle
+import logging
+
+logger = logging.getLogger(__name__)
 
 # We need access to the send_message capability. 
 # Since this agent is called from websockets.py (where sio_server exists), 
@@ -13,14 +20,20 @@ class ForcedLogoutAgent:
     def __init__(self):
         self.redis = redis_client
 
+    @metrics.timed("agent_call_seconds", agent="executioner", method="execute_global_logout")
     async def execute_global_logout(self, sio_server, user_id, reason):
         """
         Kills all active sessions for a user.
         """
-        print(f"🛑 [Executioner] Executing GLOBAL LOGOUT for {user_id}. Reason: {reason}")
+        logger.warning(f"🛑 [Executioner] Executing GLOBAL LOGOUT for {user_id}. Reason: {reason}")
         
-        # 1. Blacklist tokens (Mock or Redis Set)
-        # self.redis.sadd(f"blacklist:{user_id}", current_token)
+        # 1. Revoke tokens: one epoch write invalidates every token issued so far
+        async with self.redis.pipeline(transaction=True) as pipe:
+            epochs = revocation_index.revoke_user(pipe, user_id)
+            pipe.delete(f"user:{user_id}:sessions")
+            await pipe.execute()
+        await revocation_index.publish(epochs=epochs)
+        audit_log.emit("global_logout", user_id, reason=reason, revoked_before=epochs[user_id])
         
         # 2. Emit Signal
         await sio_server.emit('LOGOUT_ALL', {
@@ -36,12 +49,14 @@ class ForcedLogoutAgent:
         # We can implement that in the caller or pass the list logic here.
         pass # Actual disconnect loop can be in the controller
 
+    @metrics.timed("agent_call_seconds", agent="executioner", method="trigger_reauth")
     async def trigger_reauth(self, sio_server, user_id, session_id):
         """
         Sends a Re-Auth signal to a specific session (or all).
         Usually Re-Auth is session specific if caused by rapid switching on THAT device.
         """
-        print(f"🛡️ [Executioner] Triggering RE-AUTH for {user_id} (Session: {session_id})")
+        logger.info(f"🛡️ [Executioner] Triggering RE-AUTH for {user_id} (Session: {session_id})")
+        audit_log.emit("reauth_required", user_id, session_id=session_id)
         # We need the SID for this session_id. 
         # If we stored SID in Redis, we could fetch it.
         # For now, we will emit to the USER ROOM, but with a specific session_id in payload?
@@ -51,9 +66,12 @@ class ForcedLogoutAgent:
             'reason': 'Risk Threshold Exceeded'
         }, room=f"user_{user_id}")
 
-    def log_success_reauth(self, user_id):
-        key = f"user:{user_id}:last_reauth"
-        self.redis.get_client().set(key, str(time.time()))
-        print(f"✅ [Executioner] Re-Auth Verified. Grace Period Started.")
+    @metrics.timed("agent_call_seconds", agent="executioner", method="log_success_reauth")
+    async def log_success_reauth(self, user_id):
+        # Write-through: store + every worker's grace cache, then drop stale refresh verdicts
+        await decision_agent.record_reauth(user_id)
+        await token_lifecycle.invalidate_everywhere(user_id)
+        audit_log.emit("reauth_success", user_id)
+        logger.info(f"✅ [Executioner] Re-Auth Verified. Grace Period Started.")
 
 executioner = ForcedLogoutAgent()
@@ -0,0 +1,200 @@
+import asyncio
+import time
+import logging
+from app.core.config import settings
+from app.core.redis_client import redis_client
+from app.core.sessions import FIELD_BITS, split_session_key
+from app.auth.session_registry import socket_registry
+from app.agents.monitoring import session_monitor
+
+logger = logging.getLogger(__name__)
+
+class HeartbeatBuffer:
+    """
+    Coalesces socket heartbeats and ages out silent sessions.
+    - beat() only records last-seen in memory (no store I/O on the event path).
+      The exact time stays in memory for the reaper; the store is written at
+      most once per session per write_interval, which only has to keep the
+      session hash's TTL alive (a join counts as a write).
+    - Every flush_interval the queued beats are written in one pipeline:
+      hset_if_exists of last_heartbeat per session whose socket is still
+      registered (existence check, write and TTL refresh in one step, so a
+      session ended or expired meanwhile is not recreated as a partial row),
+      one TTL refresh per user's live-session set and, with a shared store,
+      per user's socket set.
+    - Every reap_interval, joined sockets silent for idle_timeout are handed to
+      the idle handler (which disconnects them), and on the in-memory store
+      session rows with a stale last_heartbeat and no live socket - e.g. ones
+      restored from a snapshot - are deleted via one columnar scan.
+    """
+    def __init__(self, flush_interval=0.25, idle_timeout=330, reap_interval=30, write_interval=150):
+        self.redis = redis_client
+        self.registry = socket_registry
+        self.flush_interval = flush_interval
+        self.write_interval = write_interval
+        self.idle_timeout = idle_timeout
+        self.reap_interval = reap_interval
+        self.on_idle = None
+        self._last_seen = {} # sid -> (user_id, last beat or join time)
+        self._pending = {} # sid -> (user_id, ts) beats not yet written
+        self._written = {} # sid -> time its last_heartbeat was last queued for the store
+        self._tasks = []
+        self.stats = {
+            "beats": 0, "throttled": 0, "coalesced": 0, "flushes": 0, "sessions_written": 0, "skipped_gone": 0,
+            "last_flush_ms": 0.0, "reaped_sockets": 0, "reaped_sessions": 0,
+        }
+
+    def set_idle_handler(self, handler):
+        self.on_idle = handler
+
+    def track(self, user_id, sid):
+        # A join counts as the first beat (register_session wrote last_heartbeat)
+        now = time.time()
+        self._last_seen[sid] = (user_id, now)
+        self._written[sid] = now
+
+    def forget(self, sid):
+        self._last_seen.pop(sid, None)
+        self._pending.pop(sid, None)
+        self._written.pop(sid, None)
+
+    def beat(self, sid, user_id):
+        """
+        Records a heartbeat without touching the store.
+        Returns: False if the sid is not a joined session on this worker
+        """
+        if sid not in self._last_seen:
+            return False
+        now = time.time()
+        self._last_seen[sid] = (user_id, now)
+        self.stats["beats"] += 1
+        if now - self._written.get(sid, 0) < self.write_interval:
+            # The hash's TTL is still well ahead: the reaper reads _last_seen
+            self.stats["throttled"] += 1
+            return True
+        if sid in self._pending:
+            self.stats["coalesced"] += 1
+        self._pending[sid] = (user_id, now)
+        self._written[sid] = now
+        return True
+
+    def start(self):
+        if self._tasks:
+            return
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._flush_loop()), loop.create_task(self._reap_loop())]
+        logger.info(f"✅ [Heartbeat] Flushing every {self.flush_interval}s, reaping sessions idle for {self.idle_timeout}s")
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"❌ [Heartbeat] Flush failed: {e}")
+
+    async def _reap_loop(self):
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            try:
+                await self.reap()
+            except Exception as e:
+                logger.error(f"❌ [Heartbeat] Reap failed: {e}")
+
+    async def flush(self):
+        """
+        Writes queued beats of sessions that still exist (one pipeline).
+        Returns: number of sessions written
+        """
+        if not self._pending:
+            return 0
+        started = time.perf_counter()
+        pending, self._pending = self._pending, {}
+        beats = [(sid, user_id, ts) for sid, (user_id, ts) in pending.items() if self.registry.get(sid) is not None]
+
+        written = 0
+        if beats:
+            users = {user_id for _, user_id, _ in beats}
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for sid, user_id, ts in beats:
+                    pipe.hset_if_exists(self.redis.session_key(user_id, sid), {"last_heartbeat": int(ts)})
+                for user_id in users:
+                    pipe.expire(session_monitor.live_sessions_key(user_id))
+                    if self.registry.shared:
+                        # Keeps each user's cluster-wide socket set alive
+                        pipe.expire(self.registry.socket_key(user_id))
+                results = await pipe.execute()
+            written = sum(1 for present in results[:len(beats)] if present)
+
+        stats = self.stats
+        stats["flushes"] += 1
+        stats["sessions_written"] += written
+        stats["skipped_gone"] += len(pending) - written
+        stats["last_flush_ms"] = (time.perf_counter() - started) * 1000
+        return written
+
+    async def reap(self):
+        """
+        Ages out sockets and session rows that stopped beating.
+        Returns: (sockets reaped, store sessions reaped)
+        """
+        cutoff = time.time() - self.idle_timeout
+        idle = [(sid, user_id) for sid, (user_id, seen) in self._last_seen.items() if seen < cutoff]
+        for sid, user_id in idle:
+            self.forget(sid)
+            logger.info(f"💤 [Heartbeat] Session {sid} of {user_id} went silent, reaping")
+            if self.on_idle is not None:
+                try:
+                    await self.on_idle(user_id, sid)
+                except Exception as e:
+                    logger.error(f"❌ [Heartbeat] Idle handler failed for {sid}: {e}")
+
+        orphans = self._stale_rows(cutoff)
+        if orphans:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key in orphans:
+                    user_id, session_id = split_session_key(key)
+                    pipe.delete(key)
+                    pipe.srem(session_monitor.live_sessions_key(user_id), session_id)
+                await pipe.execute()
+
+        self.stats["reaped_sockets"] += len(idle)
+        self.stats["reaped_sessions"] += len(orphans)
+        return len(idle), len(orphans)
+
+    def _stale_rows(self, cutoff):
+        """
+        Session keys whose last_heartbeat is older than cutoff and whose socket
+        is not live here. Only the in-memory store has a session table; Redis
+        expires abandoned session hashes by TTL.
+        """
+        table = self.redis.session_table
+        if table is None or not len(table):
+            return []
+        columns = table.scan()
+        beating = (columns["present"] & FIELD_BITS["last_heartbeat"]) != 0
+        stale = columns["rows"][beating & (columns["last_heartbeat"] < cutoff)]
+        keys = []
+        for row in stale.tolist():
+            key = table.key(int(row))
+            if key is not None and key.rpartition(":")[2] not in self._last_seen:
+                keys.append(key)
+        return keys
+
+    def get_metrics(self):
+        return {**self.stats, "tracked": len(self._last_seen), "pending": len(self._pending)}
+
+# Singleton
+heartbeat_buffer = HeartbeatBuffer(
+    flush_interval=settings.HEARTBEAT_FLUSH_INTERVAL,
+    idle_timeout=settings.SESSION_IDLE_TIMEOUT,
+    reap_interval=settings.SESSION_REAP_INTERVAL,
+    write_interval=settings.HEARTBEAT_WRITE_INTERVAL,
+)
@@ -1,45 +1,60 @@
 from app.core.redis_client import redis_client
+from app.core.metrics import metrics
 import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Set of a user's registered session ids, so counting them is one SCARD
+LIVE_SESSIONS_KEY = "user:{user_id}:live_sessions"
 
 class SessionMonitoringAgent:
     def __init__(self):
         self.redis = redis_client
 
+    def live_sessions_key(self, user_id):
+        return LIVE_SESSIONS_KEY.format(user_id=user_id)
+
+    @metrics.timed("agent_call_seconds", agent="monitoring", method="register_session")
     async def register_session(self, user_id, session_id, meta):
         """
         Registers a new session in Redis using a Hash.
         Meta includes: ip, device, app_name, etc.
+        user_id/session_id are not stored: the key already encodes both.
         """
         key = self.redis.session_key(user_id, session_id)
+        now = int(time.time())
         
-        # Base session data
+        # Base session data (native ints; the in-memory store keeps them typed)
         session_data = {
-            "user_id": user_id,
-            "session_id": session_id,
-            "start_time": str(int(time.time())),
-            "last_heartbeat": str(int(time.time())),
-            "risk_score": "0",  # Initialize as string for Redis
+            "start_time": now,
+            "last_heartbeat": now,
+            "risk_score": 0,
             "status": "ACTIVE",
             **meta # unpacking ip, device, app_name
         }
         
-        await self.redis.hset(key, session_data)
-        print(f"🕵️ [Monitor] Registered Session: {user_id} :: {session_id} ({meta.get('app_name')})")
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hset(key, session_data)
+            pipe.sadd(self.live_sessions_key(user_id), session_id)
+            await pipe.execute()
+        logger.debug(f"🕵️ [Monitor] Registered Session: {user_id} :: {session_id} ({meta.get('app_name')})")
 
+    @metrics.timed("agent_call_seconds", agent="monitoring", method="heartbeat")
     async def heartbeat(self, user_id, session_id):
         """
         Updates the last_heartbeat timestamp and refreshes TTL.
         """
         key = self.redis.session_key(user_id, session_id)
-        if await self.redis.get_client().exists(key):
-            await self.redis.hset(key, {"last_heartbeat": str(int(time.time()))})
-            # print(f"💓 [Monitor] Heartbeat received for {session_id}")
-            return True
-        return False
+        # Never recreates an ended/expired session (check + write in one step)
+        return await self.redis.hset_if_exists(key, {"last_heartbeat": int(time.time())})
 
+    @metrics.timed("agent_call_seconds", agent="monitoring", method="get_active_sessions")
     async def get_active_sessions(self, user_id):
         """
         Returns a list of active session dicts for the user.
+        The store resolves the pattern through its namespace index, so this
+        costs O(sessions for user) rather than O(all keys).
         """
         pattern = self.redis.session_key(user_id, "*")
         keys = await self.redis.keys(pattern)
@@ -47,12 +62,62 @@ class SessionMonitoringAgent:
         for key in keys:
             data = await self.redis.hgetall(key)
             if data:
-                sessions.append(data)
+                sessions.append(self._with_ids(data, user_id, key.rsplit(":", 1)[1]))
         return sessions
 
+    @metrics.timed("agent_call_seconds", agent="monitoring", method="end_session")
+    async def end_session(self, user_id, session_id):
+        """
+        Removes the session hash once its socket is gone.
+        """
+        key = self.redis.session_key(user_id, session_id)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.delete(key)
+            pipe.srem(self.live_sessions_key(user_id), session_id)
+            await pipe.execute()
+
+    @metrics.timed("agent_call_seconds", agent="monitoring", method="prune_live_sessions")
+    async def prune_live_sessions(self, user_id):
+        """
+        Drops members of the user's live session set whose session hash is
+        gone. end_session removes its member, but a hash that expired by TTL
+        (crashed worker, snapshot restore) leaves it behind, and every sadd
+        keeps the set itself alive.
+        Returns: number of live sessions left
+        """
+        key = self.live_sessions_key(user_id)
+        members = list(await self.redis.smembers(key))
+        if not members:
+            return 0
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for session_id in members:
+                pipe.exists(self.redis.session_key(user_id, session_id))
+            present = await pipe.execute()
+        stale = [session_id for session_id, alive in zip(members, present) if not alive]
+        if stale:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for session_id in stale:
+                    pipe.srem(key, session_id)
+                await pipe.execute()
+            logger.info(f"🧹 [Monitor] Pruned {len(stale)} expired sessions of {user_id}")
+        return len(members) - len(stale)
+
     async def get_session_data(self, user_id, session_id):
         key = self.redis.session_key(user_id, session_id)
-        return await self.redis.hgetall(key)
+        data = await self.redis.hgetall(key)
+        return self._with_ids(data, user_id, session_id) if data else data
+
+    def _with_ids(self, data, user_id, session_id):
+        # Redis hashes no longer carry the ids; the in-memory view already does
+        if "user_id" not in data:
+            data = {"user_id": user_id, "session_id": session_id, **data}
+        return data
+
+    def session_table(self):
+        """
+        Returns: the store's columnar SessionTable (in-memory store), or None
+        """
+        return self.redis.session_table
 
 # Singleton
 session_monitor = SessionMonitoringAgent()
@@ -1,63 +1,131 @@
 from app.core.redis_client import redis_client
+from app.core.metrics import metrics
 from app.agents.monitoring import session_monitor
+from app.agents.decision import decision_agent, ACTIONS
+from app.agents.rules import RiskContext, default_rules
+from app.agents.token_lifecycle import token_lifecycle
+import numpy as np
+import asyncio
 import time
-from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
 
 class RiskDetectionAgent:
     def __init__(self):
         self.redis = redis_client
         self.monitor = session_monitor
+        self.rules = []
+        self.rule_stats = {} # rule name -> {calls, hits, total_ms, max_ms}
+        for rule in default_rules():
+            self.register_rule(rule)
+
+    def register_rule(self, rule):
+        """
+        Adds a rule (replacing any rule with the same name).
+        """
+        self.unregister_rule(rule.name)
+        self.rules.append(rule)
+        self.rule_stats[rule.name] = {"calls": 0, "hits": 0, "total_ms": 0.0, "max_ms": 0.0}
+
+    def unregister_rule(self, name):
+        self.rules = [rule for rule in self.rules if rule.name != name]
+        self.rule_stats.pop(name, None)
+
+    async def _fetch_reads(self, ctx):
+        """
+        Fetches every store read declared by the registered rules in one batch.
+        """
+        wanted = []
+        for rule in self.rules:
+            for command, template in rule.reads:
+                read = (command, ctx.resolve(template))
+                if read not in ctx.reads and read not in wanted:
+                    wanted.append(read)
+        if not wanted:
+            return
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for command, key in wanted:
+                getattr(pipe, command)(key)
+            results = await pipe.execute()
+        ctx.reads.update(zip(wanted, results))
 
-    async def calculate_risk(self, user_id, session_id, current_meta):
+    async def _run_rule(self, rule, ctx):
+        started = time.perf_counter()
+        try:
+            return await rule.evaluate(ctx)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            stats = self.rule_stats.get(rule.name)
+            if stats is not None:
+                stats["calls"] += 1
+                stats["total_ms"] += elapsed_ms
+                stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+    @metrics.timed("agent_call_seconds", agent="risk", method="calculate_risk")
+    async def calculate_risk(self, user_id, session_id, current_meta, family=None):
         """
         Calculates the risk score for a session event.
+        Store reads for all rules are batched, then rules run concurrently.
+        family: the refresh token family the session belongs to; its score
+        for the refresh gate is written with the session's.
         Returns: (total_score, reasons_list)
         """
+        ctx = RiskContext(user_id, session_id, current_meta)
+        await self._fetch_reads(ctx)
+
+        rules = list(self.rules)
+        await asyncio.gather(*(rule.check_reads(ctx) for rule in rules))
+        results = await asyncio.gather(*(self._run_rule(rule, ctx) for rule in rules))
+
         total_score = 0
         reasons = []
+        for rule, (score, reason) in zip(rules, results):
+            if score:
+                total_score += score
+                self.rule_stats[rule.name]["hits"] += 1
+            if reason:
+                reasons.append(reason)
 
-        # 1. Geo-Fencing Rule (India Only)
-        country = current_meta.get('country', 'India')
-        if country != 'India':
-             total_score += 100
-             reasons.append(f"Foreign Access Detected: {country} (Strict Policy: India Only)")
-
-        # 2. High Concurrency (>3 Sessions)
-        active_sessions = await self.monitor.get_active_sessions(user_id)
-        if len(active_sessions) > 3:
-            total_score += 30
-            reasons.append(f"High Concurrency: {len(active_sessions)} Active Sessions (+30)")
-
-        # 3. Abnormal Login Time (11 PM - 5 AM)
-        current_hour = datetime.now().hour
-        if current_hour >= 23 or current_hour < 5:
-            total_score += 15
-            reasons.append(f"Abnormal Login Time: {current_hour}:00 (+15)")
-
-        # 4. Rapid App Switching (< 10 seconds)
-        last_switch_key = f"user:{user_id}:last_app_switch"
-        last_switch_time = await self.redis.get_client().get(last_switch_key)
-        now = time.time()
-        
-        if last_switch_time:
-            diff = now - float(last_switch_time)
-            if diff < 10:
-                total_score += 20
-                reasons.append(f"Rapid App Switching: {int(diff)}s interval (+20)")
-        
-        # Update last switch time
-        await self.redis.get_client().set(last_switch_key, str(now))
-
-        # Update Session Risk in Redis
+        # Rule state (e.g. last switch time) + Session/Family Risk in Redis (one round trip)
         key = self.redis.session_key(user_id, session_id)
-        
-        await self.redis.hset(key, {"risk_score": str(total_score)})
-        
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for rule in rules:
+                rule.queue_writes(ctx, pipe)
+            pipe.hset(key, {"risk_score": total_score})
+            if family:
+                token_lifecycle.queue_risk(pipe, family, total_score)
+            await pipe.execute()
+
         if total_score > 0:
-            print(f"⚠️ [Risk Agent] Risk {total_score} for {user_id}: {', '.join(reasons)}")
-            
+            logger.warning(f"⚠️ [Risk Agent] Risk {total_score} for {user_id}: {', '.join(reasons)}")
+
         return total_score, reasons
 
+    def score_batch(self, features, in_grace=None):
+        """
+        Scores many sessions at once from columnar BatchFeatures.
+        Unlike calculate_risk this never touches the store (no last_app_switch update).
+        Bands use the same thresholds as AutoDecisionAgent.evaluate_risk.
+        Returns: dict with 'scores' (int32), 'bands' (int8) and 'actions' (str) arrays
+        """
+        scores = np.zeros(len(features), dtype=np.int32)
+        for rule in self.rules:
+            scores += rule.score_batch(features).astype(np.int32, copy=False)
+        bands = decision_agent.classify_batch(scores, in_grace)
+        return {
+            "scores": scores,
+            "bands": bands,
+            "actions": np.array(ACTIONS)[bands],
+        }
+
+    def get_rule_stats(self):
+        return {
+            name: {**stats, "avg_ms": stats["total_ms"] / stats["calls"] if stats["calls"] else 0.0}
+            for name, stats in self.rule_stats.items()
+        }
+
     async def update_risk_score(self, user_id, session_id, score):
         key = self.redis.session_key(user_id, session_id)
         await self.redis.hincrby(key, "risk_score", score)
@@ -0,0 +1,170 @@
+import asyncio
+import time
+from app.core.config import settings
+from app.agents.risk import risk_detector
+from app.agents.decision import decision_agent
+from app.auth.session_registry import socket_registry
+import logging
+
+logger = logging.getLogger(__name__)
+
+class RiskJob:
+    __slots__ = ("user_id", "session_id", "meta", "family", "enqueued_at")
+
+    def __init__(self, user_id, session_id, meta, family=None):
+        self.user_id = user_id
+        self.session_id = session_id
+        self.meta = meta
+        self.family = family
+        self.enqueued_at = time.perf_counter()
+
+class RiskWorkerPool:
+    """
+    Runs risk analysis (calculate_risk -> evaluate_risk) off the socket join path.
+    - Bounded queue: submit() refuses work once max_depth jobs are waiting.
+    - Per-session coalescing: while a session's job is still queued, a repeat
+      join of that session replaces its meta instead of queueing a duplicate.
+      Different sessions of one user are each scored, one at a time in join
+      order (per-user lock), so each sees the previous one's app switch.
+    - Jobs whose socket disconnected while queued are dropped: scoring them
+      would recreate the session hash the disconnect removed.
+    - The verdict handler is awaited with (user_id, session_id, score, reasons, action).
+    """
+    def __init__(self, workers=4, max_depth=10000):
+        self.detector = risk_detector
+        self.decision = decision_agent
+        self.worker_count = workers
+        self.max_depth = max_depth
+        self.registry = socket_registry
+        self.on_verdict = None
+        self._queue = None
+        self._pending = {} # (user_id, session_id) -> queued RiskJob
+        self._user_locks = {} # user_id -> [asyncio.Lock, jobs holding or awaiting it]
+        self._tasks = []
+        self.stats = {
+            "submitted": 0,
+            "coalesced": 0,
+            "rejected": 0,
+            "skipped_disconnected": 0,
+            "processed": 0,
+            "failed": 0,
+            "lag_ms_total": 0.0,
+            "lag_ms_max": 0.0,
+            "lag_ms_last": 0.0,
+        }
+
+    def set_verdict_handler(self, handler):
+        self.on_verdict = handler
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_depth)
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.worker_count)]
+        logger.info(f"✅ [Risk Queue] Started {self.worker_count} risk workers (max depth {self.max_depth})")
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._pending.clear()
+        self._user_locks.clear()
+
+    def submit(self, user_id, session_id, meta, family=None):
+        """
+        Queues a risk job without waiting for it.
+        family: the session's refresh token family (its score feeds the refresh gate)
+        Returns: False if the queue is full (caller should apply backpressure)
+        """
+        if not self._tasks:
+            self.start()
+
+        job = self._pending.get((user_id, session_id))
+        if job is not None:
+            # Same session joined again while still waiting: analyse its newest meta
+            job.meta = meta
+            job.family = family
+            self.stats["coalesced"] += 1
+            return True
+
+        job = RiskJob(user_id, session_id, meta, family)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            return False
+        self._pending[(user_id, session_id)] = job
+        self.stats["submitted"] += 1
+        return True
+
+    async def run_inline(self, user_id, session_id, meta, family=None):
+        """
+        Fallback for a saturated queue: analyse on the caller's task.
+        """
+        await self._process(RiskJob(user_id, session_id, meta, family))
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            if self._pending.get((job.user_id, job.session_id)) is job:
+                del self._pending[(job.user_id, job.session_id)]
+            lag_ms = (time.perf_counter() - job.enqueued_at) * 1000
+            self.stats["lag_ms_total"] += lag_ms
+            self.stats["lag_ms_last"] = lag_ms
+            self.stats["lag_ms_max"] = max(self.stats["lag_ms_max"], lag_ms)
+            try:
+                await self._process_in_order(job)
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.error(f"❌ [Risk Queue] Job for {job.user_id} failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _process_in_order(self, job):
+        slot = self._user_locks.get(job.user_id)
+        if slot is None:
+            slot = self._user_locks[job.user_id] = [asyncio.Lock(), 0]
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                if not self._still_joined(job):
+                    self.stats["skipped_disconnected"] += 1
+                    return
+                await self._process(job)
+        finally:
+            slot[1] -= 1
+            if not slot[1]:
+                del self._user_locks[job.user_id]
+
+    def _still_joined(self, job):
+        entry = self.registry.get(job.session_id)
+        return entry is not None and entry.user_id == job.user_id
+
+    async def _process(self, job):
+        score, reasons = await self.detector.calculate_risk(job.user_id, job.session_id, job.meta, job.family)
+        action = await self.decision.evaluate_risk(job.user_id, job.session_id, score)
+        self.stats["processed"] += 1
+        if self.on_verdict is not None:
+            await self.on_verdict(job.user_id, job.session_id, score, reasons, action)
+
+    async def drain(self):
+        """
+        Waits until every queued job has been processed.
+        """
+        if self._queue is not None:
+            await self._queue.join()
+
+    def get_metrics(self):
+        processed = self.stats["processed"] + self.stats["failed"] + self.stats["skipped_disconnected"]
+        return {
+            **self.stats,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "pending_sessions": len(self._pending),
+            "workers": len(self._tasks),
+            "lag_ms_avg": self.stats["lag_ms_total"] / processed if processed else 0.0,
+        }
+
+# Singleton
+risk_workers = RiskWorkerPool(workers=settings.RISK_WORKERS, max_depth=settings.RISK_QUEUE_MAX_DEPTH)
@@ -0,0 +1,199 @@
+from abc import ABC, abstractmethod
+from datetime import datetime
+import numpy as np
+import time
+from app.agents.monitoring import LIVE_SESSIONS_KEY, session_monitor
+
+class RiskContext:
+    """
+    Everything a rule may look at for one risk evaluation.
+    `reads` holds the results of the store reads declared by the rules,
+    keyed by (command, key), fetched in one batch before any rule runs.
+    """
+    __slots__ = ("user_id", "session_id", "meta", "now", "hour", "reads")
+
+    def __init__(self, user_id, session_id, meta):
+        self.user_id = user_id
+        self.session_id = session_id
+        self.meta = meta
+        self.now = time.time()
+        self.hour = datetime.now().hour
+        self.reads = {}
+
+    def read(self, command, template):
+        return self.reads.get((command, self.resolve(template)))
+
+    def resolve(self, template):
+        return template.format(user_id=self.user_id, session_id=self.session_id)
+
+class RiskRule(ABC):
+    """
+    Base class for risk signals.
+    Subclasses set `name`, declare store reads as (command, key template)
+    pairs in `reads`, implement evaluate() and its vectorized twin
+    score_batch(), and queue any state they keep for the next evaluation in
+    queue_writes(). A rule whose batched read can be stale corrects it in
+    check_reads().
+    """
+    name = "rule"
+    reads = ()
+
+    @abstractmethod
+    async def evaluate(self, ctx):
+        """
+        Returns: (score, reason or None)
+        """
+
+    async def check_reads(self, ctx):
+        """
+        Runs after the batched reads, before evaluate(); may replace a read
+        in ctx.reads with a corrected value (extra store work, rare path).
+        """
+
+    def queue_writes(self, ctx, pipe):
+        """
+        Queues this rule's store writes on the agent's post-evaluation pipeline.
+        """
+
+    @abstractmethod
+    def score_batch(self, features):
+        """
+        Vectorized, side-effect-free counterpart of evaluate() over a BatchFeatures.
+        Returns: int array of per-session scores
+        """
+
+class BatchFeatures:
+    """
+    Columnar session features for bulk scoring. All arrays have one entry per session.
+    - country_codes: int array indexing into `countries` (names)
+    - session_counts: active sessions of the session's user
+    - hours: local hour of the event (0-23)
+    - switch_intervals: seconds since the previous app switch, NaN if none
+    - admission_pressures: per-username login rate-limit pressure (count / limit), 0 if not given
+    """
+    __slots__ = ("country_codes", "countries", "session_counts", "hours", "switch_intervals", "admission_pressures")
+
+    def __init__(self, country_codes, countries, session_counts, hours, switch_intervals, admission_pressures=None):
+        self.country_codes = np.asarray(country_codes)
+        self.countries = list(countries)
+        self.session_counts = np.asarray(session_counts)
+        self.hours = np.asarray(hours)
+        self.switch_intervals = np.asarray(switch_intervals, dtype=np.float64)
+        if admission_pressures is None:
+            admission_pressures = np.zeros(len(self.country_codes))
+        self.admission_pressures = np.asarray(admission_pressures, dtype=np.float64)
+
+    @classmethod
+    def from_country_names(cls, country_names, session_counts, hours, switch_intervals, admission_pressures=None):
+        countries, codes = np.unique(np.asarray(country_names), return_inverse=True)
+        return cls(codes, countries.tolist(), session_counts, hours, switch_intervals, admission_pressures)
+
+    def __len__(self):
+        return len(self.country_codes)
+
+class GeoFenceRule(RiskRule):
+    name = "geo_fence"
+
+    def __init__(self, allowed_countries=("India",), weight=100):
+        self.allowed_countries = set(allowed_countries)
+        self.weight = weight
+
+    async def evaluate(self, ctx):
+        country = ctx.meta.get('country', 'India')
+        if country not in self.allowed_countries:
+            allowed = ", ".join(sorted(self.allowed_countries))
+            return self.weight, f"Foreign Access Detected: {country} (Strict Policy: {allowed} Only)"
+        return 0, None
+
+    def score_batch(self, features):
+        # Per-code lookup table, so the check is one gather over the batch
+        foreign = np.array([c not in self.allowed_countries for c in features.countries], dtype=bool)
+        return np.where(foreign[features.country_codes], self.weight, 0)
+
+class ConcurrencyRule(RiskRule):
+    name = "high_concurrency"
+    # The monitor's per-user session set: one SCARD, never a keyspace walk
+    reads = (("scard", LIVE_SESSIONS_KEY),)
+
+    def __init__(self, max_sessions=3, weight=30, monitor=session_monitor):
+        self.max_sessions = max_sessions
+        self.weight = weight
+        self.monitor = monitor
+
+    async def check_reads(self, ctx):
+        # The set may still hold sessions whose hash expired: only a count
+        # over the limit matters, so only then are members checked and pruned
+        active = ctx.read("scard", LIVE_SESSIONS_KEY) or 0
+        if active > self.max_sessions:
+            ctx.reads[("scard", ctx.resolve(LIVE_SESSIONS_KEY))] = await self.monitor.prune_live_sessions(ctx.user_id)
+
+    async def evaluate(self, ctx):
+        active = ctx.read("scard", LIVE_SESSIONS_KEY) or 0
+        if active > self.max_sessions:
+            return self.weight, f"High Concurrency: {active} Active Sessions (+{self.weight})"
+        return 0, None
+
+    def score_batch(self, features):
+        return np.where(features.session_counts > self.max_sessions, self.weight, 0)
+
+class NightTimeRule(RiskRule):
+    name = "abnormal_login_time"
+
+    def __init__(self, start_hour=23, end_hour=5, weight=15):
+        self.start_hour = start_hour
+        self.end_hour = end_hour
+        self.weight = weight
+
+    async def evaluate(self, ctx):
+        if ctx.hour >= self.start_hour or ctx.hour < self.end_hour:
+            return self.weight, f"Abnormal Login Time: {ctx.hour}:00 (+{self.weight})"
+        return 0, None
+
+    def score_batch(self, features):
+        hours = features.hours
+        return np.where((hours >= self.start_hour) | (hours < self.end_hour), self.weight, 0)
+
+class RapidSwitchRule(RiskRule):
+    name = "rapid_app_switching"
+    last_switch_key = "user:{user_id}:last_app_switch"
+    reads = (("get", last_switch_key),)
+
+    def __init__(self, min_interval=10, weight=20):
+        self.min_interval = min_interval
+        self.weight = weight
+
+    async def evaluate(self, ctx):
+        last_switch_time = ctx.read("get", self.last_switch_key)
+        if last_switch_time:
+            diff = ctx.now - float(last_switch_time)
+            if diff < self.min_interval:
+                return self.weight, f"Rapid App Switching: {int(diff)}s interval (+{self.weight})"
+        return 0, None
+
+    def queue_writes(self, ctx, pipe):
+        pipe.set(ctx.resolve(self.last_switch_key), str(ctx.now))
+
+    def score_batch(self, features):
+        # NaN (no previous switch) compares False
+        return np.where(features.switch_intervals < self.min_interval, self.weight, 0)
+
+class LoginVelocityRule(RiskRule):
+    name = "login_velocity"
+
+    def __init__(self, threshold=0.5, weight=25):
+        self.threshold = threshold
+        self.weight = weight
+
+    async def evaluate(self, ctx):
+        # Set by the login admission gate: this username's attempts so far / its
+        # rate limit. Per-IP pressure is not scored, users behind one NAT share it.
+        pressure = ctx.meta.get("admission_pressure", 0)
+        if pressure >= self.threshold:
+            return self.weight, f"Login Velocity: {int(pressure * 100)}% of Rate Limit (+{self.weight})"
+        return 0, None
+
+    def score_batch(self, features):
+        return np.where(features.admission_pressures >= self.threshold, self.weight, 0)
+
+def default_rules():
+    return [GeoFenceRule(), ConcurrencyRule(), NightTimeRule(), RapidSwitchRule(), LoginVelocityRule()]
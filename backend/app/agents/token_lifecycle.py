@@ -1,35 +1,143 @@
 from app.core.redis_client import redis_client
+from app.core.config import settings
+from app.core.metrics import metrics
 from app.agents.decision import decision_agent
+from app.auth.revocation import revocation_index
+import asyncio
+import time
+import logging
+
+logger = logging.getLogger(__name__)
 
 class TokenLifecycleAgent:
+    """
+    Risk gate on /refresh.
+    The family's risk score lives in `refresh_risk:{family}`. It is written
+    with every risk calculation of a session of the family (login and socket
+    joins, see RiskDetectionAgent.calculate_risk) and kept alive by every
+    rotation, so it lasts as long as the family's refresh tokens do (the
+    session hash expires with its heartbeats).
+    The score and last_reauth are fetched in one pipelined read; when the
+    grace cache already holds the user's last_reauth only the score is read.
+    The verdict is memoized per (user, family) for MEMO_WINDOW seconds, and
+    concurrent refreshes of one family share a single in-flight lookup, so a
+    burst of refreshes (several tabs, retries) costs one store round trip.
+    Memoized verdicts of a user are dropped on every worker via the
+    revocation channel.
+    """
+    MEMO_WINDOW = 5.0 # seconds
+    MAX_MEMO = 10000
+
     def __init__(self):
         self.redis = redis_client
         self.decision = decision_agent
+        self._memo = {} # (user_id, session_id) -> (expires_at, allow, message)
+        self._inflight = {} # (user_id, session_id) -> Future
+        self.ttl = settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400
+        self.stats = {"checks": 0, "memo_hits": 0, "store_reads": 0, "denied": 0}
+        revocation_index.invalidation_handlers.append(self.invalidate)
 
-    def validate_refresh(self, user_id, current_score):
+    def risk_key(self, family):
+        return f"refresh_risk:{family}"
+
+    def queue_risk(self, pipe, family, score):
         """
-        Validates if a refresh token should be honored based on risk.
-        Returns: (allow: bool, action: str)
-        """
-        # We assume the caller (API layer) has fetched the current score 
-        # or we fetch it here. We'll pass it in for efficiency.
-        
-        # Determine action
-        # Note: We technically don't have a session_id here during refresh easily unless 
-        # the token contains it. We'll assume User-Level decision for now.
-        action = self.decision.evaluate_risk(user_id, "refresh_flow", current_score)
-        
+        Queues a write of the family's latest risk score on `pipe` for the
+        refresh lifetime (with the session's own risk_score write).
+        """
+        pipe.setex(self.risk_key(family), self.ttl, str(score))
+
+    def touch(self, pipe, family):
+        """
+        Queues a TTL refresh of the family's risk score on `pipe` (rotation):
+        the new refresh token lives a full lifetime from now.
+        """
+        pipe.expire(self.risk_key(family), self.ttl)
+
+    async def _read_score(self, user_id, session_id):
+        """
+        Reads the family's score, and last_reauth unless the grace cache has
+        it, in one round trip. A fetched last_reauth primes the grace cache so
+        evaluate_risk does not read it again.
+        """
+        self.stats["store_reads"] += 1
+        cached, _ = self.decision.grace.peek(user_id)
+        if cached:
+            score = await self.redis.get(self.risk_key(session_id))
+            return float(score or 0)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.get(self.risk_key(session_id))
+            pipe.get(self.decision.last_reauth_key(user_id))
+            score, last_reauth = await pipe.execute()
+        self.decision.grace.prime(user_id, last_reauth)
+        return float(score or 0)
+
+    def _verdict(self, user_id, action, current_score):
         if action == "SAFE" or action == "WARNING":
             return True, "RefreshToken Granted"
-        
+
         if action == "REQUIRE_REAUTH":
-            print(f"🔄 [Token Agent] Refresh DENIED. Re-Auth Required for {user_id} (Score: {current_score})")
+            logger.info(f"🔄 [Token Agent] Refresh DENIED. Re-Auth Required for {user_id} (Score: {current_score})")
             return False, "High Risk: Re-Authentication Required"
-            
+
         if action == "FORCE_LOGOUT" or action == "LOCK_ACCOUNT":
-             print(f"🚫 [Token Agent] Refresh DENIED. Account Locked/Logged Out.")
+             logger.warning(f"🚫 [Token Agent] Refresh DENIED. Account Locked/Logged Out.")
              return False, "Security Alert: Session Terminated"
-             
+
         return True, "Granted"
 
+    async def _evaluate(self, key):
+        user_id, session_id = key
+        current_score = await self._read_score(user_id, session_id)
+        action = await self.decision.evaluate_risk(user_id, session_id, current_score)
+        allow, message = self._verdict(user_id, action, current_score)
+
+        if len(self._memo) >= self.MAX_MEMO:
+            now = time.time()
+            self._memo = {k: v for k, v in self._memo.items() if v[0] > now}
+        self._memo[key] = (time.time() + self.MEMO_WINDOW, allow, message)
+        return allow, message
+
+    @metrics.timed("agent_call_seconds", agent="token_lifecycle", method="validate_refresh")
+    async def validate_refresh(self, user_id, session_id):
+        """
+        Validates if a refresh token should be honored based on risk.
+        session_id: the login session (token family) the refresh belongs to.
+        Returns: (allow: bool, message: str)
+        """
+        self.stats["checks"] += 1
+        key = (user_id, session_id)
+        cached = self._memo.get(key)
+        if cached is not None and cached[0] > time.time():
+            self.stats["memo_hits"] += 1
+            allow, message = cached[1], cached[2]
+        else:
+            future = self._inflight.get(key)
+            if future is None:
+                future = asyncio.ensure_future(self._evaluate(key))
+                self._inflight[key] = future
+                future.add_done_callback(lambda _: self._inflight.pop(key, None))
+            allow, message = await asyncio.shield(future)
+
+        if not allow:
+            self.stats["denied"] += 1
+        return allow, message
+
+    def invalidate(self, user_id):
+        """
+        Drops this worker's memoized verdicts for a user.
+        """
+        for key in [k for k in self._memo if k[0] == user_id]:
+            del self._memo[key]
+
+    async def invalidate_everywhere(self, user_id):
+        """
+        Drops a user's memoized verdicts on every worker (e.g. after a successful re-auth).
+        """
+        self.invalidate(user_id)
+        await revocation_index.publish(invalidate=[user_id])
+
+    def get_metrics(self):
+        return {**self.stats, "memoized": len(self._memo)}
+
 token_lifecycle = TokenLifecycleAgent()
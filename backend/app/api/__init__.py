@@ -1,6 +1,7 @@
 from fastapi import APIRouter
+from app.core.metrics import TimedRoute
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
 
 # Import auth routes later
 from app.auth import oidc
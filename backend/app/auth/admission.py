@@ -0,0 +1,275 @@
+import array
+import time
+import logging
+from collections import OrderedDict
+from app.core.config import settings
+from app.core.redis_client import redis_client, InMemoryRedisClient
+from app.core.audit import audit_log
+
+logger = logging.getLogger(__name__)
+
+# Server-side sliding window for multi-node mode. One hash per (endpoint, scope,
+# key): field = sub-bucket number, value = hits. Every call adds its hits to
+# their buckets, drops buckets that left the window and returns the totals.
+# KEYS = one hash per limited key, ARGV = [bucket, buckets, ttl, hits...]
+WINDOW_SCRIPT = """
+local bucket = tonumber(ARGV[1])
+local oldest = bucket - tonumber(ARGV[2])
+local totals = {}
+for k = 1, #KEYS do
+    redis.call('HINCRBY', KEYS[k], ARGV[1], tonumber(ARGV[3 + k]))
+    local data = redis.call('HGETALL', KEYS[k])
+    local total = 0
+    for i = 1, #data, 2 do
+        if tonumber(data[i]) <= oldest then
+            redis.call('HDEL', KEYS[k], data[i])
+        else
+            total = total + tonumber(data[i + 1])
+        end
+    end
+    redis.call('EXPIRE', KEYS[k], ARGV[3])
+    totals[k] = total
+end
+return totals
+"""
+
+class _Shard:
+    __slots__ = ("index", "counts", "last", "free")
+
+    def __init__(self):
+        self.index = OrderedDict() # key -> slot, least recently hit first
+        self.counts = array.array("I") # slot * buckets + (bucket % buckets) -> hits
+        self.last = array.array("q") # slot -> sub-bucket of the last hit
+        self.free = []
+
+class SlidingWindowLimiter:
+    """
+    Per-key hit counts over a sliding window, in sharded ring buffers.
+    The window is split into `buckets` sub-buckets. Each tracked key owns a
+    slot in its shard: `buckets` uint32 counters in one flat array plus the
+    sub-bucket of its last hit, so a hit is a dict lookup and a few array
+    writes. Keys are spread over shards by hash and kept in hit order, so a
+    full shard takes the slot of its least recently hit key in O(1) - an idle
+    key whose window has passed if there is one, otherwise the stalest active
+    key (counted as an eviction). Memory stays bounded under a flood of
+    distinct IPs or usernames.
+    """
+    def __init__(self, limit, window=60, buckets=12, shards=16, max_keys=100000):
+        self.limit = limit
+        self.window = window
+        self.buckets = buckets
+        self.bucket_seconds = window / buckets
+        self.shards = [_Shard() for _ in range(shards)]
+        self.shard_capacity = max(1, max_keys // shards)
+        self._zeros = array.array("I", [0] * buckets)
+        self.evictions = 0
+
+    def _shard(self, key):
+        return self.shards[hash(key) % len(self.shards)]
+
+    def _alloc(self, shard, key, bucket):
+        if len(shard.index) >= self.shard_capacity:
+            self._recycle(shard, bucket)
+        if shard.free:
+            slot = shard.free.pop()
+            base = slot * self.buckets
+            shard.counts[base:base + self.buckets] = self._zeros
+            shard.last[slot] = bucket
+        else:
+            slot = len(shard.last)
+            shard.last.append(bucket)
+            shard.counts.extend(self._zeros)
+        shard.index[key] = slot
+        return slot
+
+    def _recycle(self, shard, bucket):
+        # The least recently hit key: if it is still inside its window, so is every other key
+        _, slot = shard.index.popitem(last=False)
+        if bucket - shard.last[slot] < self.buckets:
+            self.evictions += 1
+        shard.free.append(slot)
+
+    def _advance(self, shard, slot, bucket):
+        # Zero the sub-buckets skipped since the key's last hit
+        last = shard.last[slot]
+        if bucket != last:
+            base = slot * self.buckets
+            for b in range(max(last + 1, bucket - self.buckets + 1), bucket + 1):
+                shard.counts[base + b % self.buckets] = 0
+            shard.last[slot] = bucket
+
+    def hit(self, key, now=None, amount=1):
+        """
+        Counts `amount` hits for key.
+        Returns: hits within the window, including these
+        """
+        bucket = int((now or time.time()) // self.bucket_seconds)
+        shard = self._shard(key)
+        slot = shard.index.get(key)
+        if slot is None:
+            slot = self._alloc(shard, key, bucket)
+        else:
+            shard.index.move_to_end(key)
+            self._advance(shard, slot, bucket)
+        base = slot * self.buckets
+        shard.counts[base + bucket % self.buckets] += amount
+        return sum(shard.counts[base:base + self.buckets])
+
+    def count(self, key, now=None):
+        bucket = int((now or time.time()) // self.bucket_seconds)
+        shard = self._shard(key)
+        slot = shard.index.get(key)
+        if slot is None or bucket - shard.last[slot] >= self.buckets:
+            return 0
+        self._advance(shard, slot, bucket)
+        base = slot * self.buckets
+        return sum(shard.counts[base:base + self.buckets])
+
+    def retry_after(self, key, now=None):
+        """
+        Returns: seconds until enough old sub-buckets expire for the next
+                 attempt of key to be admitted (0 if it would be now)
+        """
+        now = now or time.time()
+        bucket = int(now // self.bucket_seconds)
+        shard = self._shard(key)
+        slot = shard.index.get(key)
+        if slot is None:
+            return 0
+        self._advance(shard, slot, bucket)
+        base = slot * self.buckets
+        excess = sum(shard.counts[base:base + self.buckets]) + 1 - self.limit
+        if excess <= 0:
+            return 0
+        # Sub-bucket b leaves the window when bucket b + buckets begins
+        for b in range(bucket - self.buckets + 1, bucket + 1):
+            excess -= shard.counts[base + b % self.buckets]
+            if excess <= 0:
+                return max(1, int((b + self.buckets) * self.bucket_seconds - now + 0.999))
+        return self.window
+
+    def __len__(self):
+        return sum(len(shard.index) for shard in self.shards)
+
+class AdmissionVerdict:
+    __slots__ = ("allowed", "scope", "retry_after", "pressure", "pressures")
+
+    def __init__(self, allowed=True, scope=None, retry_after=0, pressure=0.0, pressures=None):
+        self.allowed = allowed
+        self.scope = scope # "ip" / "user" that tripped the limit
+        self.retry_after = retry_after
+        self.pressure = pressure # highest count / limit across scopes
+        self.pressures = pressures or {} # scope -> count / limit
+
+    @property
+    def user_pressure(self):
+        # The risk signal: unlike an IP, a username is not shared behind a NAT
+        return self.pressures.get("user", 0.0)
+
+class AdmissionController:
+    """
+    Cheap gate in front of /login, /refresh and socket re-authentication, run before any JWT, store or
+    risk work. Per-IP and per-username sliding windows are checked locally
+    first; an over-limit key is rejected without any I/O. With a shared store
+    the admitted request's hits are also added to the cluster-wide window in
+    one script call, and a key the cluster rejects is remembered locally
+    for one sub-bucket so repeat attempts stay local too.
+    """
+    def __init__(self, store=None, limits=None, window=60, buckets=12, max_keys=100000):
+        self.redis = store or redis_client
+        self.shared = not isinstance(self.redis, InMemoryRedisClient)
+        self._script = self.redis.register_script(WINDOW_SCRIPT) if self.shared else None
+        self.window = window
+        self.buckets = buckets
+        # (endpoint, scope) -> limiter; a limit of 0 disables that scope
+        self.limiters = {
+            rule: SlidingWindowLimiter(limit, window, buckets, max_keys=max_keys)
+            for rule, limit in (limits or {}).items() if limit
+        }
+        self._blocked = {} # (endpoint, scope, key) -> blocked until (cluster verdicts)
+        self.stats = {"admitted": 0, "rejected": 0, "rejected_local": 0, "store_checks": 0}
+
+    def store_key(self, endpoint, scope, key):
+        return f"ratelimit:{endpoint}:{scope}:{key}"
+
+    def _reject(self, endpoint, scope, key, retry_after, pressures, first):
+        self.stats["rejected"] += 1
+        if first:
+            # Audit once per key crossing the limit, not once per flood request
+            logger.warning(f"🚦 [Admission] {endpoint} rate limit hit for {scope} {key}")
+            audit_log.emit("rate_limited", key if scope == "user" else None,
+                           endpoint=endpoint, scope=scope, key=key, retry_after=retry_after)
+        return AdmissionVerdict(False, scope, retry_after, max(pressures.values()), pressures)
+
+    async def admit(self, endpoint, ip=None, username=None):
+        """
+        Counts one attempt and decides whether it may proceed.
+        Returns: AdmissionVerdict
+        """
+        now = time.time()
+        checks = []
+        for scope, key in (("ip", ip), ("user", username)):
+            limiter = self.limiters.get((endpoint, scope))
+            if limiter is not None and key:
+                checks.append((scope, key, limiter))
+        if not checks:
+            self.stats["admitted"] += 1
+            return AdmissionVerdict()
+
+        pressures = {}
+        for scope, key, limiter in checks:
+            count = limiter.hit(key, now)
+            pressures[scope] = count / limiter.limit
+            if count > limiter.limit:
+                self.stats["rejected_local"] += 1
+                return self._reject(endpoint, scope, key, limiter.retry_after(key, now), pressures,
+                                    first=count == limiter.limit + 1)
+            blocked_until = self._blocked.get((endpoint, scope, key))
+            if blocked_until is not None:
+                if blocked_until > now:
+                    self.stats["rejected_local"] += 1
+                    return self._reject(endpoint, scope, key, int(blocked_until - now + 0.999), pressures, first=False)
+                del self._blocked[(endpoint, scope, key)]
+
+        if self._script is not None:
+            self.stats["store_checks"] += 1
+            bucket_seconds = self.window / self.buckets
+            totals = await self._script(
+                keys=[self.store_key(endpoint, scope, key) for scope, key, _ in checks],
+                args=[int(now // bucket_seconds), self.buckets, self.window + int(bucket_seconds) + 1]
+                     + [1] * len(checks),
+            )
+            for (scope, key, limiter), total in zip(checks, totals):
+                pressures[scope] = max(pressures[scope], int(total) / limiter.limit)
+                if int(total) > limiter.limit:
+                    if len(self._blocked) > 10000:
+                        self._blocked = {k: v for k, v in self._blocked.items() if v > now}
+                    self._blocked[(endpoint, scope, key)] = now + bucket_seconds
+                    return self._reject(endpoint, scope, key, int(bucket_seconds + 0.999), pressures, first=True)
+
+        self.stats["admitted"] += 1
+        pressures = {scope: min(value, 1.0) for scope, value in pressures.items()}
+        return AdmissionVerdict(pressure=max(pressures.values()), pressures=pressures)
+
+    def get_metrics(self):
+        return {
+            **self.stats,
+            "shared": self.shared,
+            "tracked_keys": {f"{endpoint}:{scope}": len(limiter) for (endpoint, scope), limiter in self.limiters.items()},
+            "evictions": sum(limiter.evictions for limiter in self.limiters.values()),
+            "blocked": len(self._blocked),
+        }
+
+# Singleton
+admission_control = AdmissionController(
+    limits={
+        ("login", "ip"): settings.LOGIN_RATE_LIMIT_IP,
+        ("login", "user"): settings.LOGIN_RATE_LIMIT_USER,
+        ("refresh", "ip"): settings.REFRESH_RATE_LIMIT_IP,
+        ("reauth", "ip"): settings.LOGIN_RATE_LIMIT_IP,
+        ("reauth", "user"): settings.LOGIN_RATE_LIMIT_USER,
+    },
+    window=settings.RATE_LIMIT_WINDOW,
+    buckets=settings.RATE_LIMIT_BUCKETS,
+    max_keys=settings.RATE_LIMIT_MAX_KEYS,
+)
@@ -0,0 +1,319 @@
+import asyncio
+import json
+import os
+import secrets
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import bcrypt
+from app.core.config import settings
+from app.core.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Tells every worker to forget a remembered unknown username once it is created
+CREDENTIAL_CACHE_CHANNEL = "credential-cache"
+
+# bcrypt only looks at the first 72 bytes; longer secrets are refused instead
+# of being silently truncated
+MAX_PASSWORD_BYTES = 72
+
+# Module-level so a process pool can pickle them. pyca/bcrypt releases the GIL
+# while hashing, so on a thread pool they also run on every core.
+def _check(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+def _encode(password):
+    data = (password or "").encode("utf-8")
+    return data if 0 < len(data) <= MAX_PASSWORD_BYTES else None
+
+def hash_cost(hashed):
+    # "$2b$12$..." -> 12
+    try:
+        return int(hashed.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+class PasswordHasher:
+    """
+    bcrypt off the event loop. A verify is tens of milliseconds of pure CPU,
+    so hashes run on a bounded thread (or process) pool sized to the cores.
+    At most max_pending hashes may be queued or running; beyond that callers
+    are refused straight away instead of piling up behind the pool.
+    """
+    def __init__(self, rounds=12, workers=0, max_pending=64, kind="thread"):
+        self.rounds = rounds
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.kind = kind
+        self._executor = None
+        self._pending = 0
+        self.stats = {"hashed": 0, "verified": 0, "rejected_busy": 0, "hash_ms_total": 0.0, "hash_ms_max": 0.0}
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+            logger.info(f"✅ [Credentials] bcrypt pool: {self.workers} {self.kind} workers (cost {self.rounds}, max pending {self.max_pending})")
+        return self._executor
+
+    def stop(self):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, fn, *args):
+        """
+        Returns: fn's result, or None if the pool is saturated
+        """
+        if self._pending >= self.max_pending:
+            self.stats["rejected_busy"] += 1
+            return None
+        self._pending += 1
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self._pending -= 1
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.stats["hash_ms_total"] += elapsed_ms
+            self.stats["hash_ms_max"] = max(self.stats["hash_ms_max"], elapsed_ms)
+
+    async def hash(self, password):
+        """
+        Returns: bcrypt hash (str), or None if the pool is saturated
+        """
+        data = _encode(password)
+        if data is None:
+            raise ValueError(f"Password must be 1-{MAX_PASSWORD_BYTES} bytes")
+        hashed = await self._run(_hash, data, self.rounds)
+        if hashed is None:
+            return None
+        self.stats["hashed"] += 1
+        return hashed.decode("ascii")
+
+    async def verify(self, password, hashed):
+        """
+        Returns: True / False, or None if the pool is saturated
+        """
+        data = _encode(password)
+        if data is None or not hashed:
+            return False
+        ok = await self._run(_check, data, hashed.encode("ascii"))
+        if ok is not None:
+            self.stats["verified"] += 1
+        return ok
+
+    def needs_rehash(self, hashed):
+        return hash_cost(hashed) != self.rounds
+
+    def get_metrics(self):
+        return {
+            **self.stats,
+            "pending": self._pending,
+            "workers": self.workers,
+            "kind": self.kind,
+            "rounds": self.rounds,
+        }
+
+class CredentialStore:
+    """
+    Login accounts in the store, without TTL: credential:<username> ->
+    {user_id, password_hash}, plus user:<user_id>:login naming the account
+    re-authentication checks.
+    - Unknown usernames are checked against a dummy hash of the current cost,
+      so a miss takes as long as a wrong password and timing does not reveal
+      which accounts exist. They are remembered for negative_ttl seconds, so
+      repeated guesses skip the store read (but not the hash). create_user()
+      drops the entry on every worker over pub/sub; while the subscription is
+      down, or after a gap in it, remembered misses are not trusted.
+    - Hashes are upgraded in place after a successful login when BCRYPT_ROUNDS changes.
+    - The demo accounts are seeded on first use if missing.
+    """
+    def __init__(self, hasher, negative_ttl=60, max_negative=10000, demo_users=(), demo_user_id=None, demo_password=None):
+        self.redis = redis_client
+        self.hasher = hasher
+        self.negative_ttl = negative_ttl
+        self.max_negative = max_negative
+        self.demo_users = tuple(demo_users)
+        self.demo_user_id = demo_user_id
+        self.demo_password = demo_password
+        self._unknown = {} # username -> negative entry expiry
+        self._unknown_generation = None # store.pubsub_generation the entries were made under
+        self._dummy_hash = None # verified against on unknown usernames
+        self._seeded = False
+        self._seed_lock = None
+        self.stats = {"logins": 0, "failed": 0, "unknown": 0, "negative_hits": 0, "busy": 0, "rehashed": 0}
+        self.redis.subscribe(CREDENTIAL_CACHE_CHANNEL, self._on_message)
+
+    def credential_key(self, username):
+        return f"credential:{username}"
+
+    def login_key(self, user_id):
+        return f"user:{user_id}:login"
+
+    async def seed(self):
+        if self._seeded:
+            return
+        if self._seed_lock is None:
+            self._seed_lock = asyncio.Lock()
+        async with self._seed_lock:
+            if self._seeded:
+                return
+            for username in self.demo_users:
+                if not await self.redis.exists(self.credential_key(username)):
+                    await self.create_user(username, self.demo_password, self.demo_user_id)
+                    logger.info(f"🔑 [Credentials] Seeded demo account '{username}'")
+            self._seeded = True
+
+    async def create_user(self, username, password, user_id):
+        """
+        Adds or replaces an account.
+        Returns: False if the hash pool is saturated
+        """
+        hashed = await self.hasher.hash(password)
+        if hashed is None:
+            return False
+        first_login = not await self.redis.exists(self.login_key(user_id))
+        async with self.redis.pipeline(transaction=True) as pipe:
+            self._write(pipe, username, {"user_id": user_id, "password_hash": hashed})
+            if first_login:
+                pipe.set(self.login_key(user_id), username)
+                pipe.persist(self.login_key(user_id))
+            await pipe.execute()
+        self._unknown.pop(username, None)
+        await self.redis.publish(CREDENTIAL_CACHE_CHANNEL, json.dumps({"created": username}))
+        return True
+
+    def _on_message(self, message):
+        username = json.loads(message).get("created")
+        if username is not None:
+            self._unknown.pop(username, None)
+
+    def _negative_cache_usable(self):
+        # Creations on other workers arrive over pub/sub: entries made before
+        # a gap in the subscription may be stale, so they are dropped
+        if not self.redis.pubsub_live:
+            return False
+        if self._unknown_generation != self.redis.pubsub_generation:
+            self._unknown.clear()
+            self._unknown_generation = self.redis.pubsub_generation
+        return True
+
+    def _write(self, pipe, username, mapping):
+        # Accounts do not expire: drop the TTL hset puts on every store key
+        key = self.credential_key(username)
+        pipe.hset(key, mapping)
+        pipe.persist(key)
+
+    def _is_known_unknown(self, username, now):
+        expires = self._unknown.get(username)
+        if expires is None:
+            return False
+        if expires > now:
+            return True
+        del self._unknown[username]
+        return False
+
+    def _remember_unknown(self, username, now):
+        if len(self._unknown) >= self.max_negative:
+            self._unknown = {name: expires for name, expires in self._unknown.items() if expires > now}
+            if len(self._unknown) >= self.max_negative:
+                # Still full: drop the oldest entry (dicts keep insertion order)
+                del self._unknown[next(iter(self._unknown))]
+        self._unknown[username] = now + self.negative_ttl
+
+    async def authenticate(self, username, password):
+        """
+        Checks a username/password pair; bcrypt runs on the hash pool.
+        Returns: (user_id or None, status) with status "ok", "invalid" or "busy"
+        """
+        if not self._seeded:
+            await self.seed()
+        now = time.time()
+        cacheable = self._negative_cache_usable()
+        if cacheable and self._is_known_unknown(username, now):
+            self.stats["negative_hits"] += 1
+            return await self._reject_unknown(password)
+
+        account = await self.redis.hgetall(self.credential_key(username))
+        if not account:
+            if cacheable:
+                self._remember_unknown(username, now)
+            self.stats["unknown"] += 1
+            return await self._reject_unknown(password)
+        return await self._check(username, account, password)
+
+    async def _reject_unknown(self, password):
+        # Same bcrypt work as a wrong password, so the response time does not
+        # tell an attacker whether the username exists
+        if self._dummy_hash is None or self.hasher.needs_rehash(self._dummy_hash):
+            self._dummy_hash = await self.hasher.hash(secrets.token_urlsafe(16))
+        ok = None
+        if self._dummy_hash is not None:
+            ok = await self.hasher.verify(password, self._dummy_hash)
+        if ok is None:
+            self.stats["busy"] += 1
+            return None, "busy"
+        self.stats["failed"] += 1
+        return None, "invalid"
+
+    async def verify_user(self, user_id, password):
+        """
+        Re-authentication of an already signed-in user.
+        Returns: (user_id or None, status) like authenticate()
+        """
+        if not self._seeded:
+            await self.seed()
+        username = await self.redis.get(self.login_key(user_id))
+        account = await self.redis.hgetall(self.credential_key(username)) if username else None
+        if not account:
+            self.stats["failed"] += 1
+            return None, "invalid"
+        return await self._check(username, account, password)
+
+    async def _check(self, username, account, password):
+        hashed = account.get("password_hash")
+        ok = await self.hasher.verify(password, hashed)
+        if ok is None:
+            self.stats["busy"] += 1
+            return None, "busy"
+        if not ok:
+            self.stats["failed"] += 1
+            return None, "invalid"
+
+        self.stats["logins"] += 1
+        if self.hasher.needs_rehash(hashed):
+            # Cost changed since this hash was made: store one at the current cost
+            new_hash = await self.hasher.hash(password)
+            if new_hash is not None:
+                async with self.redis.pipeline(transaction=True) as pipe:
+                    self._write(pipe, username, {"password_hash": new_hash})
+                    await pipe.execute()
+                self.stats["rehashed"] += 1
+        return account.get("user_id"), "ok"
+
+    def stop(self):
+        self.hasher.stop()
+
+    def get_metrics(self):
+        return {**self.stats, "negative_cached": len(self._unknown), "hasher": self.hasher.get_metrics()}
+
+# Singleton
+credential_store = CredentialStore(
+    PasswordHasher(
+        rounds=settings.BCRYPT_ROUNDS,
+        workers=settings.PASSWORD_HASH_WORKERS,
+        max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+        kind=settings.PASSWORD_HASH_POOL,
+    ),
+    negative_ttl=settings.CREDENTIAL_NEGATIVE_TTL,
+    demo_users=[name.strip() for name in settings.DEMO_USERS.split(",") if name.strip()],
+    demo_user_id=settings.DEMO_USER_ID,
+    demo_password=settings.DEMO_PASSWORD,
+)
@@ -0,0 +1,53 @@
+from fastapi import Depends, HTTPException, Request
+from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from jose import JWTError
+from app.auth.jwt import decode_token
+from app.auth.revocation import revocation_index
+from app.auth.admission import admission_control
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+
+async def require_active_token(token: str = Depends(oauth2_scheme)):
+    """
+    Dependency for protected routes: verified (cached) + not revoked.
+    The revocation check is answered in-process unless the filter reports a hit.
+    Returns: token claims
+    """
+    try:
+        claims = decode_token(token)
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    jti = claims.get("jti")
+    if not jti or await revocation_index.is_token_revoked(claims):
+        raise HTTPException(status_code=401, detail="Token revoked")
+    return claims
+
+def _client_ip(request):
+    return request.client.host if request.client else None
+
+def _too_many(verdict, detail):
+    return HTTPException(status_code=429, detail=detail,
+                         headers={"Retry-After": str(verdict.retry_after)})
+
+async def login_admission(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
+    """
+    Dependency for /login: per-IP and per-username sliding-window limits,
+    checked before any password, token or risk work.
+    Returns: AdmissionVerdict (its pressure feeds the risk rules)
+    """
+    username = form_data.username.strip().lower()[:128]
+    verdict = await admission_control.admit("login", ip=_client_ip(request), username=username)
+    if not verdict.allowed:
+        raise _too_many(verdict, "Too many login attempts")
+    return verdict
+
+async def refresh_admission(request: Request):
+    """
+    Dependency for /refresh: per-IP sliding-window limit.
+    Returns: AdmissionVerdict
+    """
+    verdict = await admission_control.admit("refresh", ip=_client_ip(request))
+    if not verdict.allowed:
+        raise _too_many(verdict, "Too many refresh attempts")
+    return verdict
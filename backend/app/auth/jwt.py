@@ -1,31 +1,118 @@
 from datetime import datetime, timedelta
 from typing import Optional
+from collections import OrderedDict
+from calendar import timegm
 from jose import jwt
 from app.core.config import settings
+from app.auth.keys import key_ring
+from app.core.metrics import metrics
+import hashlib
+import time
 import uuid
 
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+class VerifiedTokenCache:
+    """
+    Bounded LRU of tokens that already passed signature + claims verification.
+    Keyed by a digest of the token; entries are dropped at the token's `exp`.
+    Revocation is NOT covered here - callers still check blacklists.
+    """
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._entries = OrderedDict() # digest -> claims
+        self.hits = 0
+        self.misses = 0
+
+    def _digest(self, token):
+        return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+    def get(self, token):
+        digest = self._digest(token)
+        claims = self._entries.get(digest)
+        if claims is None:
+            self.misses += 1
+            return None
+        if claims.get("exp", 0) <= time.time():
+            del self._entries[digest]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(digest)
+        self.hits += 1
+        return claims
+
+    def put(self, token, claims):
+        digest = self._digest(token)
+        self._entries[digest] = claims
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+verified_tokens = VerifiedTokenCache(max_size=settings.VERIFIED_TOKEN_CACHE_SIZE)
+
+@metrics.timed("jwt_operation_seconds", operation="sign")
+def _encode(claims: dict):
+    # RS256/ES256: kid-tagged key from the key ring; HS256: shared SECRET_KEY
+    if key_ring.enabled:
+        return key_ring.sign(claims)
+    return jwt.encode(claims, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+
+@metrics.timed("jwt_operation_seconds", operation="verify")
+def _verify(token: str):
+    if key_ring.enabled:
+        return key_ring.verify(token)
+    return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+
+def _issue(data: dict, expire: datetime):
     to_encode = data.copy()
+
+    # Add JTI if not present
+    if "jti" not in to_encode:
+        to_encode["jti"] = str(uuid.uuid4())
+
+    # iat is checked against the user's revocation epoch (global logout); it is
+    # sub-second so a login right after a global logout is not caught by it
+    to_encode.update({"exp": timegm(expire.utctimetuple()), "iat": round(time.time(), 6)})
+    encoded_jwt = _encode(to_encode)
+    # We just signed it, so it needs no verification on its next use
+    verified_tokens.put(encoded_jwt, to_encode)
+    return encoded_jwt, dict(to_encode)
+
+def issue_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    """
+    Returns: (encoded token, claims incl. jti, iat and exp)
+    """
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    
-    # Add JTI if not present
-    if "jti" not in to_encode:
-        to_encode["jti"] = str(uuid.uuid4())
-        
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
-    return encoded_jwt
+    return _issue(data, expire)
 
-def create_refresh_token(data: dict):
-    to_encode = data.copy()
+def issue_refresh_token(data: dict):
+    """
+    Returns: (encoded token, claims incl. jti, iat and exp)
+    """
     expire = datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
-    
-    if "jti" not in to_encode:
-        to_encode["jti"] = str(uuid.uuid4())
-        
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
-    return encoded_jwt
+    return _issue(data, expire)
+
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    return issue_access_token(data, expires_delta)[0]
+
+def create_refresh_token(data: dict):
+    return issue_refresh_token(data)[0]
+
+def decode_token(token: str):
+    """
+    Verifies a token (signature + exp), skipping the work for recently verified ones.
+    Raises: jose.JWTError on invalid/expired tokens
+    Returns: claims dict (a copy; safe to mutate)
+    """
+    claims = verified_tokens.get(token)
+    if claims is None:
+        claims = _verify(token)
+        verified_tokens.put(token, claims)
+    return dict(claims)
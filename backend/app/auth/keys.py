@@ -0,0 +1,276 @@
+import argparse
+import logging
+import os
+import time
+import uuid
+import httpx
+from jose import jwt, jwk, JWTError
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa, ec
+from app.core.config import settings
+
+try:
+    import fcntl
+except ImportError: # Windows: no flock, and no multi-worker deployments either
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+ASYMMETRIC_ALGORITHMS = ("RS256", "ES256")
+
+def generate_private_pem(algorithm):
+    if algorithm == "RS256":
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    elif algorithm == "ES256":
+        private_key = ec.generate_private_key(ec.SECP256R1())
+    else:
+        raise ValueError(f"Unsupported signing algorithm: {algorithm}")
+    return private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+
+class SigningKey:
+    __slots__ = ("kid", "algorithm", "private_key", "public_key", "public_jwk", "created_at")
+
+    def __init__(self, kid, algorithm, private_pem, created_at=None):
+        self.kid = kid
+        self.algorithm = algorithm
+        # Parsed once; jose accepts Key objects directly, so PEMs are never re-parsed per token
+        self.private_key = jwk.construct(private_pem, algorithm)
+        self.public_key = self.private_key.public_key()
+        self.public_jwk = {**self.public_key.to_dict(), "kid": kid, "use": "sig"}
+        self.created_at = created_at or time.time()
+
+class KeyRing:
+    """
+    kid-tagged asymmetric signing keys.
+    - The newest key signs; a key replaced by a newer one stays published (and
+      verifiable) for `retire_after` seconds counted from that replacement, so
+      tokens it signed up to the rotation keep working until they expire.
+    - The signing key is rotated once it is `rotate_after` seconds old (checked
+      on sign, 0 = never), or on demand: python -m app.auth.keys rotate
+    - With JWT_KEYS_DIR set, keys are `<kid>.pem` files shared by every worker;
+      a worker that meets an unknown kid rescans the directory whenever it has
+      changed, and retired key files are deleted.
+      Without it, an ephemeral key is generated (single worker only).
+    """
+    def __init__(self, algorithm, keys_dir="", retire_after=None, rotate_after=0):
+        self.algorithm = algorithm
+        self.keys_dir = keys_dir
+        self.retire_after = retire_after or settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400
+        self.rotate_after = rotate_after
+        self.keys = {} # kid -> SigningKey
+        self.active = None
+        self._dir_version = None # keys_dir mtime at the last scan
+        self._scanned_at = 0.0
+        self._checked_at = 0.0
+        self.check_interval = 30.0 # seconds between keys_dir checks on the sign path
+
+    @property
+    def enabled(self):
+        return self.algorithm in ASYMMETRIC_ALGORITHMS
+
+    def ensure_loaded(self):
+        if self.active is None:
+            self._rotate_unless(lambda: self.active is not None)
+
+    def rotate_if_due(self, now=None):
+        """
+        Rotates when the signing key is older than rotate_after.
+        Returns: True if this call rotated
+        """
+        if not self.rotate_after or self.active is None:
+            return False
+        now = now or time.time()
+        if now - self.active.created_at < self.rotate_after:
+            return False
+        return self._rotate_unless(lambda: now - self.active.created_at < self.rotate_after)
+
+    def _rotate_unless(self, satisfied):
+        # Workers must agree on one new key: the check (after a rescan) and the
+        # creation happen under an exclusive lock on the keys directory
+        if not self.keys_dir:
+            if not satisfied():
+                self.rotate()
+                return True
+            return False
+        os.makedirs(self.keys_dir, exist_ok=True)
+        with open(os.path.join(self.keys_dir, ".lock"), "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self.reload(force=True)
+                if self.active is not None and satisfied():
+                    return False
+                self.rotate()
+                return True
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def reload(self, force=False):
+        """
+        Picks up keys from JWT_KEYS_DIR. Unless forced, the directory is only
+        rescanned when its mtime shows a key was added or removed.
+        """
+        if not self.keys_dir:
+            return
+        try:
+            version = os.stat(self.keys_dir).st_mtime_ns
+        except FileNotFoundError:
+            return
+        now = time.time()
+        # An mtime within a second of the last scan may hide a later change in the same tick
+        settled = self._scanned_at - version / 1e9 > 1.0
+        if not force and version == self._dir_version and settled:
+            return
+        self._dir_version = version
+        self._scanned_at = now
+        for name in os.listdir(self.keys_dir):
+            if not name.endswith(".pem"):
+                continue
+            kid = name[:-4]
+            if kid in self.keys:
+                continue
+            path = os.path.join(self.keys_dir, name)
+            try:
+                with open(path) as f:
+                    self.keys[kid] = SigningKey(kid, self.algorithm, f.read(), os.path.getmtime(path))
+            except FileNotFoundError:
+                continue # pruned by another worker meanwhile
+        self._prune(now)
+        self._select_active()
+
+    def rotate(self):
+        """
+        Creates a new signing key and makes it active. Previous keys keep verifying.
+        Returns: the new kid
+        """
+        kid = uuid.uuid4().hex[:16]
+        private_pem = generate_private_pem(self.algorithm)
+        if self.keys_dir:
+            os.makedirs(self.keys_dir, exist_ok=True)
+            # Written aside and renamed, so other workers never read half a key
+            path = os.path.join(self.keys_dir, f"{kid}.pem")
+            fd = os.open(f"{path}.tmp", os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "w") as f:
+                f.write(private_pem)
+            os.replace(f"{path}.tmp", path)
+        self.keys[kid] = SigningKey(kid, self.algorithm, private_pem)
+        self._prune(time.time())
+        self._select_active()
+        logger.info(f"🔑 [Keys] Rotated signing key. Active kid: {self.active.kid}")
+        return kid
+
+    def _prune(self, now):
+        # A key retires when its successor is created; it is dropped retire_after later
+        ordered = sorted(self.keys.values(), key=lambda k: k.created_at)
+        for key, successor in zip(ordered, ordered[1:]):
+            if now - successor.created_at > self.retire_after:
+                kid = key.kid
+                del self.keys[kid]
+                if self.keys_dir:
+                    try:
+                        os.remove(os.path.join(self.keys_dir, f"{kid}.pem"))
+                        logger.info(f"🗑️ [Keys] Deleted retired signing key {kid}")
+                    except FileNotFoundError:
+                        pass # another worker got there first
+
+    def _select_active(self):
+        self.active = max(self.keys.values(), key=lambda k: k.created_at, default=None)
+
+    def sign(self, claims):
+        self.ensure_loaded()
+        now = time.time()
+        if now - self._checked_at >= self.check_interval:
+            # Picks up keys rotated by another worker or the CLI, then rotates if due
+            self._checked_at = now
+            self.reload()
+            self.rotate_if_due(now)
+        key = self.active
+        return jwt.encode(claims, key.private_key, algorithm=key.algorithm, headers={"kid": key.kid})
+
+    def verify(self, token):
+        """
+        Raises: JWTError (bad signature, unknown kid, expired)
+        Returns: claims dict
+        """
+        self.ensure_loaded()
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = self.keys.get(kid)
+        if key is None:
+            self.reload()
+            key = self.keys.get(kid)
+            if key is None:
+                raise JWTError(f"Unknown signing key: {kid}")
+        return jwt.decode(token, key.public_key, algorithms=[key.algorithm])
+
+    def jwks(self):
+        self.ensure_loaded()
+        return {"keys": [key.public_jwk for key in self.keys.values()]}
+
+class JWKSVerifier:
+    """
+    Local token verification for relying apps (HR, CRM, ERP).
+    Public keys are cached by kid; the JWKS document is only re-fetched when a
+    token carries a kid we have not seen (at most once per min_refresh_interval).
+    """
+    def __init__(self, jwks_url, algorithms=ASYMMETRIC_ALGORITHMS, min_refresh_interval=30.0):
+        self.jwks_url = jwks_url
+        self.algorithms = list(algorithms)
+        self.min_refresh_interval = min_refresh_interval
+        self.keys = {} # kid -> jose Key
+        self._last_refresh = 0.0
+
+    async def refresh(self):
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            response = await client.get(self.jwks_url)
+            response.raise_for_status()
+        self.load_jwks(response.json())
+        self._last_refresh = time.time()
+
+    def load_jwks(self, document):
+        self.keys = {
+            entry["kid"]: jwk.construct(entry, entry.get("alg"))
+            for entry in document.get("keys", ())
+            if entry.get("alg") in self.algorithms
+        }
+
+    async def verify(self, token):
+        """
+        Raises: JWTError
+        Returns: claims dict
+        """
+        header = jwt.get_unverified_header(token)
+        kid = header.get("kid")
+        key = self.keys.get(kid)
+        if key is None and time.time() - self._last_refresh >= self.min_refresh_interval:
+            await self.refresh()
+            key = self.keys.get(kid)
+        if key is None:
+            raise JWTError(f"Unknown signing key: {kid}")
+        if header.get("alg") not in self.algorithms:
+            raise JWTError(f"Unexpected algorithm: {header.get('alg')}")
+        return jwt.decode(token, key, algorithms=[header["alg"]])
+
+# Singleton
+key_ring = KeyRing(settings.ALGORITHM, keys_dir=settings.JWT_KEYS_DIR,
+                   rotate_after=settings.JWT_KEY_ROTATE_DAYS * 86400)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Signing keys in JWT_KEYS_DIR")
+    parser.add_argument("command", choices=["rotate", "list"])
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if not key_ring.enabled or not key_ring.keys_dir:
+        parser.error("needs ALGORITHM=RS256/ES256 and a shared JWT_KEYS_DIR")
+    if args.command == "rotate":
+        # Under the directory lock; running workers pick the key up on their next unknown kid
+        key_ring._rotate_unless(lambda: False)
+    else:
+        key_ring.reload(force=True)
+    for key in sorted(key_ring.keys.values(), key=lambda k: k.created_at):
+        print(f"{key.kid} {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(key.created_at))}"
+              f"{' active' if key is key_ring.active else ''}")
@@ -1,12 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Header, Request
+from fastapi import APIRouter, Depends, HTTPException, Header, Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from app.auth.jwt import create_access_token, create_refresh_token
+from app.auth.jwt import issue_access_token, issue_refresh_token, decode_token
 from app.core.database import get_redis
+from app.core.geoip import geo_resolver
 from app.auth.websockets import sio_server
+from app.auth.revocation import revocation_index
+from app.auth.rotation import refresh_rotator
+from app.auth.credentials import credential_store
+from app.core.audit import audit_log
+from app.core.metrics import TimedRoute
+from app.auth.dependencies import require_active_token, login_admission, refresh_admission
 from pydantic import BaseModel
 import json
+import logging
 
-router = APIRouter()
+logger = logging.getLogger(__name__)
+
+router = APIRouter(route_class=TimedRoute)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 class LoginRequest(BaseModel):
@@ -17,7 +27,8 @@ class LoginRequest(BaseModel):
 async def login(
     request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(), 
-    redis=Depends(get_redis)
+    redis=Depends(get_redis),
+    admission=Depends(login_admission)
 ):
     # Determine Client IP
     # In a real app behind a proxy, use X-Forwarded-For
@@ -33,31 +44,32 @@ async def login(
     else:
         # Default fallback
         client_ip = request.client.host
-    # Mock user verification
-    valid_usernames = ["admin", "attacker", "user"]
-    if form_data.username not in valid_usernames or form_data.password != "password":
+    # Verify credentials (bcrypt runs on the hash pool, not the event loop)
+    user_id, outcome = await credential_store.authenticate(form_data.username, form_data.password)
+    if outcome == "busy":
+        raise HTTPException(status_code=503, detail="Login service busy, try again", headers={"Retry-After": "1"})
+    if user_id is None:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
     
-    user_id = "user_123" # Mock User ID
-    
-    # Create tokens
-    access_token = create_access_token(data={"sub": user_id})
-    refresh_token = create_refresh_token(data={"sub": user_id})
+    # Create tokens (minting hands back the claims, no need to decode)
+    # Both share the JTI, which also names the refresh family started here
+    import uuid
+    session_jti = str(uuid.uuid4())
+    access_token, access_claims = issue_access_token(data={"sub": user_id, "jti": session_jti, "fam": session_jti})
+    refresh_token, _ = issue_refresh_token(data={"sub": user_id, "jti": session_jti, "fam": session_jti})
     
     # Is this a new device? (Simulated for now)
     # Store session in Redis
-    # decode to get JTI
-    from jose import jwt
     from app.core.config import settings
     
-    decoded_at = jwt.decode(access_token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-    jti = decoded_at['jti']
-    
-    # Store JTI in user's session list
-    await redis.sadd(f"user:{user_id}:sessions", jti)
+    jti = access_claims['jti']
     
-    # Store Refresh Token
-    await redis.setex(f"refresh_token:{jti}", settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400, refresh_token)
+    # Store JTI in user's session list + Refresh Token (single round trip)
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.sadd(f"user:{user_id}:sessions", jti)
+        pipe.setex(f"refresh_token:{jti}", settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400, refresh_token)
+        refresh_rotator.start_family(pipe, jti, jti)
+        await pipe.execute()
 
     # --- AGENTIC LAYER HOOK ---
     # Integration with new Agentic System
@@ -66,29 +78,36 @@ async def login(
     
     # Create Meta for Risk Agent
     
-    # 🕵️‍♂️ MOCK GEO-LOCATION
-    detected_country = "India"
-    if form_data.username == "attacker":
-        detected_country = "Russia" # Simulate Foreign Attack
+    # Resolve country from the local GeoIP table
+    detected_country = geo_resolver.lookup(client_ip)
+    if detected_country is None:
+        # 🕵️‍♂️ MOCK GEO-LOCATION (no GeoIP table configured / IP not listed)
+        detected_country = "India"
+        if form_data.username == "attacker":
+            detected_country = "Russia" # Simulate Foreign Attack
         
     meta = {
         "ip": client_ip,
         "device": "Browser (Login)", 
         "country": detected_country, 
-        "app_name": "Login Portal" 
+        "app_name": "Login Portal",
+        "admission_pressure": admission.user_pressure # per username: NAT neighbours do not count
     }
     
     # 1. Calculate Risk
     # This uses the Sync Redis Client internally, which is fine for prototype limits
-    current_score, reasons = await risk_detector.calculate_risk(user_id, jti, meta)
+    # The login session is its family's first member: the refresh gate starts from this score
+    current_score, reasons = await risk_detector.calculate_risk(user_id, jti, meta, family=jti)
     
-    print(f"🤖 Agentic Analysis: Login Attempt from {client_ip} | Risk: {current_score}")
+    logger.info(f"🤖 Agentic Analysis: Login Attempt from {client_ip} | Risk: {current_score}")
 
     # 2. Make Decision
     action = await decision_agent.evaluate_risk(user_id, jti, current_score)
+    audit_log.emit("login_risk", user_id, session_id=jti, ip=client_ip, country=detected_country,
+                   score=current_score, reasons=reasons, action=action)
     
     if action == "FORCE_LOGOUT" or action == "LOCK_ACCOUNT":
-        print(f"❌ RISK DETECTED ({current_score}). TRIGGERING GLOBAL LOCKDOWN.")
+        logger.error(f"❌ RISK DETECTED ({current_score}). TRIGGERING GLOBAL LOCKDOWN.")
         await global_revoke(user_id, redis)
         raise HTTPException(
             status_code=403, 
@@ -107,17 +126,28 @@ async def login(
 @router.post("/revoke")
 async def revoke(token: str = Depends(oauth2_scheme), redis=Depends(get_redis)):
     # Revoke simple access token (logout current session)
-    from jose import jwt
     from app.core.config import settings
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        payload = decode_token(token)
         jti = payload.get("jti")
         user_id = payload.get("sub")
         
         if jti:
-            await redis.setex(f"blacklist:{jti}", settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60, "true")
-            await redis.srem(f"user:{user_id}:sessions", jti)
-            await redis.delete(f"refresh_token:{jti}")
+            family = payload.get("fam")
+            entries, families = [], None
+            async with redis.pipeline(transaction=True) as pipe:
+                if family:
+                    # Logout ends the refresh chain of this session; the family
+                    # covers this token and its refresh token, no per-JTI entry
+                    families = revocation_index.revoke_family(pipe, family)
+                else:
+                    # Blacklisted until its refresh token (same jti) would have expired anyway
+                    entries.append(revocation_index.revoke(pipe, jti, exp=payload.get("exp")))
+                pipe.srem(f"user:{user_id}:sessions", jti)
+                pipe.delete(f"refresh_token:{jti}")
+                await pipe.execute()
+            await revocation_index.publish(entries, families=families)
+            audit_log.emit("logout", user_id, jti=jti, family=family)
             
     except Exception:
         pass
@@ -126,66 +156,95 @@ async def revoke(token: str = Depends(oauth2_scheme), redis=Depends(get_redis)):
 
 @router.post("/global-revoke")
 async def global_revoke(user_id: str = "user_123", redis=Depends(get_redis)): # In real app, get user_id from token
-    # 1. Iterate through all active sessions
-    sessions = await redis.smembers(f"user:{user_id}:sessions")
-    
-    for jti in sessions:
-        # Blacklist JTI
-        await redis.setex(f"blacklist:{jti}", 3600, "true") # Blacklist for 1 hr
-        # Delete Refresh Token
-        await redis.delete(f"refresh_token:{jti}")
-    
-    # Clear session list
-    await redis.delete(f"user:{user_id}:sessions")
+    # 1. Revoke every token issued so far with one epoch write (no per-JTI fan-out).
+    # Stored refresh tokens are left to expire: their iat predates the epoch.
+    async with redis.pipeline(transaction=True) as pipe:
+        epochs = revocation_index.revoke_user(pipe, user_id)
+        # 2. Clear session list
+        pipe.delete(f"user:{user_id}:sessions")
+        await pipe.execute()
+    await revocation_index.publish(epochs=epochs)
+    audit_log.emit("global_revoke", user_id, revoked_before=epochs[user_id])
     
     # Emit LOGOUT_ALL signal to the user's room
     await sio_server.emit('LOGOUT_ALL', {'user_id': user_id}, room=f"user_{user_id}")
     
     return {"msg": "All sessions revoked"}
 
+async def revoke_family_on_reuse(redis, user_id, family):
+    # Security Event: a refresh token was presented after it was rotated out.
+    # Either copy may be the attacker's, so every token of the family dies.
+    logger.warning(f"🚨 [Auth] Refresh token reuse for {user_id} (family {family}). Revoking family.")
+    async with redis.pipeline(transaction=True) as pipe:
+        families = revocation_index.revoke_family(pipe, family)
+        await pipe.execute()
+    await revocation_index.publish(families=families)
+    audit_log.emit("refresh_reuse", user_id, family=family)
+
 @router.post("/refresh")
-async def refresh_token(refresh_token: str, redis=Depends(get_redis)):
-    from jose import jwt, JWTError
+async def refresh_token(refresh_token: str, redis=Depends(get_redis), admission=Depends(refresh_admission)):
+    from jose import JWTError
     from app.core.config import settings
     
     try:
-        # 1. Decode & Validate
-        payload = jwt.decode(refresh_token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        # 1. Decode & Validate (cached for recently verified tokens)
+        payload = decode_token(refresh_token)
         user_id = payload.get("sub")
         old_jti = payload.get("jti")
         
         if not user_id or not old_jti:
             raise HTTPException(status_code=401, detail="Invalid token")
             
-        # 2. Check if blacklisted/revoked
-        is_revoked = await redis.get(f"blacklist:{old_jti}")
-        if is_revoked:
-             # Security Event: Token Reuse Detected!
-             # Trigger Risk Agent? For now, just hard fail.
+        # 2. Check if blacklisted/revoked (epoch, family, then local filter; store only on a filter hit)
+        family = payload.get("fam") or old_jti
+        revoked = await revocation_index.is_token_revoked(payload)
+        if revoked == "jti" and "fam" in payload:
+             # Already rotated out: Token Reuse Detected!
+             await revoke_family_on_reuse(redis, user_id, family)
+        if revoked:
              raise HTTPException(status_code=401, detail="Token revoked")
+        
+        # 2b. Risk gate (memoized; at most one batched read per session per window)
+        from app.agents.token_lifecycle import token_lifecycle
+        allow, message = await token_lifecycle.validate_refresh(user_id, family)
+        if not allow:
+            audit_log.emit("refresh_denied", user_id, family=family, reason=message)
+            raise HTTPException(status_code=403, detail=message)
              
         # 3. Rotate Token
-        # Revoke the old one
-        await redis.setex(f"blacklist:{old_jti}", settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400, "rotated")
-        await redis.delete(f"refresh_token:{old_jti}")
-        await redis.srem(f"user:{user_id}:sessions", old_jti)
-        
-        # Issue New Tokens
+        # Issue New Tokens (same family; tokens from before families start their own)
         import uuid
         new_jti = str(uuid.uuid4())
         
-        access_token_data = {"sub": user_id, "jti": new_jti}
-        refresh_token_data = {"sub": user_id, "jti": new_jti}
+        access_token_data = {"sub": user_id, "jti": new_jti, "fam": family}
+        refresh_token_data = {"sub": user_id, "jti": new_jti, "fam": family}
         
-        from app.auth.jwt import create_access_token, create_refresh_token
-        new_access_token = create_access_token(access_token_data)
-        new_refresh_token = create_refresh_token(refresh_token_data)
+        new_access_token, _ = issue_access_token(access_token_data)
+        new_refresh_token, _ = issue_refresh_token(refresh_token_data)
         
-        # 4. Register New Session
-        await redis.sadd(f"user:{user_id}:sessions", new_jti)
-        await redis.setex(f"refresh_token:{new_jti}", settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400, new_refresh_token)
+        # 4. Compare-and-swap the family head: of concurrent refreshes with
+        # this token exactly one gets here, the others are reuse
+        rotated = await refresh_rotator.rotate(family, old_jti, new_jti, allow_missing="fam" not in payload)
+        if not rotated:
+            await revoke_family_on_reuse(redis, user_id, family)
+            raise HTTPException(status_code=401, detail="Token reuse detected")
         
-        # 5. Update Monitoring (Link new session to old metadata or create new?)
+        # 5. Revoke the old one and Register New Session in one batch
+        async with redis.pipeline(transaction=True) as pipe:
+            if "fam" in payload:
+                entry = revocation_index.revoke_rotated(pipe, old_jti)
+            else:
+                # Pre-family token: keep refusing it outright, not as reuse of the family it just started
+                entry = revocation_index.revoke(pipe, old_jti, exp=payload["exp"])
+            token_lifecycle.touch(pipe, family)
+            pipe.delete(f"refresh_token:{old_jti}")
+            pipe.srem(f"user:{user_id}:sessions", old_jti)
+            pipe.sadd(f"user:{user_id}:sessions", new_jti)
+            pipe.setex(f"refresh_token:{new_jti}", settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400, new_refresh_token)
+            await pipe.execute()
+        await revocation_index.publish([entry])
+        
+        # 6. Update Monitoring (Link new session to old metadata or create new?)
         # Ideally, we copy metadata from old session to new, to keep track of "Device".
         # For prototype, we can just let it be. Or capture signal again if we had headers.
         
@@ -198,3 +257,8 @@ async def refresh_token(refresh_token: str, redis=Depends(get_redis)):
         
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
+
+@router.get("/me")
+async def me(claims: dict = Depends(require_active_token)):
+    # Lets relying apps check a session is still live
+    return {"user_id": claims.get("sub"), "jti": claims.get("jti"), "exp": claims.get("exp")}
@@ -0,0 +1,364 @@
+import asyncio
+import hashlib
+import json
+import math
+import time
+import uuid
+from app.core.config import settings
+from app.core.redis_client import redis_client
+
+REVOCATION_CHANNEL = "revocations"
+FAMILY_REVOKED = "revoked"
+
+class BloomFilter:
+    __slots__ = ("bits", "size", "hashes", "count")
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(64, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, item):
+        # Double hashing (Kirsch-Mitzenmacher) from one 128-bit digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def add(self, item):
+        for pos in self.positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def has_positions(self, positions):
+        bits = self.bits
+        for pos in positions:
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def __contains__(self, item):
+        return self.has_positions(self.positions(item))
+
+class RevocationFilter:
+    """
+    Time-bucketed Bloom filter of revoked JTIs.
+    Buckets are keyed by how long an entry must be remembered
+    (not_after // bucket_seconds), so whole buckets are dropped once their
+    window has passed. An access token and its refresh token share a JTI, so
+    a lookup cannot rely on the presented token's exp and probes every live
+    bucket. Buckets are a day wide by default: rotated-out JTIs (the bulk)
+    only outlive their access token, so lookups typically probe one or two
+    buckets and never more than REFRESH_TOKEN_EXPIRE_DAYS + 1. Layers share
+    one size, so a JTI is hashed once per lookup. Each bucket chains a new filter layer when it fills up,
+    keeping the false-positive rate bounded.
+    """
+    def __init__(self, bucket_seconds=86400, bucket_capacity=10000, error_rate=0.001):
+        self.bucket_seconds = bucket_seconds
+        self.bucket_capacity = bucket_capacity
+        self.error_rate = error_rate
+        self.buckets = {} # bucket id -> [BloomFilter, ...]
+
+    def _bucket_id(self, exp):
+        return int(exp) // self.bucket_seconds
+
+    def _add_to_bucket(self, bucket_id, jti):
+        layers = self.buckets.get(bucket_id)
+        if layers is None:
+            layers = self.buckets[bucket_id] = [BloomFilter(self.bucket_capacity, self.error_rate)]
+        if layers[-1].count >= self.bucket_capacity:
+            layers.append(BloomFilter(self.bucket_capacity, self.error_rate))
+        layers[-1].add(jti)
+
+    def add(self, jti, not_after):
+        """
+        not_after: until when any token carrying jti may still be presented.
+        """
+        self._add_to_bucket(self._bucket_id(not_after), jti)
+
+    def might_contain(self, jti):
+        positions = {} # layer size -> bit positions of jti
+        for layers in self.buckets.values():
+            for layer in layers:
+                found = positions.get(layer.size)
+                if found is None:
+                    found = positions[layer.size] = layer.positions(jti)
+                if layer.has_positions(found):
+                    return True
+        return False
+
+    def expire(self, now=None):
+        current = self._bucket_id(now or time.time())
+        for bucket_id in [b for b in self.buckets if b < current]:
+            del self.buckets[bucket_id]
+
+    def stats(self):
+        layers = [layer for bucket in self.buckets.values() for layer in bucket]
+        return {
+            "buckets": len(self.buckets),
+            "layers": len(layers),
+            "entries": sum(layer.count for layer in layers),
+            "bytes": sum(len(layer.bits) for layer in layers),
+        }
+
+class RevocationIndex:
+    """
+    Answers "is this JTI revoked?" without a store round trip in the common
+    (not revoked) case. Per-JTI `blacklist:{jti}` keys are only written where
+    no family covers the token: a rotated-out JTI until its access token
+    expires (the family head already refuses its refresh token), and a logout
+    of a token without a `fam` claim. They stay the source of truth for JTIs:
+    a filter hit is confirmed with an exact lookup. Revocations made on other
+    workers arrive over pub/sub, so a filter miss is only trusted while the
+    filter is in sync: warmed from the store and subscribed without a gap
+    since. Otherwise (before warm(), or after the pub/sub listener lost its
+    connection) every check reads the store and a re-warm is started.
+    Global logout does not touch individual JTIs: it stores one per-user epoch
+    (`user:{id}:revoked_before`) and any token issued at or before it is revoked.
+    Every epoch is mirrored in-process, so that check is a dict lookup; epochs
+    older than the refresh lifetime no longer match any live token and are evicted.
+    Refresh reuse revokes a token family (`fam` claim) the same way.
+    The channel also carries per-user cache invalidations (e.g. memoized
+    refresh verdicts after a re-auth) to the handlers in invalidation_handlers.
+    """
+    def __init__(self, store=None):
+        self.redis = store or redis_client
+        self.filter = RevocationFilter(
+            bucket_seconds=settings.REVOCATION_BUCKET_SECONDS,
+            bucket_capacity=settings.REVOCATION_BUCKET_CAPACITY,
+        )
+        self.epochs = {} # user_id -> tokens with iat up to this are revoked
+        self._epochs_swept = 0.0
+        self.families = {} # family -> not_after
+        self.origin = uuid.uuid4().hex
+        self._synced_generation = None # store.pubsub_generation the filter was warmed under
+        self._warming = None
+        self.invalidation_handlers = [] # called with user_id on published invalidations
+        self.stats = {"checks": 0, "epoch_revoked": 0, "family_revoked": 0,
+                      "filter_negative": 0, "store_lookups": 0, "stale_lookups": 0, "confirmed": 0}
+        self.redis.subscribe(REVOCATION_CHANNEL, self._on_message)
+
+    def blacklist_key(self, jti):
+        return f"blacklist:{jti}"
+
+    def epoch_key(self, user_id):
+        return f"user:{user_id}:revoked_before"
+
+    def family_key(self, family):
+        # Head pointer used by refresh rotation (app.auth.rotation)
+        return f"refresh_family:{family}"
+
+    def revoked_family_key(self, family):
+        return f"revoked_family:{family}"
+
+    def revoke(self, pipe, jti, exp=None):
+        """
+        Queues the blacklist write on `pipe` and records the JTI locally, for
+        a token outside any family (logout of a token without `fam`).
+        The refresh token minted with an access token carries the same JTI and
+        can live up to the refresh lifetime, so the entry covers at least
+        now..now+REFRESH_TOKEN_EXPIRE_DAYS (longer if exp says so).
+        Call publish() with the returned entries after the pipeline runs.
+        Returns: (jti, not_after) entry
+        """
+        now = time.time()
+        return self._blacklist(pipe, jti, max(exp or 0, now + settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400), now)
+
+    def revoke_rotated(self, pipe, jti):
+        """
+        Queues the blacklist write for a JTI rotated out of its family.
+        The family head no longer accepts its refresh token (presenting it is
+        reuse), so the entry only has to outlive the access token minted with it.
+        Call publish() with the returned entries after the pipeline runs.
+        Returns: (jti, not_after) entry
+        """
+        now = time.time()
+        return self._blacklist(pipe, jti, now + settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60, now)
+
+    def _blacklist(self, pipe, jti, not_after, now):
+        self.filter.expire()
+        not_after = int(not_after) + 1
+        pipe.setex(self.blacklist_key(jti), max(1, int(not_after - now)), f"~{not_after}")
+        self.filter.add(jti, not_after)
+        return (jti, not_after)
+
+    def revoke_user(self, pipe, user_id):
+        """
+        Queues a single epoch write on `pipe`: every token of `user_id` issued
+        up to now is revoked, however many sessions there are. The epoch is the
+        exact (sub-second) time, like iat, so tokens minted after it stay valid.
+        Call publish(epochs=...) with the returned mapping after the pipeline runs.
+        Returns: {user_id: epoch}
+        """
+        epoch = time.time()
+        # No token issued before the epoch outlives the refresh token lifetime
+        ttl = settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400
+        pipe.setex(self.epoch_key(user_id), ttl, repr(epoch))
+        self._expire_epochs()
+        self._set_epoch(user_id, epoch)
+        return {user_id: epoch}
+
+    def revoke_family(self, pipe, family):
+        """
+        Queues revocation of every token in a refresh family on `pipe`:
+        the head pointer is poisoned (no further rotation) and a marker is kept
+        for as long as any token of the family can live.
+        Call publish(families=...) with the returned mapping after the pipeline runs.
+        Returns: {family: not_after}
+        """
+        ttl = settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400
+        not_after = int(time.time()) + ttl
+        pipe.setex(self.family_key(family), ttl, FAMILY_REVOKED)
+        pipe.setex(self.revoked_family_key(family), ttl, str(not_after))
+        self._expire_families()
+        self.families[family] = not_after
+        return {family: not_after}
+
+    def _expire_families(self):
+        now = time.time()
+        for family in [f for f, not_after in self.families.items() if not_after < now]:
+            del self.families[family]
+
+    def _expire_epochs(self, min_interval=60.0):
+        # At most one sweep per min_interval: every epoch is checked
+        now = time.time()
+        if now - self._epochs_swept < min_interval:
+            return
+        self._epochs_swept = now
+        horizon = now - settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400
+        for user_id in [u for u, epoch in self.epochs.items() if epoch < horizon]:
+            del self.epochs[user_id]
+
+    def _set_epoch(self, user_id, epoch):
+        if epoch > self.epochs.get(user_id, 0):
+            self.epochs[user_id] = epoch
+
+    async def publish(self, entries=(), epochs=None, families=None, invalidate=()):
+        """
+        invalidate: user ids whose cached state other workers must drop.
+        """
+        if not entries and not epochs and not families and not invalidate:
+            return
+        message = json.dumps({
+            "origin": self.origin,
+            "entries": list(entries),
+            "epochs": epochs or {},
+            "families": families or {},
+            "invalidate": list(invalidate),
+        })
+        await self.redis.publish(REVOCATION_CHANNEL, message)
+
+    def _on_message(self, message):
+        data = json.loads(message)
+        if data.get("origin") == self.origin:
+            return
+        for jti, not_after in data.get("entries", ()):
+            self.filter.add(jti, not_after)
+        epochs = data.get("epochs")
+        if epochs:
+            self._expire_epochs()
+            for user_id, epoch in epochs.items():
+                self._set_epoch(user_id, epoch)
+        families = data.get("families")
+        if families:
+            self._expire_families()
+            self.families.update(families)
+        for user_id in data.get("invalidate", ()):
+            for handler in self.invalidation_handlers:
+                handler(user_id)
+
+    def revoked_by_epoch(self, user_id, iat):
+        epoch = self.epochs.get(user_id)
+        # Tokens without iat predate epochs and are treated as issued at 0.
+        # Whole-second iats of the epoch's own second count as before it.
+        return epoch is not None and (iat or 0) <= epoch
+
+    async def is_revoked(self, jti, exp, user_id=None, iat=None, family=None):
+        """
+        Returns: None if the token is live, otherwise why it is revoked
+                 ("epoch", "family" or "jti")
+        """
+        self.stats["checks"] += 1
+        if user_id is not None and self.revoked_by_epoch(user_id, iat):
+            self.stats["epoch_revoked"] += 1
+            return "epoch"
+        if family is not None and family in self.families:
+            self.stats["family_revoked"] += 1
+            return "family"
+        if not self.in_sync():
+            # Revocations may have been missed: only the store can answer
+            self.stats["stale_lookups"] += 1
+            self._start_rewarm()
+        elif not self.filter.might_contain(jti):
+            self.stats["filter_negative"] += 1
+            return None
+        else:
+            # Possible false positive: confirm against the store
+            self.stats["store_lookups"] += 1
+        if not await self.redis.get(self.blacklist_key(jti)):
+            return None
+        self.stats["confirmed"] += 1
+        return "jti"
+
+    async def is_token_revoked(self, claims):
+        return await self.is_revoked(claims["jti"], claims["exp"], claims.get("sub"),
+                                     claims.get("iat"), claims.get("fam"))
+
+    def in_sync(self):
+        """
+        True while no revocation can have bypassed the local filter: it was
+        warmed and the pub/sub subscription has been live ever since.
+        """
+        return (self._synced_generation is not None and self.redis.pubsub_live
+                and self.redis.pubsub_generation == self._synced_generation)
+
+    def _start_rewarm(self):
+        if self._warming is None or self._warming.done():
+            self._warming = asyncio.get_running_loop().create_task(self.warm())
+
+    async def warm(self):
+        """
+        Rebuilds the local filter from existing blacklist keys (worker start,
+        and after a pub/sub gap). The filter only counts as in sync once the
+        scan is complete, and only for the subscription it started under;
+        messages arriving meanwhile are applied as usual.
+        Values are "~<not_after>"; anything else (older entries) is assumed to
+        outlive the longest token.
+        """
+        generation = self.redis.pubsub_generation
+        live = self.redis.pubsub_live
+        horizon = time.time() + settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400
+        loaded = 0
+        async for key in self.redis.scan_iter(match="blacklist:*", count=1000):
+            jti = key.split(":", 1)[1]
+            value = await self.redis.get(key) or ""
+            if value.startswith("~") and value[1:].isdigit():
+                self.filter.add(jti, int(value[1:]))
+            else:
+                self.filter.add(jti, horizon)
+            loaded += 1
+        async for key in self.redis.scan_iter(match="user:*:revoked_before", count=1000):
+            value = await self.redis.get(key)
+            try:
+                epoch = float(value)
+            except (TypeError, ValueError):
+                continue
+            self._set_epoch(key[len("user:"):-len(":revoked_before")], epoch)
+            loaded += 1
+        async for key in self.redis.scan_iter(match="revoked_family:*", count=1000):
+            value = await self.redis.get(key)
+            if value and value.isdigit():
+                self.families[key.split(":", 1)[1]] = int(value)
+                loaded += 1
+        if live:
+            self._synced_generation = generation
+        return loaded
+
+    def get_metrics(self):
+        return {**self.stats, **self.filter.stats(), "user_epochs": len(self.epochs),
+                "revoked_families": len(self.families), "in_sync": self.in_sync()}
+
+# Singleton
+revocation_index = RevocationIndex()
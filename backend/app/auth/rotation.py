@@ -0,0 +1,86 @@
+import asyncio
+import zlib
+from app.core.config import settings
+from app.core.redis_client import redis_client, InMemoryRedisClient
+from app.auth.revocation import revocation_index
+
+# Refresh-token families.
+# Every login starts a family; each rotation moves the family's head to the new
+# JTI with a compare-and-swap, so of N concurrent refreshes presenting the same
+# token exactly one wins. Presenting a token that is no longer the head is
+# reuse (stolen or replayed token) and revokes the whole family.
+
+LOCK_STRIPES = 1024
+
+# KEYS[1] family key
+# ARGV: expected head, new head, ttl seconds, "1" if a missing family may be claimed
+SWAP_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current == ARGV[1] or (not current and ARGV[4] == '1') then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+    return {1, current or ''}
+end
+return {0, current or ''}
+"""
+
+class RefreshRotator:
+    """
+    Compare-and-swap on `refresh_family:{family}` -> current refresh JTI.
+    Redis: a server-side script. In-memory: asyncio locks striped by family hash
+    (only the get/set pair is serialised, not the whole refresh).
+    """
+    def __init__(self, store=None):
+        self.redis = store or redis_client
+        self.use_script = not isinstance(self.redis, InMemoryRedisClient)
+        self._script = self.redis.register_script(SWAP_SCRIPT) if self.use_script else None
+        self._locks = [asyncio.Lock() for _ in range(LOCK_STRIPES)]
+        self.ttl = settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400
+        self.stats = {"rotations": 0, "reuse_detected": 0}
+
+    def family_key(self, family):
+        return revocation_index.family_key(family)
+
+    def start_family(self, pipe, family, jti):
+        """
+        Queues the family head write on `pipe` (login).
+        """
+        pipe.setex(self.family_key(family), self.ttl, jti)
+
+    async def swap(self, family, expected, new, allow_missing=False):
+        """
+        allow_missing: claim a family that has no head yet (tokens minted
+                       before families existed).
+        Returns: (swapped, previous head or None)
+        """
+        key = self.family_key(family)
+        if self._script is not None:
+            swapped, current = await self._script(
+                keys=[key], args=[expected, new, self.ttl, "1" if allow_missing else "0"]
+            )
+            return bool(swapped), current or None
+
+        lock = self._locks[zlib.crc32(family.encode()) % LOCK_STRIPES]
+        async with lock:
+            current = await self.redis.get(key)
+            if current != expected and not (current is None and allow_missing):
+                return False, current
+            await self.redis.setex(key, self.ttl, new)
+            return True, current
+
+    async def rotate(self, family, old_jti, new_jti, allow_missing=False):
+        """
+        Returns: True if old_jti was the family head (now new_jti),
+                 False on reuse - the caller must revoke the family.
+        """
+        swapped, _ = await self.swap(family, old_jti, new_jti, allow_missing)
+        if swapped:
+            self.stats["rotations"] += 1
+        else:
+            self.stats["reuse_detected"] += 1
+        return swapped
+
+    def get_metrics(self):
+        return {**self.stats, "atomic": "script" if self.use_script else "striped-lock"}
+
+# Singleton
+refresh_rotator = RefreshRotator()
@@ -0,0 +1,97 @@
+import time
+from app.core.redis_client import redis_client, InMemoryRedisClient
+
+class SocketEntry:
+    __slots__ = ("sid", "user_id", "app_name", "connected_at")
+
+    def __init__(self, sid, user_id=None, app_name=None):
+        self.sid = sid
+        self.user_id = user_id
+        self.app_name = app_name
+        self.connected_at = time.time()
+
+class SocketSessionRegistry:
+    """
+    Tracks which socket sids belong to which user.
+    Keeps a forward map (user_id -> sids) and a reverse map (sid -> entry),
+    so connect, join, disconnect and per-sid lookups are all O(1).
+    The local maps always reflect this worker's sockets. When the store is
+    shared (Redis backend), membership is mirrored to `sockets:{user_id}`
+    so any worker can see every socket of a user across the cluster.
+    """
+    def __init__(self, store=None):
+        self.redis = store or redis_client
+        self.shared = not isinstance(self.redis, InMemoryRedisClient)
+        # Maps user_id -> set({sid1, sid2, ...}) for sockets on this worker
+        self.local_sessions = {}
+        # Maps sid -> SocketEntry
+        self.by_sid = {}
+
+    def socket_key(self, user_id):
+        return f"sockets:{user_id}"
+
+    def connect(self, sid):
+        if sid not in self.by_sid:
+            self.by_sid[sid] = SocketEntry(sid)
+
+    async def add(self, user_id, sid, app_name=None):
+        entry = self.by_sid.get(sid)
+        if entry is None:
+            entry = self.by_sid[sid] = SocketEntry(sid)
+        elif entry.user_id is not None and entry.user_id != user_id:
+            # Same socket re-joining as another user
+            await self._unlink(entry)
+
+        entry.user_id = user_id
+        entry.app_name = app_name
+        if user_id not in self.local_sessions:
+            self.local_sessions[user_id] = set()
+        self.local_sessions[user_id].add(sid)
+        if self.shared:
+            await self.redis.sadd(self.socket_key(user_id), sid)
+
+    async def remove(self, sid):
+        """
+        Forgets a socket.
+        Returns: the removed SocketEntry (None if the sid was unknown)
+        """
+        entry = self.by_sid.pop(sid, None)
+        if entry is not None and entry.user_id is not None:
+            await self._unlink(entry)
+        return entry
+
+    async def _unlink(self, entry):
+        sids = self.local_sessions.get(entry.user_id)
+        if sids is not None:
+            sids.discard(entry.sid)
+            if not sids:
+                del self.local_sessions[entry.user_id]
+        if self.shared:
+            await self.redis.srem(self.socket_key(entry.user_id), entry.sid)
+
+    def get(self, sid):
+        return self.by_sid.get(sid)
+
+    async def touch(self, user_id):
+        """
+        Keeps the shared membership set alive while the user's sockets beat.
+        """
+        if self.shared and user_id in self.local_sessions:
+            await self.redis.expire(self.socket_key(user_id))
+
+    async def sids_for(self, user_id):
+        """
+        Returns every sid of the user, cluster-wide when the store is shared.
+        """
+        if self.shared:
+            return set(await self.redis.smembers(self.socket_key(user_id)))
+        return set(self.local_sessions.get(user_id, ()))
+
+    def local_sids(self, user_id):
+        return set(self.local_sessions.get(user_id, ()))
+
+    def __len__(self):
+        return len(self.by_sid)
+
+# Singleton
+socket_registry = SocketSessionRegistry()
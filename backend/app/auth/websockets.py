@@ -1,12 +1,34 @@
 import socketio
+from app.core.config import settings
+from app.core.geoip import geo_resolver
 from app.agents.monitoring import session_monitor
-from app.agents.risk import risk_detector
-from app.agents.decision import decision_agent
 from app.agents.executioner import executioner
+from app.agents.risk_queue import risk_workers
+from app.agents.heartbeats import heartbeat_buffer
+from app.auth.session_registry import socket_registry
+from app.auth.credentials import credential_store
+from app.auth.admission import admission_control
+from app.auth.jwt import decode_token
+from jose import JWTError
+from app.core.metrics import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+def create_client_manager():
+    """
+    Multi-node mode: with REDIS_URL set, emits are fanned out over Redis pub/sub
+    so a room broadcast (e.g. LOGOUT_ALL) reaches sockets on every worker.
+    Otherwise the In-Memory Manager is used for local prototype reliability.
+    """
+    if settings.REDIS_URL:
+        logger.info("✅ [Socket] Multi-node mode: Redis pub/sub client manager")
+        return socketio.AsyncRedisManager(settings.REDIS_URL, channel=settings.SOCKETIO_CHANNEL)
+    return None
 
-# Using In-Memory Manager for Local Prototype Reliability
 sio_server = socketio.AsyncServer(
     async_mode='asgi',
+    client_manager=create_client_manager(),
     cors_allowed_origins=["http://localhost:5173", "http://localhost:5174"]
 )
 
@@ -15,64 +37,96 @@ sio_app = socketio.ASGIApp(
     socketio_path='socket.io'
 )
 
-# Explicit In-Memory Session Store
-# Maps user_id -> set({sid1, sid2, ...})
-active_user_sessions = {}
+# Explicit Session Store (shared across workers in multi-node mode)
+# Maps user_id -> set({sid1, sid2, ...}) for sockets on this worker
+active_user_sessions = socket_registry.local_sessions
 
 @sio_server.event
-async def connect(sid, environ):
+@metrics.timed("socket_event_seconds", event="connect")
+async def connect(sid, environ, auth=None):
     # print(f"Client connected: {sid}")
-    pass
+    socket_registry.connect(sid)
+
+def token_family(user_id, token):
+    """
+    Refresh token family of the access token a socket joined with, so its
+    risk reaches the family's refresh gate.
+    Returns: the family, None if the token is missing, invalid or another user's
+    """
+    if not token:
+        return None
+    try:
+        claims = decode_token(token)
+    except JWTError:
+        return None
+    if str(claims.get("sub")) != str(user_id):
+        return None
+    return claims.get("fam")
 
 @sio_server.event
+@metrics.timed("socket_event_seconds", event="join")
 async def join(sid, data):
     user_id = data.get('user_id')
     app_name = data.get('app_name', 'Unknown App')
     
     if user_id:
-        print(f"✅ [Socket] Client {sid} ({app_name}) joined user_{user_id}")
+        logger.debug(f"✅ [Socket] Client {sid} ({app_name}) joined user_{user_id}")
         await sio_server.enter_room(sid, f"user_{user_id}")
         
         # Manual Tracking
-        if user_id not in active_user_sessions:
-            active_user_sessions[user_id] = set()
-        active_user_sessions[user_id].add(sid)
+        await socket_registry.add(user_id, sid, app_name)
         
         # Risk Analysis
-        # Mocking Location: In real app, derived from IP via GeoIP DB
-        meta = {"ip": "127.0.0.1", "app_name": app_name, "country": "India"}
+        # Location derived from the socket's IP via the GeoIP table (mocked as India if unknown)
+        environ = sio_server.get_environ(sid) or {}
+        client_ip = environ.get('REMOTE_ADDR') or "127.0.0.1"
+        country = geo_resolver.lookup(client_ip) or "India"
+        meta = {"ip": client_ip, "app_name": app_name, "country": country}
         await session_monitor.register_session(user_id, sid, meta)
+        heartbeat_buffer.track(user_id, sid)
         
-        # Trigger Risk Check
-        score, reasons = await risk_detector.calculate_risk(user_id, sid, meta)
-        
-        # Auto-Execution Logic
-        action = await decision_agent.evaluate_risk(user_id, sid, score)
-        if action == "FORCE_LOGOUT":
-             await executioner.execute_global_logout(sio_server, user_id, f"High Risk: {reasons}")
+        # Trigger Risk Check (async; verdict handled by on_risk_verdict)
+        family = token_family(user_id, data.get('token'))
+        if not risk_workers.submit(user_id, sid, meta, family):
+            # Queue saturated: apply backpressure by analysing on this join
+            await risk_workers.run_inline(user_id, sid, meta, family)
+
+async def on_risk_verdict(user_id, session_id, score, reasons, action):
+    # Auto-Execution Logic
+    if action == "FORCE_LOGOUT":
+         await executioner.execute_global_logout(sio_server, user_id, f"High Risk: {reasons}")
+
+risk_workers.set_verdict_handler(on_risk_verdict)
+
+async def on_idle_session(user_id, sid):
+    # Socket stopped beating: drop it (the disconnect handler ends the session)
+    await sio_server.disconnect(sid)
+
+heartbeat_buffer.set_idle_handler(on_idle_session)
 
 @sio_server.event
+@metrics.timed("socket_event_seconds", event="disconnect")
 async def disconnect(sid):
-    # Remove SID from all trackers
-    for uid in list(active_user_sessions.keys()):
-        if sid in active_user_sessions[uid]:
-            active_user_sessions[uid].remove(sid)
-            if not active_user_sessions[uid]:
-                del active_user_sessions[uid]
-            break
+    # Remove SID from all trackers (reverse index -> O(1))
+    entry = await socket_registry.remove(sid)
+    heartbeat_buffer.forget(sid)
+    if entry is not None and entry.user_id is not None:
+        # Drop the session hash created by register_session on join
+        await session_monitor.end_session(entry.user_id, sid)
 
 @sio_server.event
+@metrics.timed("socket_event_seconds", event="force_global_logout")
 async def force_global_logout(sid, data):
     user_id = data.get('user_id')
     reason = data.get('reason', 'Manual Global Logout')
     initiator = data.get('initiator', 'Unknown')
     
-    print(f"🌍 [Socket] Global Logout Initiated for {user_id} by {initiator}")
+    logger.info(f"🌍 [Socket] Global Logout Initiated for {user_id} by {initiator}")
     
-    # robust broadcast
-    if user_id in active_user_sessions:
-        target_sids = list(active_user_sessions[user_id])
-        print(f"Messaging {len(target_sids)} active sessions...")
+    # robust broadcast (client manager routes each sid to the worker holding it)
+    target_sids = await socket_registry.sids_for(user_id)
+    if target_sids:
+        logger.debug(f"Messaging {len(target_sids)} active sessions...")
         for target_sid in target_sids:
             try:
                 await sio_server.emit('LOGOUT_ALL', {
@@ -81,7 +135,7 @@ async def force_global_logout(sid, data):
                     'initiator': initiator
                 }, room=target_sid) # Direct messaging
             except Exception as e:
-                print(f"Error sending to {target_sid}: {e}")
+                logger.error(f"Error sending to {target_sid}: {e}")
                 
     # Also emit to room as backup
     await sio_server.emit('LOGOUT_ALL', {
@@ -91,15 +145,35 @@ async def force_global_logout(sid, data):
     }, room=f"user_{user_id}")
 
 @sio_server.event
+@metrics.timed("socket_event_seconds", event="heartbeat")
 async def heartbeat(sid, data):
-    pass
+    # Buffered: last_heartbeat + TTL refreshes are flushed in batches
+    entry = socket_registry.get(sid)
+    if entry is not None and entry.user_id is not None:
+        heartbeat_buffer.beat(sid, entry.user_id)
 
 @sio_server.event
+@metrics.timed("socket_event_seconds", event="verify_password")
 async def verify_password(sid, data):
-    user_id = data.get('user_id')
-    password = data.get('password')
-    if password == "password":
+    # Re-auth is only for the user this socket joined as, never a client-supplied id
+    entry = socket_registry.get(sid)
+    if entry is None or entry.user_id is None:
+        await sio_server.emit('REAUTH_FAILED', {'message': 'Join before re-authenticating'}, room=sid)
+        return
+    user_id = entry.user_id
+    environ = sio_server.get_environ(sid) or {}
+    admission = await admission_control.admit("reauth", ip=environ.get('REMOTE_ADDR'), username=user_id)
+    if not admission.allowed:
+        await sio_server.emit('REAUTH_FAILED', {'message': f'Too many attempts, retry in {admission.retry_after}s'}, room=sid)
+        return
+
+    verified, status = await credential_store.verify_user(user_id, data.get('password'))
+    if verified:
+        # Starts the grace period (store + every worker's cache)
+        await executioner.log_success_reauth(user_id)
         await sio_server.emit('REAUTH_SUCCESS', {'message': 'Verified'}, room=sid)
+    elif status == "busy":
+        await sio_server.emit('REAUTH_FAILED', {'message': 'Verification busy, try again'}, room=sid)
     else:
         await sio_server.emit('REAUTH_FAILED', {'message': 'Invalid Password'}, room=sid)
 
@@ -0,0 +1,224 @@
+import argparse
+import asyncio
+import collections
+import heapq
+import json
+import logging
+import os
+import time
+from app.core.config import settings, resolve_path
+
+logger = logging.getLogger(__name__)
+
+# Append-only security audit trail.
+#
+# Agents and handlers call audit_log.emit(...) - a non-blocking append to a
+# bounded in-memory queue. A background task drains it in batches and the
+# file writes + fsync run in a worker thread, so the event loop never waits
+# on disk. Events are NDJSON lines in size-rotated segments:
+#   <AUDIT_LOG_DIR>/audit-<start ms>-<pid>-<seq>.ndjson
+# A relative AUDIT_LOG_DIR is resolved against backend/, never the working directory.
+# Each worker process writes its own segments; the reader merges them.
+#
+#   python -m app.core.audit <dir> --user user_123 --since 1700000000 --type global_revoke
+
+SEGMENT_PREFIX = "audit-"
+SEGMENT_SUFFIX = ".ndjson"
+
+class AuditSink:
+    def __init__(self, directory, segment_bytes=16 * 1024 * 1024, max_queue=10000,
+                 batch_size=500, flush_interval=0.2, fsync_interval=1.0):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self._queue = collections.deque()
+        self._wakeup = None
+        self._task = None
+        self._stopping = False
+        self._file = None
+        self._segment_path = None
+        self._segment_size = 0
+        self._last_fsync = 0.0
+        self.stats = {"emitted": 0, "written": 0, "dropped": 0, "batches": 0, "segments": 0, "fsyncs": 0}
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def emit(self, event_type, user_id=None, **fields):
+        """
+        Queues one audit event without blocking.
+        Returns: False if the event was dropped (disabled or queue full)
+        """
+        if not self.enabled:
+            return False
+        if len(self._queue) >= self.max_queue:
+            self.stats["dropped"] += 1
+            return False
+        self._queue.append({"ts": time.time(), "type": event_type, "user_id": user_id, **fields})
+        self.stats["emitted"] += 1
+        if self._wakeup is not None and len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logger.info(f"✅ [Audit] Writing audit segments to {self.directory}")
+
+    async def stop(self):
+        """
+        Flushes everything still queued, fsyncs and closes the segment.
+        The writer is asked to exit rather than cancelled: a cancel would leave
+        its in-flight thread write racing the final flush on the same file.
+        """
+        task, self._task = self._task, None
+        if task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await task
+        await self._flush(final=True)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self._flush()
+            except Exception as e:
+                logger.error(f"❌ [Audit] Write failed: {e}")
+
+    async def _flush(self, final=False):
+        while self._queue:
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            data = "".join(json.dumps(event, separators=(",", ":")) + "\n" for event in batch).encode()
+            await asyncio.to_thread(self._write, data)
+            self.stats["written"] += len(batch)
+            self.stats["batches"] += 1
+        if final:
+            await asyncio.to_thread(self._close)
+        elif self._file is not None and time.time() - self._last_fsync >= self.fsync_interval:
+            await asyncio.to_thread(self._fsync)
+
+    # --- worker thread side (only ever one call in flight) ---
+
+    def _open_segment(self):
+        self._close()
+        # pid + sequence keep names unique across workers and fast rotations
+        seq = self.stats["segments"]
+        name = f"{SEGMENT_PREFIX}{int(time.time() * 1000):015d}-{os.getpid()}-{seq}{SEGMENT_SUFFIX}"
+        self._segment_path = os.path.join(self.directory, name)
+        self._file = open(self._segment_path, "ab")
+        self._segment_size = self._file.tell()
+        self.stats["segments"] += 1
+
+    def _write(self, data):
+        if self._file is None or self._segment_size + len(data) > self.segment_bytes:
+            self._open_segment()
+        self._file.write(data)
+        self._file.flush()
+        self._segment_size += len(data)
+
+    def _fsync(self):
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+            self._last_fsync = time.time()
+            self.stats["fsyncs"] += 1
+
+    def _close(self):
+        if self._file is not None:
+            self._fsync()
+            self._file.close()
+            self._file = None
+
+    def get_metrics(self):
+        return {**self.stats, "queue_depth": len(self._queue), "segment": self._segment_path}
+
+def segment_start(name):
+    """
+    Returns: segment start time in seconds, or None if `name` is not a segment
+    """
+    if not (name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)):
+        return None
+    try:
+        return int(name[len(SEGMENT_PREFIX):].split("-", 1)[0]) / 1000
+    except ValueError:
+        return None
+
+class AuditReader:
+    """
+    Streams events from a segment directory, filtered by user, type and time.
+    Segments outside the time range are skipped by name (start) and mtime (last
+    write); the rest are read line by line and merged by timestamp, so memory
+    use does not grow with the log.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    def segments(self, since=None, until=None):
+        paths = []
+        for name in sorted(os.listdir(self.directory)):
+            start = segment_start(name)
+            if start is None:
+                continue
+            path = os.path.join(self.directory, name)
+            if until is not None and start > until:
+                continue
+            if since is not None and os.path.getmtime(path) < since:
+                continue
+            paths.append(path)
+        return paths
+
+    def _read_segment(self, path, user_id, since, until, types):
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue # torn last line of a segment still being written
+                ts = event.get("ts", 0)
+                if since is not None and ts < since:
+                    continue
+                if until is not None and ts > until:
+                    break # a segment is written in time order
+                if user_id is not None and event.get("user_id") != user_id:
+                    continue
+                if types and event.get("type") not in types:
+                    continue
+                yield event
+
+    def events(self, user_id=None, since=None, until=None, types=None):
+        """
+        Yields matching events in timestamp order.
+        """
+        streams = [self._read_segment(path, user_id, since, until, types) for path in self.segments(since, until)]
+        return heapq.merge(*streams, key=lambda event: event.get("ts", 0))
+
+# Singleton
+audit_log = AuditSink(
+    resolve_path(settings.AUDIT_LOG_DIR),
+    segment_bytes=settings.AUDIT_SEGMENT_BYTES,
+    max_queue=settings.AUDIT_QUEUE_MAX,
+    fsync_interval=settings.AUDIT_FSYNC_INTERVAL,
+)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream audit events")
+    parser.add_argument("directory")
+    parser.add_argument("--user")
+    parser.add_argument("--since", type=float, help="unix seconds")
+    parser.add_argument("--until", type=float, help="unix seconds")
+    parser.add_argument("--type", action="append", dest="types")
+    args = parser.parse_args()
+    for event in AuditReader(args.directory).events(args.user, args.since, args.until, args.types):
+        print(json.dumps(event))
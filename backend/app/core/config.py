@@ -1,14 +1,66 @@
+import os
 from pydantic_settings import BaseSettings
 
+# backend/ - relative data directories are anchored here, not at the working directory
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 class Settings(BaseSettings):
     PROJECT_NAME: str = "Agentic SSO"
-    REDIS_URL: str = "redis://redis:6379/0"
+    LOG_LEVEL: str = "INFO"
+    REDIS_URL: str = "" # Empty -> In-Memory Mock, e.g. redis://redis:6379/0
+    REDIS_MAX_CONNECTIONS: int = 50
+    SOCKETIO_CHANNEL: str = "agentic-sso"
+    RISK_WORKERS: int = 4
+    RISK_QUEUE_MAX_DEPTH: int = 10000
+    GEOIP_DB_PATH: str = "" # Built with: python -m app.core.geoip build
+    GEOIP_CACHE_SIZE: int = 65536
     SECRET_KEY: str = "YOUR_SUPER_SECRET_KEY_CHANGE_THIS"
-    ALGORITHM: str = "HS256"
+    ALGORITHM: str = "HS256" # RS256 / ES256 -> asymmetric, published at /.well-known/jwks.json
+    JWT_KEYS_DIR: str = "" # Shared <kid>.pem signing keys for RS256/ES256
+    JWT_KEY_ROTATE_DAYS: int = 30 # signing key age that triggers a rotation; 0 = manual only
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
+    VERIFIED_TOKEN_CACHE_SIZE: int = 10000
+    REVOCATION_BUCKET_SECONDS: int = 86400 # every live bucket is probed: at most REFRESH_TOKEN_EXPIRE_DAYS + 1
+    REVOCATION_BUCKET_CAPACITY: int = 10000
+    DECISION_POLICY_PATH: str = "" # JSON thresholds, hot-reloaded on change
+    GRACE_CACHE_TTL: int = 30
+    AUDIT_LOG_DIR: str = "" # Off by default (docker-compose enables it); a directory (relative -> backend/) enables the audit trail
+    AUDIT_SEGMENT_BYTES: int = 16 * 1024 * 1024
+    AUDIT_QUEUE_MAX: int = 10000
+    AUDIT_FSYNC_INTERVAL: float = 1.0
+    STORE_PERSIST_DIR: str = "" # Off by default (volatile mock store); a directory (relative -> backend/) enables snapshots + command log
+    STORE_SNAPSHOT_INTERVAL: int = 300
+    STORE_AOF_FLUSH_INTERVAL: float = 1.0 # seconds of writes a crash can lose when persistence is on
+    STORE_FSYNC: bool = True
+    HEARTBEAT_FLUSH_INTERVAL: float = 0.25 # seconds between batched last_heartbeat writes
+    HEARTBEAT_WRITE_INTERVAL: int = 150 # min seconds between store writes per session; keep below session TTL (300) - beat period (120)
+    SESSION_IDLE_TIMEOUT: int = 330 # silence before a socket session is reaped (clients beat every 120s)
+    SESSION_REAP_INTERVAL: int = 30
+    RATE_LIMIT_WINDOW: int = 60 # seconds, sliding
+    RATE_LIMIT_BUCKETS: int = 12
+    RATE_LIMIT_MAX_KEYS: int = 100000 # tracked keys per limit, oldest evicted beyond this
+    LOGIN_RATE_LIMIT_IP: int = 30 # attempts per window; 0 disables
+    LOGIN_RATE_LIMIT_USER: int = 10
+    REFRESH_RATE_LIMIT_IP: int = 120
+    BCRYPT_ROUNDS: int = 12 # stored hashes are upgraded on login when this changes
+    PASSWORD_HASH_POOL: str = "thread" # "thread" (bcrypt releases the GIL) or "process"
+    PASSWORD_HASH_WORKERS: int = 0 # 0 = one per core
+    PASSWORD_HASH_MAX_PENDING: int = 64 # queued + running hashes before logins get 503
+    CREDENTIAL_NEGATIVE_TTL: int = 60 # seconds an unknown username is remembered
+    DEMO_USERS: str = "admin,attacker,user" # seeded if missing; empty disables
+    DEMO_USER_ID: str = "user_123"
+    DEMO_PASSWORD: str = "password"
 
     class Config:
         env_file = ".env"
 
+def resolve_path(path):
+    """
+    Returns: `path` made absolute against BASE_DIR ("" stays "", meaning disabled)
+    """
+    if not path:
+        return ""
+    return os.path.join(BASE_DIR, os.path.expanduser(path))
+
 settings = Settings()
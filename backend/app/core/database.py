@@ -1,7 +1,13 @@
-from app.core.redis_client import redis_client
+from app.core.redis_client import redis_client, InMemoryRedisClient
+import logging
 
-# We verify that redis_client is our InMemoryRedisClient
-print("✅ Database (Async) Connected to In-Memory Mock")
+logger = logging.getLogger(__name__)
+
+# Backend is chosen by REDIS_URL (see create_redis_client)
+if isinstance(redis_client, InMemoryRedisClient):
+    logger.info("✅ Database (Async) Connected to In-Memory Mock")
+else:
+    logger.info("✅ Database (Async) Connected to Redis")
 
 async def get_redis():
     return redis_client
@@ -0,0 +1,194 @@
+import bisect
+import csv
+import ipaddress
+import logging
+import mmap
+import socket
+import struct
+import sys
+from array import array
+from functools import lru_cache
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Compact IP -> country range table, memory-mapped so every worker shares the pages.
+#
+# Layout (native byte order, recorded in the header):
+#   header    MAGIC, byteorder flag, n_countries, n_v4, n_v6, names_len
+#   names     '\n'-joined UTF-8 country names, padded to 16 bytes
+#   v4        starts[n_v4] uint32, ends[n_v4] uint32, country[n_v4] uint16 (padded)
+#   v6        starts[n_v6] 16-byte big-endian, ends[n_v6] 16-byte big-endian, country[n_v6] uint16
+#
+# Build one from a CSV of "start_ip,end_ip,country" rows:
+#   python -m app.core.geoip build ranges.csv geoip.bin
+
+MAGIC = b"GEOIPR1\0"
+HEADER = struct.Struct("<8sBxxxIIII")
+V6_WIDTH = 16
+V4_MAPPED_PREFIX = b"\0" * 10 + b"\xff\xff"
+
+def _pad(length, align=16):
+    return (-length) % align
+
+class _FixedWidthKeys:
+    """
+    Sequence view over packed fixed-width keys, so bisect works on the mmap directly.
+    """
+    __slots__ = ("view", "width", "count")
+
+    def __init__(self, view, width, count):
+        self.view = view
+        self.width = width
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        start = i * self.width
+        return self.view[start:start + self.width].tobytes()
+
+class GeoIPResolver:
+    def __init__(self, path, cache_size=65536):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        self._parse()
+        # Bounded LRU in front of the binary search
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+
+    def _parse(self):
+        magic, little, n_countries, n_v4, n_v6, names_len = HEADER.unpack_from(self._view, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a GeoIP range table")
+        if bool(little) != (sys.byteorder == "little"):
+            raise ValueError(f"{self.path} was built on a host with a different byte order")
+
+        offset = HEADER.size
+        names = self._view[offset:offset + names_len].tobytes().decode("utf-8")
+        self.countries = names.split("\n") if n_countries else []
+        offset += names_len + _pad(offset + names_len)
+
+        self.v4_starts = self._view[offset:offset + 4 * n_v4].cast("I")
+        offset += 4 * n_v4
+        self.v4_ends = self._view[offset:offset + 4 * n_v4].cast("I")
+        offset += 4 * n_v4
+        self.v4_country = self._view[offset:offset + 2 * n_v4].cast("H")
+        offset += 2 * n_v4
+        offset += _pad(offset)
+
+        self.v6_starts = _FixedWidthKeys(self._view[offset:offset + V6_WIDTH * n_v6], V6_WIDTH, n_v6)
+        offset += V6_WIDTH * n_v6
+        self.v6_ends = _FixedWidthKeys(self._view[offset:offset + V6_WIDTH * n_v6], V6_WIDTH, n_v6)
+        offset += V6_WIDTH * n_v6
+        self.v6_country = self._view[offset:offset + 2 * n_v6].cast("H")
+
+    def _lookup(self, ip):
+        """
+        Returns: country name for the IP, or None if unknown/unparseable
+        """
+        # inet_pton is much cheaper than ipaddress for the common IPv4 case
+        try:
+            return self._lookup_v4(int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big"))
+        except (OSError, TypeError):
+            pass
+        try:
+            packed = socket.inet_pton(socket.AF_INET6, ip)
+        except (OSError, TypeError):
+            return None
+        if packed[:12] == V4_MAPPED_PREFIX:
+            return self._lookup_v4(int.from_bytes(packed[12:], "big"))
+
+        value = packed
+        i = bisect.bisect_right(self.v6_starts, value) - 1
+        if i >= 0 and value <= self.v6_ends[i]:
+            return self.countries[self.v6_country[i]]
+        return None
+
+    def _lookup_v4(self, value):
+        i = bisect.bisect_right(self.v4_starts, value) - 1
+        if i >= 0 and value <= self.v4_ends[i]:
+            return self.countries[self.v4_country[i]]
+        return None
+
+    def cache_info(self):
+        return self.lookup.cache_info()
+
+class NullGeoIPResolver:
+    """
+    Used when no GeoIP database is configured; callers fall back to their defaults.
+    """
+    def lookup(self, ip):
+        return None
+
+    def cache_info(self):
+        return None
+
+def build_database(csv_path, out_path):
+    """
+    Converts a CSV of "start_ip,end_ip,country" rows into the binary range table.
+    Rows whose first field is not an IP (e.g. a header) are skipped.
+    Returns: (v4 range count, v6 range count)
+    """
+    countries = {}
+    v4, v6 = [], []
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if len(row) < 3:
+                continue
+            try:
+                start = ipaddress.ip_address(row[0].strip())
+                end = ipaddress.ip_address(row[1].strip())
+            except ValueError:
+                continue
+            if start.version != end.version or end < start:
+                raise ValueError(f"Bad range: {row}")
+            code = countries.setdefault(row[2].strip(), len(countries))
+            (v4 if start.version == 4 else v6).append((int(start), int(end), code))
+
+    v4.sort()
+    v6.sort()
+    names = "\n".join(countries).encode("utf-8")
+
+    with open(out_path, "wb") as out:
+        out.write(HEADER.pack(MAGIC, sys.byteorder == "little", len(countries), len(v4), len(v6), len(names)))
+        out.write(names)
+        out.write(b"\0" * _pad(HEADER.size + len(names)))
+
+        written = 0
+        for column in (array("I", (r[0] for r in v4)), array("I", (r[1] for r in v4)), array("H", (r[2] for r in v4))):
+            data = column.tobytes()
+            out.write(data)
+            written += len(data)
+        out.write(b"\0" * _pad(written))
+
+        out.write(b"".join(r[0].to_bytes(V6_WIDTH, "big") for r in v6))
+        out.write(b"".join(r[1].to_bytes(V6_WIDTH, "big") for r in v6))
+        out.write(array("H", (r[2] for r in v6)).tobytes())
+    return len(v4), len(v6)
+
+def load_resolver():
+    if settings.GEOIP_DB_PATH:
+        try:
+            resolver = GeoIPResolver(settings.GEOIP_DB_PATH, cache_size=settings.GEOIP_CACHE_SIZE)
+            logger.info(f"✅ [Core] GeoIP table loaded: {settings.GEOIP_DB_PATH}")
+            return resolver
+        except (OSError, ValueError) as e:
+            logger.error(f"❌ [Core] GeoIP table unavailable ({e}), using mock geo-location")
+    return NullGeoIPResolver()
+
+# Singleton
+geo_resolver = load_resolver()
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "build":
+        n_v4, n_v6 = build_database(sys.argv[2], sys.argv[3])
+        print(f"Wrote {sys.argv[3]}: {n_v4} IPv4 ranges, {n_v6} IPv6 ranges")
+    elif len(sys.argv) == 4 and sys.argv[1] == "lookup":
+        print(GeoIPResolver(sys.argv[2]).lookup(sys.argv[3]))
+    else:
+        print("Usage: python -m app.core.geoip build <ranges.csv> <out.bin>")
+        print("       python -m app.core.geoip lookup <table.bin> <ip>")
+        sys.exit(1)
@@ -0,0 +1,44 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+from app.core.config import settings
+
+# Non-blocking logging: records are put on an in-memory queue by the event loop
+# and written to stdout by a QueueListener thread, so a slow terminal or pipe
+# never stalls request handling.
+
+LOG_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+_listener = None
+
+def configure_logging(level=None):
+    """
+    Routes the root logger through a queue (idempotent).
+    Returns: the QueueListener
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    log_queue = queue.SimpleQueue()
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(logging.Formatter(LOG_FORMAT))
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(level or settings.LOG_LEVEL)
+    atexit.register(stop_logging)
+    return _listener
+
+def stop_logging():
+    """
+    Flushes queued records and stops the writer thread.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
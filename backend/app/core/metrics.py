@@ -0,0 +1,186 @@
+import bisect
+import functools
+import inspect
+import time
+
+from fastapi.routing import APIRoute
+
+try:
+    from fastapi.routing import _get_scope_effective_route_context as _effective_route_context
+except ImportError:
+    # Older FastAPI copies included routes with their full path already
+    _effective_route_context = lambda scope: None
+
+# Latency buckets in seconds (Prometheus `le` bounds; +Inf is implicit)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1) # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class MetricsRegistry:
+    """
+    In-process histograms and gauges, rendered as Prometheus text at /metrics.
+    Histograms are keyed by (metric name, label tuple); observing one is a dict
+    lookup plus a bisect. Gauges are callbacks evaluated at scrape time.
+    """
+    def __init__(self):
+        self.histograms = {} # name -> {labels tuple: Histogram}
+        self.help = {}
+        self.gauges = {} # name -> (help, fn() -> number or {labels tuple: number})
+
+    def describe(self, name, help_text):
+        self.help[name] = help_text
+
+    def observe(self, name, labels, seconds):
+        series = self.histograms.get(name)
+        if series is None:
+            series = self.histograms[name] = {}
+        histogram = series.get(labels)
+        if histogram is None:
+            histogram = series[labels] = Histogram()
+        histogram.observe(seconds)
+
+    def timed(self, name, **labels):
+        """
+        Decorator recording the call duration of a sync or async function.
+        """
+        key = tuple(sorted(labels.items()))
+
+        def decorator(fn):
+            if inspect.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    started = time.perf_counter()
+                    try:
+                        return await fn(*args, **kwargs)
+                    finally:
+                        self.observe(name, key, time.perf_counter() - started)
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe(name, key, time.perf_counter() - started)
+            return wrapper
+        return decorator
+
+    def instrument_methods(self, cls, names, metric, label):
+        """
+        Wraps the named methods of `cls` in place (e.g. every store command).
+        Already-instrumented methods are left alone.
+        """
+        for method in names:
+            fn = getattr(cls, method, None)
+            if fn is None or getattr(fn, "_instrumented", False):
+                continue
+            wrapped = self.timed(metric, **{label: method})(fn)
+            wrapped._instrumented = True
+            setattr(cls, method, wrapped)
+
+    def gauge(self, name, help_text, fn):
+        self.gauges[name] = (help_text, fn)
+
+    def _format_labels(self, labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        body = ",".join(f'{k}="{str(v)}"' for k, v in pairs)
+        return "{" + body + "}"
+
+    def render(self):
+        """
+        Returns: Prometheus text exposition (version 0.0.4)
+        """
+        lines = []
+        for name, series in sorted(self.histograms.items()):
+            if name in self.help:
+                lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.bounds, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{self._format_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_bucket{self._format_labels(labels, [('le', '+Inf')])} {histogram.count}")
+                lines.append(f"{name}_sum{self._format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{self._format_labels(labels)} {histogram.count}")
+
+        for name, (help_text, fn) in sorted(self.gauges.items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            try:
+                value = fn()
+            except Exception:
+                continue
+            if isinstance(value, dict):
+                for labels, v in sorted(value.items()):
+                    lines.append(f"{name}{self._format_labels(labels)} {v}")
+            else:
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+# Scope key under which RequestLatencyMiddleware leaves a dict for TimedRoute to fill.
+# The router hands routes a copy of the scope, so the middleware never sees
+# keys added below it - but both copies share this dict.
+ROUTE_SCOPE_KEY = "metrics.route"
+
+class TimedRoute(APIRoute):
+    """
+    route_class for every router: records the matched route template for
+    RequestLatencyMiddleware before handling the request.
+    """
+    async def handle(self, scope, receive, send):
+        matched = scope.get(ROUTE_SCOPE_KEY)
+        if matched is not None:
+            matched["path"] = self.path
+            # Routes inside an included router only know their own suffix
+            # ("/me"); the include context carries the full template.
+            context = _effective_route_context(scope)
+            if context is not None and context.original_route is self:
+                matched["path"] = getattr(context.starlette_route, "path_format", None) or context.path_format
+        await super().handle(scope, receive, send)
+
+class RequestLatencyMiddleware:
+    """
+    Plain ASGI middleware (no BaseHTTPMiddleware task hop) recording
+    http_request_seconds{method, route}. The route template (set by
+    TimedRoute), not the raw path, is used so the label set stays bounded.
+    """
+    def __init__(self, app, registry=None):
+        self.app = app
+        self.registry = registry or metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        matched = scope[ROUTE_SCOPE_KEY] = {}
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            path = matched.get("path", "unmatched")
+            self.registry.observe("http_request_seconds", (("method", scope["method"]), ("route", path)),
+                                  time.perf_counter() - started)
+
+# Singleton
+metrics = MetricsRegistry()
+metrics.describe("agent_call_seconds", "Agent method latency")
+metrics.describe("store_command_seconds", "Session store command latency")
+metrics.describe("socket_event_seconds", "Socket.IO event handler latency")
+metrics.describe("http_request_seconds", "HTTP request latency by route")
+metrics.describe("jwt_operation_seconds", "JWT signing and verification latency")
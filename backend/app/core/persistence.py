@@ -0,0 +1,393 @@
+import asyncio
+import gc
+import heapq
+import logging
+import marshal
+import mmap
+import os
+import struct
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Durability for InMemoryRedisClient: periodic snapshots + an append-only log.
+#
+# Every mutating command appends a small record to an in-memory journal (a list
+# append on the event loop). A background task swaps the journal out and writes
+# it to the current log generation in a worker thread. A snapshot opens a new
+# generation, then walks the keyspace in chunks (copied on the loop, encoded and
+# written in a thread) and finally replaces `store.snap`, after which older
+# generations are deleted. The snapshot is fuzzy, but every log record sets an
+# absolute value (hincrby is logged as the resulting field value, expire as a
+# deadline), so replaying the log over it converges on the live state.
+#
+# Off unless STORE_PERSIST_DIR is set (a relative path resolves against backend/).
+#
+# Both files are sequences of frames: <u32 length><u32 crc32><marshal payload>.
+# A torn or corrupt frame ends the read; everything before it is kept.
+#
+#   <STORE_PERSIST_DIR>/store.snap          header frame, then lists of snapshot entries
+#   <STORE_PERSIST_DIR>/store-<gen>.aof     lists of log records
+#
+# Log records: ("S", key, value) ("H", key, mapping) ("A", key, member)
+#              ("R", key, member) ("D", key) ("E", key, deadline) - deadline 0 = TTL removed
+# Snapshot entries: (kind, key, deadline, payload), kind "s" string / "h" hash / "z" set
+
+SNAPSHOT_NAME = "store.snap"
+AOF_PREFIX = "store-"
+AOF_SUFFIX = ".aof"
+FORMAT = "agentic-store/1"
+FRAME = struct.Struct("<II")
+
+def pack_frame(payload):
+    data = marshal.dumps(payload)
+    return FRAME.pack(len(data), zlib.crc32(data)) + data
+
+def read_frames(path):
+    """
+    Yields decoded frames from a snapshot or log file via mmap.
+    Stops at the first short or corrupt frame (torn write at crash time).
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                pos, end = 0, len(mm)
+                while pos + FRAME.size <= end:
+                    length, crc = FRAME.unpack_from(mm, pos)
+                    with view[pos + FRAME.size:pos + FRAME.size + length] as body:
+                        if len(body) < length or zlib.crc32(body) != crc:
+                            logger.warning(f"⚠️ [Store] Truncated frame in {os.path.basename(path)} at byte {pos}")
+                            return
+                        frame = marshal.loads(body)
+                    yield frame
+                    pos += FRAME.size + length
+            finally:
+                view.release()
+
+def aof_generation(name):
+    """
+    Returns: generation number of a log file name, or None
+    """
+    if not (name.startswith(AOF_PREFIX) and name.endswith(AOF_SUFFIX)):
+        return None
+    try:
+        return int(name[len(AOF_PREFIX):-len(AOF_SUFFIX)])
+    except ValueError:
+        return None
+
+class StorePersistence:
+    def __init__(self, client, directory, snapshot_interval=300, flush_interval=1.0,
+                 chunk_size=10000, fsync=True):
+        self.client = client
+        self.directory = directory
+        self.snapshot_interval = snapshot_interval
+        self.flush_interval = flush_interval
+        self.chunk_size = chunk_size
+        self.fsync = fsync
+        self.generation = 0
+        self._aof = None
+        self._aof_generation = None
+        self._task = None
+        self._stopping = None
+        self._snapshot_lock = None
+        self.stats = {
+            "loaded_keys": 0, "replayed_records": 0, "skipped_records": 0, "load_ms": 0.0,
+            "logged_records": 0, "aof_bytes": 0, "snapshots": 0, "last_snapshot_keys": 0,
+            "last_snapshot_ms": 0.0, "last_snapshot_at": 0.0,
+        }
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def aof_path(self, generation):
+        return self.path(f"{AOF_PREFIX}{generation:08d}{AOF_SUFFIX}")
+
+    def _generations(self):
+        found = []
+        for name in os.listdir(self.directory):
+            generation = aof_generation(name)
+            if generation is not None:
+                found.append(generation)
+        return sorted(found)
+
+    # --- Startup ---
+
+    def load(self):
+        """
+        Rebuilds the client's keyspace from the snapshot and the log tail.
+        The tail is decoded first so snapshot keys it deletes, or whose TTL
+        expired with no later extension, are never materialised; tail records
+        for keys that end up dead are skipped too.
+        Returns: number of live keys loaded
+        """
+        if not self.enabled:
+            return 0
+        os.makedirs(self.directory, exist_ok=True)
+        started = time.perf_counter()
+        gc_was_enabled = gc.isenabled()
+        gc.disable() # millions of container allocations, none of them cyclic
+        try:
+            snapshot_path = self.path(SNAPSHOT_NAME)
+            frames = read_frames(snapshot_path) if os.path.exists(snapshot_path) else iter(())
+            header = next(frames, None)
+            base_generation = 0
+            if header is not None:
+                if not (isinstance(header, dict) and header.get("format") == FORMAT):
+                    logger.error(f"❌ [Store] Unrecognised snapshot {snapshot_path}, ignoring it")
+                    frames = iter(())
+                else:
+                    base_generation = header["generation"]
+
+            generations = [g for g in self._generations() if g >= base_generation]
+            records = []
+            for generation in generations:
+                for batch in read_frames(self.aof_path(generation)):
+                    records.extend(batch)
+
+            # Final fate of every key the tail touches: deadline (0 = no TTL) or None if deleted
+            final = {}
+            for record in reversed(records):
+                op, key = record[0], record[1]
+                if key in final:
+                    continue
+                if op == "E":
+                    final[key] = record[2]
+                elif op == "D":
+                    final[key] = None
+
+            now = time.time()
+            loaded = self._load_snapshot(frames, final, now)
+            replayed, skipped = self._replay(records, final, now)
+            self.generation = max(generations[-1] if generations else 0, base_generation) + 1
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+        client = self.client
+        client._expiry_heap[:] = [(deadline, key) for key, deadline in client._ttls.items()]
+        heapq.heapify(client._expiry_heap)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        live = len(client._store) + len(client._hash_store) + len(client._set_store)
+        self.stats.update(loaded_keys=live, replayed_records=replayed, skipped_records=skipped, load_ms=elapsed_ms)
+        logger.info(f"✅ [Store] Restored {live} keys ({loaded} from snapshot, {replayed} log records) in {elapsed_ms:.0f} ms")
+        return live
+
+    def _load_snapshot(self, frames, final, now):
+        client = self.client
+        stores = {"s": client._store, "h": client._hash_store, "z": client._set_store}
+        ttls = client._ttls
+        loaded = 0
+        for entries in frames:
+            live = []
+            for kind, key, deadline, payload in entries:
+                if key in final:
+                    fate = final[key]
+                    if fate is None or (fate and fate <= now):
+                        continue
+                    deadline = fate
+                elif deadline and deadline <= now:
+                    continue
+                if kind == "h":
+                    payload = client._new_hash(key, payload)
+                stores[kind][key] = payload
+                if deadline:
+                    ttls[key] = deadline
+                live.append(key)
+            client._index_add_many(live)
+            loaded += len(live)
+        return loaded
+
+    def _replay(self, records, final, now):
+        client = self.client
+        replayed = skipped = 0
+        for record in records:
+            op, key = record[0], record[1]
+            fate = final.get(key, 0)
+            if fate is None or (fate and fate <= now):
+                skipped += 1
+                continue
+            replayed += 1
+            if op == "E":
+                if record[2]:
+                    client._ttls[key] = record[2]
+                else:
+                    client._ttls.pop(key, None)
+            elif op == "D":
+                client._remove_key(key)
+            elif op == "S":
+                if key not in client._store:
+                    client._index_add(key)
+                client._store[key] = record[2]
+            elif op == "H":
+                if key not in client._hash_store:
+                    client._hash_store[key] = client._new_hash(key)
+                    client._index_add(key)
+                client._hash_store[key].update(record[2])
+            elif op == "A":
+                if key not in client._set_store:
+                    client._set_store[key] = set()
+                    client._index_add(key)
+                client._set_store[key].add(record[2])
+            elif op == "R":
+                members = client._set_store.get(key)
+                if members is not None:
+                    members.discard(record[2])
+                    if not members:
+                        client._remove_key(key)
+        return replayed, skipped
+
+    # --- Background writer ---
+
+    def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._snapshot_lock = asyncio.Lock()
+        self._stopping = asyncio.Event()
+        self.client._journal = []
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logger.info(f"✅ [Store] Persisting to {self.directory} (log generation {self.generation})")
+
+    async def stop(self):
+        """
+        Flushes the journal and writes a final snapshot, so a clean restart
+        replays an empty log. The writer finishes its in-flight flush or
+        snapshot first; cancelling it would leave a thread write racing these.
+        """
+        task, self._task = self._task, None
+        if task is None:
+            return
+        self._stopping.set()
+        await task
+        try:
+            await self.snapshot()
+        finally:
+            await self.flush()
+            await asyncio.to_thread(self._close_aof)
+            self.client._journal = None
+
+    async def _run(self):
+        next_snapshot = time.monotonic() + self.snapshot_interval
+        while True:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.flush_interval)
+                return # stop() does the final flush and snapshot
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+                if time.monotonic() >= next_snapshot:
+                    await self.snapshot()
+                    next_snapshot = time.monotonic() + self.snapshot_interval
+            except Exception as e:
+                logger.error(f"❌ [Store] Persistence failed: {e}")
+
+    async def flush(self):
+        """
+        Writes journaled records to the current log generation.
+        Returns: number of records written
+        """
+        journal = self.client._journal
+        if not journal:
+            return 0
+        self.client._journal = []
+        await asyncio.to_thread(self._append, self.generation, journal)
+        self.stats["logged_records"] += len(journal)
+        return len(journal)
+
+    async def snapshot(self):
+        """
+        Writes a new snapshot without blocking the loop for more than one
+        chunk copy at a time, then drops the log generations it covers.
+        Returns: number of keys written
+        """
+        async with self._snapshot_lock:
+            started = time.perf_counter()
+            await self.flush()
+            # Records from here on belong to the new generation the snapshot starts from
+            base_generation = self.generation + 1
+            self.generation = base_generation
+            tmp_path = self.path(SNAPSHOT_NAME + ".tmp")
+            header = {"format": FORMAT, "generation": base_generation, "created": time.time()}
+            out = await asyncio.to_thread(open, tmp_path, "wb")
+            written = 0
+            try:
+                await asyncio.to_thread(out.write, pack_frame(header))
+                client = self.client
+                # Hashes and sets are copied (session rows become plain dicts)
+                for kind, store, copy in (("s", client._store, False),
+                                          ("h", client._hash_store, True),
+                                          ("z", client._set_store, True)):
+                    keys = list(store)
+                    for start in range(0, len(keys), self.chunk_size):
+                        entries = []
+                        now = time.time()
+                        for key in keys[start:start + self.chunk_size]:
+                            value = store.get(key)
+                            if value is None:
+                                continue
+                            deadline = client._ttls.get(key, 0)
+                            if deadline and deadline <= now:
+                                continue
+                            entries.append((kind, key, deadline, value.copy() if copy else value))
+                        if entries:
+                            await asyncio.to_thread(out.write, pack_frame(entries))
+                            written += len(entries)
+                await asyncio.to_thread(self._commit_snapshot, out, tmp_path)
+            except BaseException:
+                await asyncio.to_thread(out.close)
+                raise
+            await asyncio.to_thread(self._drop_generations_before, base_generation)
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.stats.update(last_snapshot_keys=written, last_snapshot_ms=elapsed_ms, last_snapshot_at=time.time())
+            self.stats["snapshots"] += 1
+            logger.info(f"💾 [Store] Snapshot of {written} keys in {elapsed_ms:.0f} ms")
+            return written
+
+    # --- worker thread side ---
+
+    def _append(self, generation, records):
+        if self._aof is None or self._aof_generation != generation:
+            self._close_aof()
+            self._aof = open(self.aof_path(generation), "ab")
+            self._aof_generation = generation
+        data = pack_frame(records)
+        self._aof.write(data)
+        self._aof.flush()
+        if self.fsync:
+            os.fsync(self._aof.fileno())
+        self.stats["aof_bytes"] += len(data)
+
+    def _close_aof(self):
+        if self._aof is not None:
+            self._aof.close()
+            self._aof = None
+            self._aof_generation = None
+
+    def _commit_snapshot(self, out, tmp_path):
+        out.flush()
+        if self.fsync:
+            os.fsync(out.fileno())
+        out.close()
+        os.replace(tmp_path, self.path(SNAPSHOT_NAME))
+
+    def _drop_generations_before(self, generation):
+        if self._aof_generation is not None and self._aof_generation < generation:
+            self._close_aof()
+        for old in self._generations():
+            if old < generation:
+                os.remove(self.aof_path(old))
+
+    def get_metrics(self):
+        journal = self.client._journal
+        return {**self.stats, "enabled": self.enabled, "generation": self.generation,
+                "journal_depth": len(journal) if journal else 0}
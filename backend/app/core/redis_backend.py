@@ -0,0 +1,318 @@
+import asyncio
+import logging
+import redis.asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+# Commands that implicitly refresh the key TTL in InMemoryRedisClient.
+# The real backend mirrors that so both behave the same for the agents.
+TTL_REFRESHING_COMMANDS = {"hset", "hincrby", "sadd"}
+
+# HSET that never creates the hash: KEYS[1] hash, ARGV[1] TTL, ARGV[2..] field/value pairs
+HSET_IF_EXISTS_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+class RedisPipeline:
+    """
+    Wraps a redis-py pipeline with the InMemoryPipeline surface.
+    A logical command may expand to several Redis commands (e.g. hset + expire);
+    execute() returns one result per logical command.
+    """
+    COMMANDS = {
+        "hset", "hset_if_exists", "hgetall", "hincrby", "hget", "expire", "persist", "delete", "keys",
+        "get", "set", "setex", "exists", "sadd", "smembers", "scard", "srem",
+        "publish",
+    }
+
+    def __init__(self, backend, transaction=True):
+        self.backend = backend
+        self._pipe = backend.redis.pipeline(transaction=transaction)
+        self._groups = [] # (command name, number of raw commands queued)
+
+    def __getattr__(self, name):
+        if name not in self.COMMANDS:
+            raise AttributeError(f"Pipeline does not support '{name}'")
+
+        def queue(*args, **kwargs):
+            self._groups.append((name, self.backend._queue(self._pipe, name, *args, **kwargs)))
+            return self
+        return queue
+
+    def __len__(self):
+        return len(self._groups)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.reset()
+
+    async def reset(self):
+        self._groups = []
+        await self._pipe.reset()
+
+    async def execute(self, raise_on_error=True):
+        groups, self._groups = self._groups, []
+        raw = await self._pipe.execute(raise_on_error=raise_on_error)
+        results = []
+        pos = 0
+        for name, width in groups:
+            results.append(self.backend._convert(name, raw[pos]))
+            pos += width
+        return results
+
+class RedisBackendClient:
+    """
+    Pooled async Redis client exposing the InMemoryRedisClient method surface.
+    Selected by create_redis_client() when settings.REDIS_URL is set.
+    """
+    session_table = None # sessions stay plain Redis hashes
+
+    def __init__(self, url=None, max_connections=50, client=None):
+        if client is None:
+            # Blocking pool: under bursts callers wait for a free connection
+            # instead of failing with "Too many connections"
+            self.pool = aioredis.BlockingConnectionPool.from_url(
+                url, max_connections=max_connections, timeout=10, decode_responses=True
+            )
+            client = aioredis.Redis(connection_pool=self.pool)
+        else:
+            self.pool = client.connection_pool
+        self.redis = client
+        self.SESSION_TTL = 300
+        self._hset_if_exists = client.register_script(HSET_IF_EXISTS_SCRIPT)
+        self._subscribers = {} # channel -> [handler(message)]
+        self._listener_task = None
+        # Bumped on every (re)subscribe: subscribers that cache published state
+        # compare it to detect a gap in which messages may have been lost
+        self.pubsub_live = False
+        self.pubsub_generation = 0
+        logger.info(f"✅ [Core] Redis Backend Initialized (pool size {max_connections})")
+
+    def get_client(self):
+        return self
+
+    def session_key(self, user_id, session_id):
+        return f"session:{user_id}:{session_id}"
+
+    def pipeline(self, transaction=True):
+        return RedisPipeline(self, transaction=transaction)
+
+    def register_script(self, script):
+        # Server-side Lua (EVALSHA with EVAL fallback), for atomic read-modify-write
+        return self.redis.register_script(script)
+
+    async def close(self):
+        """
+        Releases the connection pool; the last shutdown step.
+        """
+        await self.redis.aclose()
+
+    # Redis expires keys natively; these keep the lifecycle hooks uniform
+    def start_sweeper(self):
+        return None
+
+    async def stop_sweeper(self):
+        return None
+
+    # Redis persists on its own (RDB/AOF)
+    def restore(self):
+        return 0
+
+    def start_persistence(self):
+        return None
+
+    async def stop_persistence(self):
+        return None
+
+    # Pub/Sub (one listener connection per worker, dispatching to local handlers)
+    def subscribe(self, channel, handler):
+        new_channel = channel not in self._subscribers
+        self._subscribers.setdefault(channel, []).append(handler)
+        if new_channel and self._listener_task is not None:
+            # Resubscribe the listener so it picks up the new channel
+            self._listener_task.cancel()
+            self._listener_task = None
+            self.start_pubsub()
+
+    def unsubscribe(self, channel, handler):
+        handlers = self._subscribers.get(channel, [])
+        if handler in handlers:
+            handlers.remove(handler)
+
+    async def publish(self, channel, message):
+        return await self.redis.publish(channel, message)
+
+    def start_pubsub(self):
+        if self._subscribers and (self._listener_task is None or self._listener_task.done()):
+            self._listener_task = asyncio.get_running_loop().create_task(self._listen())
+        return self._listener_task
+
+    async def stop_pubsub(self):
+        task, self._listener_task = self._listener_task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _listen(self):
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(*self._subscribers.keys())
+                self.pubsub_generation += 1
+                self.pubsub_live = True
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    for handler in list(self._subscribers.get(message["channel"], ())):
+                        try:
+                            handler(message["data"])
+                        except Exception as e:
+                            logger.error(f"❌ [Core] Subscriber on {message['channel']} failed: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ [Core] Pub/Sub listener lost ({e}), reconnecting")
+                await asyncio.sleep(1.0)
+            finally:
+                self.pubsub_live = False
+                await pubsub.aclose()
+
+    def get_sweep_stats(self):
+        return {"backend": "redis", "pool_max_connections": self.pool.max_connections}
+
+    # Command translation
+    def _queue(self, pipe, name, *args, **kwargs):
+        """
+        Queues one logical command on a redis-py pipeline.
+        Returns: number of raw Redis commands queued
+        """
+        if name == "hset":
+            key, mapping = args
+            pipe.hset(key, mapping=mapping)
+        elif name == "expire":
+            key = args[0]
+            ttl = args[1] if len(args) > 1 else kwargs.get("ttl")
+            pipe.expire(key, self._ttl_seconds(ttl))
+            return 1
+        elif name == "set":
+            key, value = args[0], args[1]
+            ex = args[2] if len(args) > 2 else kwargs.get("ex")
+            pipe.set(key, value, ex=self._ttl_seconds(ex))
+            return 1
+        elif name == "setex":
+            key, ttl, value = args
+            pipe.setex(key, self._ttl_seconds(ttl), value)
+            return 1
+        elif name == "delete":
+            pipe.delete(*args)
+            return 1
+        elif name == "hset_if_exists":
+            # Existence check + write + TTL refresh in one server-side step
+            key, mapping = args
+            fields = [item for pair in mapping.items() for item in pair]
+            pipe.scripts.add(self._hset_if_exists)
+            pipe.evalsha(self._hset_if_exists.sha, 1, key, self.SESSION_TTL, *fields)
+            return 1
+        else:
+            getattr(pipe, name)(*args, **kwargs)
+
+        if name in TTL_REFRESHING_COMMANDS:
+            pipe.expire(args[0], self.SESSION_TTL)
+            return 2
+        return 1
+
+    def _convert(self, name, result):
+        if name == "exists" or name == "hset_if_exists":
+            return bool(result)
+        if name == "smembers":
+            return set(result)
+        return result
+
+    def _ttl_seconds(self, ttl):
+        if ttl is None:
+            return self.SESSION_TTL
+        if hasattr(ttl, 'total_seconds'):
+            ttl = ttl.total_seconds()
+        # Redis TTLs are whole seconds and must be positive
+        return max(1, int(ttl + 0.999))
+
+    async def _run(self, name, *args, **kwargs):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            self._queue(pipe, name, *args, **kwargs)
+            raw = await pipe.execute()
+        return self._convert(name, raw[0])
+
+    # Hash Operations
+    async def hset(self, key, mapping):
+        await self._run("hset", key, mapping)
+
+    async def hset_if_exists(self, key, mapping):
+        return await self._run("hset_if_exists", key, mapping)
+
+    async def hgetall(self, key):
+        return await self.redis.hgetall(key)
+
+    async def hincrby(self, key, field, amount=1):
+        return await self._run("hincrby", key, field, amount)
+
+    async def hget(self, key, field):
+        return await self.redis.hget(key, field)
+
+    async def expire(self, key, ttl=None):
+        await self.redis.expire(key, self._ttl_seconds(ttl))
+
+    async def persist(self, key):
+        await self.redis.persist(key)
+
+    async def delete(self, key):
+        await self.redis.delete(key)
+
+    async def keys(self, pattern):
+        return [key async for key in self.redis.scan_iter(match=pattern, count=500)]
+
+    async def scan(self, cursor=0, match="*", count=10):
+        return await self.redis.scan(cursor=cursor, match=match, count=count)
+
+    async def scan_iter(self, match="*", count=10):
+        async for key in self.redis.scan_iter(match=match, count=count):
+            yield key
+
+    # Simple KV Operations
+    async def get(self, key):
+        return await self.redis.get(key)
+
+    async def set(self, key, value, ex=None):
+        await self.redis.set(key, value, ex=self._ttl_seconds(ex))
+
+    async def setex(self, key, time, value):
+        await self.redis.setex(key, self._ttl_seconds(time), value)
+
+    async def exists(self, key):
+        return bool(await self.redis.exists(key))
+
+    # Set Operations
+    async def sadd(self, key, member):
+        await self._run("sadd", key, member)
+
+    async def smembers(self, key):
+        return set(await self.redis.smembers(key))
+
+    async def scard(self, key):
+        return await self.redis.scard(key)
+
+    async def srem(self, key, member):
+        await self.redis.srem(key, member)
+
+# Bottom import: redis_client loads this module lazily from create_redis_client()
+from app.core.redis_client import instrument_store
+instrument_store(RedisBackendClient, RedisPipeline)
@@ -1,55 +1,396 @@
 import os
 import json
 import time
+import heapq
+import asyncio
 import fnmatch
+import logging
+from collections import OrderedDict
+from app.core.config import settings, resolve_path
+from app.core.metrics import metrics
+from app.core.persistence import StorePersistence
+from app.core.sessions import SessionTable, SessionRecord, SESSION_PREFIX
+
+logger = logging.getLogger(__name__)
+
+GLOB_CHARS = "*?["
+
+def key_namespaces(key):
+    """
+    Yields every ':'-terminated prefix of a key.
+    'session:u1:abc' -> 'session:', 'session:u1:'
+    """
+    idx = key.find(":")
+    while idx != -1:
+        yield key[:idx + 1]
+        idx = key.find(":", idx + 1)
+
+def pattern_namespace(pattern):
+    """
+    Returns the longest ':'-terminated literal prefix of a glob pattern,
+    or '' if the pattern starts with a wildcard.
+    """
+    literal_end = len(pattern)
+    for ch in GLOB_CHARS:
+        pos = pattern.find(ch)
+        if pos != -1:
+            literal_end = min(literal_end, pos)
+    return pattern[:pattern.rfind(":", 0, literal_end) + 1]
+
+class InMemoryPipeline:
+    """
+    MULTI/EXEC style batch for InMemoryRedisClient.
+    Command methods queue and return the pipeline (like redis-py), and
+    execute() runs the queue in one step. None of the client's commands
+    suspend, so the queued commands run back-to-back without any other
+    task observing a half-applied batch.
+    """
+    COMMANDS = {
+        "hset", "hset_if_exists", "hgetall", "hincrby", "hget", "expire", "persist", "delete", "keys",
+        "get", "set", "setex", "exists", "sadd", "smembers", "scard", "srem",
+        "publish",
+    }
+
+    def __init__(self, client, transaction=True):
+        self.client = client
+        self.transaction = transaction
+        self.command_stack = []
+
+    def __getattr__(self, name):
+        if name not in self.COMMANDS:
+            raise AttributeError(f"Pipeline does not support '{name}'")
+        command = getattr(self.client, name)
+
+        def queue(*args, **kwargs):
+            self.command_stack.append((command, args, kwargs))
+            return self
+        return queue
+
+    def __len__(self):
+        return len(self.command_stack)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.reset()
+
+    def reset(self):
+        self.command_stack = []
+
+    async def execute(self, raise_on_error=True):
+        """
+        Runs every queued command in order.
+        Like Redis EXEC, a failing command does not stop the others.
+        Returns: list of command results
+        """
+        stack, self.command_stack = self.command_stack, []
+        results = []
+        for command, args, kwargs in stack:
+            try:
+                results.append(await command(*args, **kwargs))
+            except Exception as e:
+                results.append(e)
+        if raise_on_error:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        return results
 
 class InMemoryRedisClient:
     _instance = None
     _store = {} # Key -> Value
-    _hash_store = {} # Key -> { field: value }
+    _hash_store = {} # Key -> { field: value }, or SessionRecord for session:* keys
+    _session_table = SessionTable() # Columnar rows behind every SessionRecord
     _set_store = {} # Key -> Set()
     _ttls = {} # Key -> Expiry Timestamp
+    _expiry_heap = [] # Min-heap of (deadline, key), may hold stale entries
+    _prefix_index = {} # Namespace prefix -> Set(keys), see key_namespaces()
+    # Publishes are delivered in-process, so no message can ever be missed
+    pubsub_live = True
+    pubsub_generation = 0
+
+    # Background sweeper tuning
+    SWEEP_INTERVAL = 1.0 # seconds between ticks
+    SWEEP_BATCH = 1000 # max keys reclaimed per tick
+    MAX_SCANS = 1024 # open SCAN cursors kept, least recently used dropped first
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(InMemoryRedisClient, cls).__new__(cls)
             cls._instance.SESSION_TTL = 300 
-            print("✅ [Core] In-Memory Redis Mock Initialized (Async Mode)")
+            cls._instance._sweeper_task = None
+            cls._instance._subscribers = {} # channel -> [handler(message)]
+            cls._instance._scans = OrderedDict() # SCAN cursor -> (candidate snapshot, position)
+            cls._instance._scan_cursor = 0
+            cls._instance._journal = None # pending log records while persistence runs
+            cls._instance.persistence = StorePersistence(
+                cls._instance,
+                resolve_path(settings.STORE_PERSIST_DIR),
+                snapshot_interval=settings.STORE_SNAPSHOT_INTERVAL,
+                flush_interval=settings.STORE_AOF_FLUSH_INTERVAL,
+                fsync=settings.STORE_FSYNC,
+            )
+            cls._instance.sweep_stats = {
+                "ticks": 0,
+                "keys_reclaimed": 0,
+                "last_reclaimed": 0,
+                "last_sweep_ms": 0.0,
+                "max_sweep_ms": 0.0,
+            }
+            logger.info("✅ [Core] In-Memory Redis Mock Initialized (Async Mode)")
         return cls._instance
 
     def get_client(self):
         return self
 
+    @property
+    def session_table(self):
+        return self._session_table
+
     def session_key(self, user_id, session_id):
         return f"session:{user_id}:{session_id}"
 
+    def pipeline(self, transaction=True):
+        return InMemoryPipeline(self, transaction=transaction)
+
+    def _log(self, *record):
+        # Appended on the loop, written to the command log by the persistence task
+        if self._journal is not None:
+            self._journal.append(record)
+
+    def _is_expired(self, key, now=None):
+        deadline = self._ttls.get(key)
+        if deadline is None:
+            return False
+        return (now or time.time()) > deadline
+
+    def _index_add(self, key):
+        for ns in key_namespaces(key):
+            bucket = self._prefix_index.get(ns)
+            if bucket is None:
+                self._prefix_index[ns] = bucket = set()
+            bucket.add(key)
+
+    def _index_add_many(self, keys):
+        # Bulk form of _index_add for restores, without the per-key generator
+        index = self._prefix_index
+        for key in keys:
+            idx = key.find(":")
+            while idx != -1:
+                ns = key[:idx + 1]
+                bucket = index.get(ns)
+                if bucket is None:
+                    index[ns] = bucket = set()
+                bucket.add(key)
+                idx = key.find(":", idx + 1)
+
+    def _index_discard(self, key):
+        for ns in key_namespaces(key):
+            bucket = self._prefix_index.get(ns)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._prefix_index[ns]
+
+    def _new_hash(self, key, mapping=None):
+        """
+        Returns: a SessionRecord row for session keys, otherwise a plain dict
+        (`mapping` itself when given)
+        """
+        if key.startswith(SESSION_PREFIX):
+            record = self._session_table.record(key)
+            if record is not None:
+                if mapping:
+                    record.update(mapping)
+                return record
+        return mapping if mapping is not None else {}
+
+    def _remove_key(self, key):
+        found = False
+        for store in (self._store, self._set_store):
+            if store.pop(key, None) is not None:
+                found = True
+        value = self._hash_store.pop(key, None)
+        if value is not None:
+            found = True
+            if type(value) is SessionRecord:
+                value.release()
+        self._ttls.pop(key, None)
+        if found:
+            self._index_discard(key)
+
+    def _candidate_keys(self, pattern):
+        """
+        Narrows a glob pattern down to the keys that could match it.
+        Uses the namespace index when the pattern has a literal prefix,
+        otherwise falls back to every key.
+        """
+        if not any(ch in pattern for ch in GLOB_CHARS):
+            return [pattern] if self._key_present(pattern) else []
+        ns = pattern_namespace(pattern)
+        if ns:
+            return list(self._prefix_index.get(ns, ()))
+        return list(self._store.keys()) + list(self._hash_store.keys()) + list(self._set_store.keys())
+
+    def _key_present(self, key):
+        return key in self._store or key in self._hash_store or key in self._set_store
+
     async def _check_expiry(self, key):
-        if key in self._ttls:
-            if time.time() > self._ttls[key]:
-                await self.delete(key)
-                return True
+        if self._is_expired(key):
+            self._remove_key(key)
+            return True
         return False
 
+    # Expiry Sweeper
+    def sweep_expired(self, max_keys=None):
+        """
+        Reclaims up to max_keys expired keys from the expiry heap.
+        Heap entries whose deadline no longer matches _ttls are stale
+        (key was re-expired or deleted) and are dropped without counting.
+        Returns: number of keys reclaimed
+        """
+        if max_keys is None:
+            max_keys = self.SWEEP_BATCH
+        started = time.perf_counter()
+        now = time.time()
+        heap = self._expiry_heap
+        reclaimed = 0
+
+        while heap and reclaimed < max_keys and heap[0][0] < now:
+            deadline, key = heapq.heappop(heap)
+            if self._ttls.get(key) != deadline:
+                continue
+            self._remove_key(key)
+            reclaimed += 1
+
+        # Refreshed TTLs leave stale heap entries behind; rebuild once they dominate
+        if len(heap) > 2 * len(self._ttls) + self.SWEEP_BATCH:
+            heap[:] = [(deadline, key) for key, deadline in self._ttls.items()]
+            heapq.heapify(heap)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        stats = self.sweep_stats
+        stats["ticks"] += 1
+        stats["keys_reclaimed"] += reclaimed
+        stats["last_reclaimed"] = reclaimed
+        stats["last_sweep_ms"] = elapsed_ms
+        stats["max_sweep_ms"] = max(stats["max_sweep_ms"], elapsed_ms)
+        return reclaimed
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.SWEEP_INTERVAL)
+            try:
+                self.sweep_expired()
+            except Exception as e:
+                logger.error(f"❌ [Core] Expiry sweep failed: {e}")
+
+    def start_sweeper(self):
+        if self._sweeper_task is None or self._sweeper_task.done():
+            self._sweeper_task = asyncio.get_running_loop().create_task(self._sweep_loop())
+        return self._sweeper_task
+
+    async def stop_sweeper(self):
+        task, self._sweeper_task = self._sweeper_task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def close(self):
+        # In-process: no connections to release
+        return None
+
+    # Pub/Sub (in-process: handlers run synchronously on publish)
+    def subscribe(self, channel, handler):
+        self._subscribers.setdefault(channel, []).append(handler)
+
+    def unsubscribe(self, channel, handler):
+        handlers = self._subscribers.get(channel, [])
+        if handler in handlers:
+            handlers.remove(handler)
+
+    async def publish(self, channel, message):
+        handlers = list(self._subscribers.get(channel, ()))
+        for handler in handlers:
+            try:
+                handler(message)
+            except Exception as e:
+                logger.error(f"❌ [Core] Subscriber on {channel} failed: {e}")
+        return len(handlers)
+
+    def start_pubsub(self):
+        return None
+
+    async def stop_pubsub(self):
+        return None
+
+    # Persistence (snapshot + command log, see app/core/persistence.py)
+    def restore(self):
+        return self.persistence.load()
+
+    def start_persistence(self):
+        self.persistence.start()
+
+    async def stop_persistence(self):
+        await self.persistence.stop()
+
+    def get_sweep_stats(self):
+        return {
+            **self.sweep_stats,
+            "live_keys": len(self._store) + len(self._hash_store) + len(self._set_store),
+            "tracked_ttls": len(self._ttls),
+            "heap_size": len(self._expiry_heap),
+            "session_table": self._session_table.get_metrics(),
+            "persistence": self.persistence.get_metrics(),
+        }
+
     # Hash Operations
     async def hset(self, key, mapping):
         await self._check_expiry(key)
         if key not in self._hash_store:
-            self._hash_store[key] = {}
+            self._hash_store[key] = self._new_hash(key)
+            self._index_add(key)
         self._hash_store[key].update(mapping)
+        self._log("H", key, dict(mapping))
         await self.expire(key, self.SESSION_TTL)
 
+    async def hset_if_exists(self, key, mapping):
+        """
+        HSET that never creates the hash (refreshes its TTL like hset).
+        Returns: True if the hash existed and was written
+        """
+        if await self._check_expiry(key) or key not in self._hash_store:
+            return False
+        await self.hset(key, mapping)
+        return True
+
     async def hgetall(self, key):
         if await self._check_expiry(key): return {}
-        return self._hash_store.get(key, {})
+        data = self._hash_store.get(key)
+        if data is None:
+            return {}
+        return data.to_dict() if type(data) is SessionRecord else data
     
     async def hincrby(self, key, field, amount=1):
         await self._check_expiry(key)
         if key not in self._hash_store:
-            self._hash_store[key] = {}
+            self._hash_store[key] = self._new_hash(key)
+            self._index_add(key)
         
-        current = int(self._hash_store[key].get(field, 0))
-        new_val = current + amount
-        self._hash_store[key][field] = str(new_val)
+        data = self._hash_store[key]
+        if type(data) is SessionRecord:
+            # Typed column: no parse/format round trip
+            new_val = data.incr(field, amount)
+            self._log("H", key, {field: new_val})
+        else:
+            current = int(data.get(field, 0))
+            new_val = current + amount
+            data[field] = str(new_val)
+            self._log("H", key, {field: str(new_val)})
         await self.expire(key, self.SESSION_TTL)
         return new_val
         
@@ -60,19 +401,68 @@ class InMemoryRedisClient:
     async def expire(self, key, ttl=None):
         if ttl is None:
             ttl = self.SESSION_TTL
-        self._ttls[key] = time.time() + ttl
+        deadline = time.time() + ttl
+        self._ttls[key] = deadline
+        heapq.heappush(self._expiry_heap, (deadline, key))
+        self._log("E", key, deadline)
+
+    async def persist(self, key):
+        # Drops the key's TTL (its heap entry goes stale); 0 = no TTL in the log
+        if self._ttls.pop(key, None) is not None:
+            self._log("E", key, 0)
 
     async def delete(self, key):
-        if key in self._store: del self._store[key]
-        if key in self._hash_store: del self._hash_store[key]
-        if key in self._set_store: del self._set_store[key]
-        if key in self._ttls: del self._ttls[key]
+        self._remove_key(key)
+        self._log("D", key)
     
     async def keys(self, pattern):
-        # Scan all stores
-        all_keys = list(self._store.keys()) + list(self._hash_store.keys()) + list(self._set_store.keys())
-        # Simple glob matching
-        return fnmatch.filter(all_keys, pattern)
+        # Only keys sharing the pattern's namespace prefix are considered
+        candidates = self._candidate_keys(pattern)
+        # Simple glob matching, skipping keys the sweeper has not reached yet
+        now = time.time()
+        return [k for k in fnmatch.filter(candidates, pattern) if not self._is_expired(k, now)]
+
+    async def scan(self, cursor=0, match="*", count=10):
+        """
+        SCAN-style cursor iteration over keys matching a glob pattern.
+        The first page snapshots the candidate keys; later pages resume at the
+        cursor's position in that snapshot, so a full SCAN is O(candidates).
+        Keys present for the whole iteration are returned exactly once, keys
+        deleted meanwhile are skipped. The cursor is an int (0 to start, 0
+        returned when done); only the last MAX_SCANS open cursors are kept.
+        Raises: ValueError for an unknown (finished or evicted) cursor
+        Returns: (next_cursor, keys_list)
+        """
+        if cursor == 0:
+            candidates, pos = self._candidate_keys(match), 0
+        else:
+            try:
+                candidates, pos = self._scans.pop(cursor)
+            except KeyError:
+                raise ValueError(f"Unknown SCAN cursor {cursor}") from None
+        now = time.time()
+        batch = []
+        while pos < len(candidates) and len(batch) < count:
+            key = candidates[pos]
+            pos += 1
+            if fnmatch.fnmatch(key, match) and self._key_present(key) and not self._is_expired(key, now):
+                batch.append(key)
+        if pos >= len(candidates):
+            return 0, batch
+        self._scan_cursor += 1
+        self._scans[self._scan_cursor] = (candidates, pos)
+        while len(self._scans) > self.MAX_SCANS:
+            self._scans.popitem(last=False)
+        return self._scan_cursor, batch
+
+    async def scan_iter(self, match="*", count=10):
+        cursor = 0
+        while True:
+            cursor, batch = await self.scan(cursor, match=match, count=count)
+            for key in batch:
+                yield key
+            if cursor == 0:
+                break
 
     # Simple KV Operations
     async def get(self, key):
@@ -80,7 +470,10 @@ class InMemoryRedisClient:
         return self._store.get(key)
 
     async def set(self, key, value, ex=None):
+        if key not in self._store:
+            self._index_add(key)
         self._store[key] = value
+        self._log("S", key, value)
         await self.expire(key, ex if ex else self.SESSION_TTL)
     
     async def setex(self, key, time, value):
@@ -98,19 +491,52 @@ class InMemoryRedisClient:
         await self._check_expiry(key)
         if key not in self._set_store:
             self._set_store[key] = set()
+            self._index_add(key)
         self._set_store[key].add(member)
+        self._log("A", key, member)
         await self.expire(key, self.SESSION_TTL)
 
     async def smembers(self, key):
         if await self._check_expiry(key): return set()
         return self._set_store.get(key, set())
+
+    async def scard(self, key):
+        if await self._check_expiry(key): return 0
+        return len(self._set_store.get(key, ()))
         
     async def srem(self, key, member):
         await self._check_expiry(key)
         if key in self._set_store:
             self._set_store[key].discard(member)
+            self._log("R", key, member)
             if not self._set_store[key]:
-                del self._set_store[key]
+                # Like Redis, an emptied set is removed along with its TTL
+                self._remove_key(key)
+
+# Per-command latency for either backend (store_command_seconds{command=...}).
+# Nested calls are timed too, e.g. set() -> expire() on the in-memory store.
+STORE_COMMANDS = (
+    "hset", "hset_if_exists", "hgetall", "hincrby", "hget", "expire", "persist", "delete", "keys", "scan",
+    "get", "set", "setex", "exists", "sadd", "smembers", "scard", "srem", "publish",
+)
+
+def instrument_store(client_cls, pipeline_cls):
+    metrics.instrument_methods(client_cls, STORE_COMMANDS, "store_command_seconds", "command")
+    if not getattr(pipeline_cls.execute, "_instrumented", False):
+        pipeline_cls.execute = metrics.timed("store_command_seconds", command="pipeline")(pipeline_cls.execute)
+        pipeline_cls.execute._instrumented = True
+
+instrument_store(InMemoryRedisClient, InMemoryPipeline)
+
+def create_redis_client():
+    """
+    Picks the store backend: pooled Redis when REDIS_URL is set,
+    otherwise the in-process mock (tests, single-worker dev).
+    """
+    if settings.REDIS_URL:
+        from app.core.redis_backend import RedisBackendClient
+        return RedisBackendClient(settings.REDIS_URL, max_connections=settings.REDIS_MAX_CONNECTIONS)
+    return InMemoryRedisClient()
 
 # Singleton accessor
-redis_client = InMemoryRedisClient()
+redis_client = create_redis_client()
@@ -0,0 +1,396 @@
+import array
+import socket
+import sys
+import numpy as np
+
+# Typed storage for session hashes (session:<user_id>:<session_id>).
+#
+# The in-memory store keeps every session in one columnar SessionTable: numeric
+# fields are int64 columns, low-cardinality strings (app, country, status, user)
+# are int32 codes into reference-counted intern pools, IPv4 addresses are packed into a uint32
+# column, and a per-row bitmask records which fields were ever written. The row
+# holds a reference to the store's own key string, from which user_id and
+# session_id are derived instead of being stored again. The store's hash
+# commands talk to a SessionRecord - a two-slot row view that behaves like the
+# old dict of strings - so hget/hgetall callers see exactly what they saw
+# before, while risk updates and bulk scans work on native ints.
+
+SESSION_PREFIX = "session:"
+
+INT_FIELDS = ("start_time", "last_heartbeat", "risk_score")
+LABEL_FIELDS = ("status", "app_name", "country")
+ID_FIELDS = ("user_id", "session_id")
+
+# Field order of the dict view, and each field's presence bit
+FIELD_ORDER = ("start_time", "last_heartbeat", "risk_score", "status", "ip", "app_name", "country")
+FIELD_BITS = {name: 1 << i for i, name in enumerate(FIELD_ORDER)}
+IP_BIT = FIELD_BITS["ip"]
+INT_BITS = {field: FIELD_BITS[field] for field in INT_FIELDS}
+
+def split_session_key(key):
+    """
+    'session:user_1:abc' -> ('user_1', 'abc'). Session ids never contain ':'.
+    Returns: (user_id, session_id), or None for a non-session key
+    """
+    if not key.startswith(SESSION_PREFIX):
+        return None
+    user_id, sep, session_id = key[len(SESSION_PREFIX):].rpartition(":")
+    if not sep:
+        return None
+    return user_id, session_id
+
+def to_int(value):
+    """
+    Raises: ValueError for anything that is not a whole number ("12.5", "nan")
+    """
+    if type(value) is int:
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        number = float(value)
+        if not number.is_integer():
+            raise ValueError(f"not an integer: {value!r}")
+        return int(number)
+
+def pack_ipv4(ip):
+    """
+    Returns: the IPv4 address as an int, or None for anything else (IPv6, junk)
+    """
+    try:
+        return int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+    except (OSError, TypeError):
+        return None
+
+class StringPool:
+    """
+    Interns repeated strings as small int codes, reference counted per row
+    that uses them. A string no row holds any more is dropped and its code
+    reused, so client-supplied values (app names, user ids) cannot grow the
+    pool past the distinct values of the live sessions.
+    """
+    __slots__ = ("codes", "values", "refs", "_free")
+
+    def __init__(self):
+        self.codes = {}
+        self.values = [] # code -> string (None when free)
+        self.refs = array.array("I")
+        self._free = []
+
+    def acquire(self, value):
+        """
+        Returns: the code of `value`, holding one reference to it
+        """
+        code = self.codes.get(value)
+        if code is None:
+            value = sys.intern(str(value))
+            if self._free:
+                code = self._free.pop()
+                self.values[code] = value
+            else:
+                code = len(self.values)
+                self.values.append(value)
+                self.refs.append(0)
+            self.codes[value] = code
+        self.refs[code] += 1
+        return code
+
+    def release(self, code):
+        self.refs[code] -= 1
+        if not self.refs[code]:
+            del self.codes[self.values[code]]
+            self.values[code] = None
+            self._free.append(code)
+
+    def __len__(self):
+        return len(self.codes)
+
+class SessionTable:
+    """
+    Array-backed session rows with a free list. Row handles (SessionRecord)
+    are what the store keeps under each session key; scan() hands bulk
+    consumers (reaper, batch risk scoring) numpy copies of the live rows.
+    """
+    def __init__(self):
+        self.users = StringPool()
+        self.labels = StringPool() # apps, countries and statuses share one code space
+        self.live = array.array("b")
+        self.present = array.array("H")
+        self.user_code = array.array("i")
+        self.ipv4 = array.array("I")
+        self.keys = [] # the store's key string for each row (None when free)
+        self.extra = [] # dict of fields outside the schema, or None
+        # field -> column; int fields hold values, label fields hold label codes
+        self.columns = {field: array.array("q") for field in INT_FIELDS}
+        self.columns.update((field, array.array("i")) for field in LABEL_FIELDS)
+        self._free = []
+        self._live_count = 0
+
+    def __len__(self):
+        return self._live_count
+
+    def record(self, key):
+        """
+        Allocates a row for a session key (the key object is kept, not copied).
+        Returns: SessionRecord, or None if `key` is not a session key
+        """
+        ids = split_session_key(key)
+        if ids is None:
+            return None
+        user = self.users.acquire(ids[0])
+        if self._free:
+            row = self._free.pop()
+            self.live[row] = 1
+            self.present[row] = 0
+            self.user_code[row] = user
+            self.ipv4[row] = 0
+            self.keys[row] = key
+            for column in self.columns.values():
+                column[row] = 0
+        else:
+            row = len(self.live)
+            self.live.append(1)
+            self.present.append(0)
+            self.user_code.append(user)
+            self.ipv4.append(0)
+            self.keys.append(key)
+            self.extra.append(None)
+            for column in self.columns.values():
+                column.append(0)
+        self._live_count += 1
+        return SessionRecord(self, row)
+
+    def release(self, row):
+        if self.live[row]:
+            self.users.release(self.user_code[row])
+            present = self.present[row]
+            for field in LABEL_FIELDS:
+                if present & FIELD_BITS[field]:
+                    self.labels.release(self.columns[field][row])
+            self.live[row] = 0
+            self.keys[row] = None
+            self.extra[row] = None
+            self._free.append(row)
+            self._live_count -= 1
+
+    def clear(self):
+        self.__init__()
+
+    def scan(self):
+        """
+        Columnar copy of the live rows for vectorised scans.
+        Returns: dict of numpy arrays - rows, present (FIELD_BITS mask), user_codes,
+                 ipv4, one array per int field, <label>_codes per label field -
+                 plus the `users` and `labels` code tables (None at freed codes)
+        """
+        live = np.frombuffer(self.live, dtype=np.int8).astype(bool)
+        # Boolean indexing copies, so no view onto the (resizable) arrays survives
+        columns = {
+            "rows": np.flatnonzero(live),
+            "present": np.frombuffer(self.present, dtype=np.uint16)[live],
+            "user_codes": np.frombuffer(self.user_code, dtype=np.int32)[live],
+            "ipv4": np.frombuffer(self.ipv4, dtype=np.uint32)[live],
+        }
+        for field in INT_FIELDS:
+            columns[field] = np.frombuffer(self.columns[field], dtype=np.int64)[live]
+        for field in LABEL_FIELDS:
+            columns[f"{field}_codes"] = np.frombuffer(self.columns[field], dtype=np.int32)[live]
+        columns["users"] = list(self.users.values)
+        columns["labels"] = list(self.labels.values)
+        return columns
+
+    def key(self, row):
+        return self.keys[row]
+
+    def get_metrics(self):
+        return {"live": self._live_count, "rows": len(self.live), "free": len(self._free),
+                "users": len(self.users), "labels": len(self.labels)}
+
+class SessionRecord:
+    """
+    One session row. Typed accessors (risk_score, last_heartbeat, ...) return
+    native values; the mapping interface (get/[]/update/items) is the
+    all-string view hget/hgetall have always returned.
+    """
+    __slots__ = ("table", "row")
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    # --- typed accessors ---
+
+    @property
+    def user_id(self):
+        table = self.table
+        return table.users.values[table.user_code[self.row]]
+
+    @property
+    def session_id(self):
+        return self.table.keys[self.row].rpartition(":")[2]
+
+    @property
+    def start_time(self):
+        return self._int("start_time")
+
+    @property
+    def last_heartbeat(self):
+        return self._int("last_heartbeat")
+
+    @property
+    def risk_score(self):
+        return self._int("risk_score")
+
+    @property
+    def status(self):
+        return self._label("status")
+
+    @property
+    def app_name(self):
+        return self._label("app_name")
+
+    @property
+    def country(self):
+        return self._label("country")
+
+    @property
+    def ip(self):
+        return self.get("ip")
+
+    def _int(self, field):
+        table = self.table
+        if table.present[self.row] & FIELD_BITS[field]:
+            return table.columns[field][self.row]
+        return None
+
+    def _label(self, field):
+        table = self.table
+        if table.present[self.row] & FIELD_BITS[field]:
+            return table.labels.values[table.columns[field][self.row]]
+        return None
+
+    def release(self):
+        self.table.release(self.row)
+
+    # --- writes ---
+
+    def set(self, field, value):
+        table, row = self.table, self.row
+        bit = FIELD_BITS.get(field)
+        if bit is None:
+            if field not in ID_FIELDS: # ids are derived from the key
+                self._set_extra(field, value)
+            return
+        if bit == IP_BIT:
+            packed = pack_ipv4(value)
+            if packed is None:
+                # IPv6 and the like are kept verbatim
+                table.present[row] &= ~bit
+                self._set_extra(field, value)
+                return
+            table.ipv4[row] = packed
+        elif field in INT_FIELDS:
+            try:
+                table.columns[field][row] = to_int(value)
+            except (TypeError, ValueError):
+                table.present[row] &= ~bit
+                self._set_extra(field, value)
+                return
+        else:
+            code = table.labels.acquire(value)
+            if table.present[row] & bit:
+                table.labels.release(table.columns[field][row])
+            table.columns[field][row] = code
+        table.present[row] |= bit
+        extra = table.extra[row]
+        if extra is not None and field in extra:
+            del extra[field]
+
+    def _set_extra(self, field, value):
+        extra = self.table.extra[self.row]
+        if extra is None:
+            extra = self.table.extra[self.row] = {}
+        extra[field] = value
+
+    def update(self, mapping):
+        for field, value in mapping.items():
+            self.set(field, value)
+
+    __setitem__ = set
+
+    def incr(self, field, amount=1):
+        """
+        HINCRBY on a numeric column without any string round trip.
+        Returns: the new value
+        """
+        bit = INT_BITS.get(field)
+        if bit is None:
+            value = to_int(self.get(field) or 0) + amount
+            self.set(field, str(value))
+            return value
+        table, row = self.table, self.row
+        column = table.columns[field]
+        present = table.present
+        if present[row] & bit:
+            value = column[row] + amount
+        else:
+            value = to_int((table.extra[row] or {}).get(field, 0)) + amount
+            present[row] |= bit
+        column[row] = value
+        return value
+
+    # --- string view (hget / hgetall compatibility) ---
+
+    def get(self, field, default=None):
+        table, row = self.table, self.row
+        bit = FIELD_BITS.get(field)
+        if bit is not None and table.present[row] & bit:
+            if bit == IP_BIT:
+                return socket.inet_ntop(socket.AF_INET, table.ipv4[row].to_bytes(4, "big"))
+            if field in INT_FIELDS:
+                return str(table.columns[field][row])
+            return table.labels.values[table.columns[field][row]]
+        if field == "user_id":
+            return self.user_id
+        if field == "session_id":
+            return self.session_id
+        extra = table.extra[row]
+        return extra.get(field, default) if extra is not None else default
+
+    def __getitem__(self, field):
+        value = self.get(field, KeyError)
+        if value is KeyError:
+            raise KeyError(field)
+        return value
+
+    def __contains__(self, field):
+        return self.get(field, KeyError) is not KeyError
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def items(self):
+        return self.to_dict().items()
+
+    def __iter__(self):
+        return iter(self.to_dict())
+
+    def __len__(self):
+        return len(self.to_dict())
+
+    def to_dict(self):
+        data = {"user_id": self.user_id, "session_id": self.session_id}
+        for field in FIELD_ORDER:
+            value = self.get(field)
+            if value is not None:
+                data[field] = value
+        extra = self.table.extra[self.row]
+        if extra:
+            for field, value in extra.items():
+                data.setdefault(field, value)
+        return data
+
+    copy = to_dict
+
+    def __repr__(self):
+        return f"SessionRecord({self.to_dict()!r})"
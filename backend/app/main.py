@@ -1,9 +1,28 @@
-from fastapi import FastAPI
+from app.core.log import configure_logging
+configure_logging() # before the other imports log their startup lines
+
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.api import router as api_router
 from app.auth.websockets import sio_app
+from app.core.redis_client import redis_client
+from app.agents.risk_queue import risk_workers
+from app.agents.risk import risk_detector
+from app.auth.keys import key_ring
+from app.auth.revocation import revocation_index
+from app.auth.rotation import refresh_rotator
+from app.agents.token_lifecycle import token_lifecycle
+from app.agents.decision import decision_agent
+from app.auth.session_registry import socket_registry
+from app.core.metrics import metrics, RequestLatencyMiddleware, TimedRoute
+from app.core.audit import audit_log
+from app.agents.heartbeats import heartbeat_buffer
+from app.auth.admission import admission_control
+from app.auth.credentials import credential_store
 
 app = FastAPI(title="Agentic SSO")
+# Routes record their template for the per-route latency histogram
+app.router.route_class = TimedRoute
 
 # CORS Configuration
 # Relaxing CORS to allow all local development origins via Regex
@@ -23,10 +42,107 @@ app.add_middleware(
 
 app.include_router(api_router, prefix="/api/v1")
 
+app.add_middleware(RequestLatencyMiddleware)
+
+metrics.gauge("socket_connections", "Connected sockets on this worker", lambda: len(socket_registry.by_sid))
+metrics.gauge("live_sessions", "Joined socket sessions on this worker",
+              lambda: sum(len(sids) for sids in socket_registry.local_sessions.values()))
+metrics.gauge("live_users", "Users with a joined socket on this worker", lambda: len(socket_registry.local_sessions))
+metrics.gauge("audit_queue_depth", "Audit events waiting to be written", lambda: audit_log.get_metrics()["queue_depth"])
+metrics.gauge("risk_queue_depth", "Queued risk jobs", lambda: risk_workers.get_metrics()["queue_depth"])
+metrics.gauge("heartbeat_pending", "Heartbeats waiting for the next batched write", lambda: heartbeat_buffer.get_metrics()["pending"])
+metrics.gauge("password_hash_pending", "bcrypt hashes queued or running", lambda: credential_store.hasher.get_metrics()["pending"])
+metrics.gauge("admission_rejected", "Login, refresh and re-auth attempts rejected by rate limits", lambda: admission_control.stats["rejected"])
+
+@app.on_event("startup")
+async def start_background_tasks():
+    # Bring back the in-memory keyspace (sessions, refresh families, blacklist) before anything reads it
+    redis_client.restore()
+    redis_client.start_persistence()
+    # Reclaim expired sessions/blacklist entries instead of waiting for a read
+    redis_client.start_sweeper()
+    # Cross-worker invalidations (revocations etc.)
+    redis_client.start_pubsub()
+    # Rebuild the local revocation filter from the store's blacklist
+    await revocation_index.warm()
+    # Risk analysis for socket joins runs on a worker pool
+    risk_workers.start()
+    # Demo accounts exist before the first login (hashing them is not free)
+    await credential_store.seed()
+    # Socket heartbeats are written in batches; silent sessions are reaped
+    heartbeat_buffer.start()
+    # Audit events are batched to disk in the background
+    audit_log.start()
+    # Load (or create) signing keys before the first login needs them
+    if key_ring.enabled:
+        key_ring.ensure_loaded()
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    await risk_workers.stop()
+    await heartbeat_buffer.stop()
+    await audit_log.stop()
+    await redis_client.stop_pubsub()
+    await redis_client.stop_persistence()
+    await redis_client.stop_sweeper()
+    credential_store.stop()
+    # Last: everything above may still talk to the store
+    await redis_client.close()
+
 @app.get("/")
 def read_root():
     return {"message": "Agentic SSO System Active"}
 
+@app.get("/.well-known/jwks.json")
+def jwks(response: Response):
+    # Relying apps (HR, CRM, ERP) verify tokens locally with these public keys
+    response.headers["Cache-Control"] = "public, max-age=300"
+    return key_ring.jwks() if key_ring.enabled else {"keys": []}
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/health/store")
+def store_health():
+    return redis_client.get_sweep_stats()
+
+@app.get("/health/risk-queue")
+def risk_queue_health():
+    return risk_workers.get_metrics()
+
+@app.get("/health/revocation")
+def revocation_health():
+    return {**revocation_index.get_metrics(), "rotation": refresh_rotator.get_metrics()}
+
+@app.get("/health/refresh-gate")
+def refresh_gate_health():
+    return token_lifecycle.get_metrics()
+
+@app.get("/health/decision")
+def decision_health():
+    return decision_agent.get_metrics()
+
+@app.get("/health/audit")
+def audit_health():
+    return audit_log.get_metrics()
+
+@app.get("/health/heartbeats")
+def heartbeat_health():
+    return heartbeat_buffer.get_metrics()
+
+@app.get("/health/admission")
+def admission_health():
+    return admission_control.get_metrics()
+
+@app.get("/health/credentials")
+def credential_health():
+    return credential_store.get_metrics()
+
+@app.get("/health/risk-rules")
+def risk_rules_health():
+    return risk_detector.get_rule_stats()
+
 # Wrap FastAPI with Socket.IO
 from app.auth.websockets import sio_server
 import socketio
@@ -0,0 +1,240 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import socket
+import time
+
+import httpx
+import socketio
+import uvicorn
+
+# One client hammering a couple of accounts from one address: lift the login
+# and refresh rate limits before the app (and its settings) is imported
+for name in ("LOGIN_RATE_LIMIT_IP", "LOGIN_RATE_LIMIT_USER", "REFRESH_RATE_LIMIT_IP"):
+    os.environ.setdefault(name, "0")
+# bcrypt cost is measured by bench_login_hash.py; here it would only dominate every login
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("PASSWORD_HASH_MAX_PENDING", "100000")
+
+from app.core.config import settings
+from app.main import app
+
+# Load generator for the auth + agent pipeline, all in one process:
+#   HTTP   -> httpx ASGITransport straight into the ASGI app (no sockets, no server)
+#   Socket -> python-socketio AsyncClient against an in-process uvicorn serving the same app
+#
+#   python bench_load.py --sessions 500 --users 50 --concurrency 64 --out results.json
+#   python bench_load.py --sessions 500 --compare results.json
+#
+# Phases run in order (login, refresh, me, connect, join, heartbeat, disconnect, revoke);
+# each reports p50/p95/p99 latency and throughput. Results are written as JSON.
+
+PREFIX = "/api/v1/auth"
+USERNAMES = ("user", "admin") # mock accounts that login accepts
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+class PhaseRecorder:
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.statuses = {}
+        self.errors = 0
+        self.elapsed = 0.0
+
+    def record(self, seconds, status, ok):
+        self.latencies.append(seconds)
+        self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+        if not ok:
+            self.errors += 1
+
+    def summary(self):
+        values = sorted(self.latencies)
+        count = len(values)
+        return {
+            "count": count,
+            "errors": self.errors,
+            "statuses": self.statuses,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "mean_ms": (sum(values) / count * 1000) if count else 0.0,
+            "throughput_rps": count / self.elapsed if self.elapsed else 0.0,
+        }
+
+async def run_phase(recorder, items, op, concurrency):
+    """
+    Runs op(item) for every item with at most `concurrency` in flight.
+    op returns (status, ok, result); results are returned in item order.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(item):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                status, ok, result = await op(item)
+            except Exception as e:
+                status, ok, result = type(e).__name__, False, None
+            recorder.record(time.perf_counter() - started, status, ok)
+            return result
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(item) for item in items))
+    recorder.elapsed = time.perf_counter() - started
+    return results
+
+async def http_phases(client, args, phases):
+    async def login(i):
+        form = {"username": USERNAMES[i % len(USERNAMES)], "password": "password"}
+        response = await client.post(f"{PREFIX}/login", data=form)
+        return response.status_code, response.status_code == 200, response.json() if response.status_code == 200 else None
+
+    async def refresh(tokens):
+        response = await client.post(f"{PREFIX}/refresh", params={"refresh_token": tokens["refresh_token"]})
+        ok = response.status_code == 200
+        return response.status_code, ok, response.json() if ok else tokens
+
+    async def me(tokens):
+        response = await client.get(f"{PREFIX}/me", headers={"Authorization": f"Bearer {tokens['access_token']}"})
+        return response.status_code, response.status_code == 200, tokens
+
+    phases["login"] = PhaseRecorder("login")
+    sessions = await run_phase(phases["login"], range(args.sessions), login, args.concurrency)
+    sessions = [s for s in sessions if s]
+
+    phases["refresh"] = PhaseRecorder("refresh")
+    sessions = await run_phase(phases["refresh"], sessions, refresh, args.concurrency)
+
+    phases["me"] = PhaseRecorder("me")
+    await run_phase(phases["me"], sessions, me, args.concurrency)
+    return sessions
+
+async def revoke_phase(client, args, phases, sessions):
+    async def revoke(tokens):
+        response = await client.post(f"{PREFIX}/revoke", headers={"Authorization": f"Bearer {tokens['access_token']}"})
+        return response.status_code, response.status_code == 200, None
+
+    phases["revoke"] = PhaseRecorder("revoke")
+    await run_phase(phases["revoke"], sessions, revoke, args.concurrency)
+
+async def socket_phases(url, args, phases):
+    async def connect(i):
+        sio = socketio.AsyncClient(reconnection=False)
+        await sio.connect(url, transports=["websocket"])
+        return "ok", True, (i, sio)
+
+    async def join(entry):
+        i, sio = entry
+        await sio.call("join", {"user_id": f"bench_user_{i % args.users}", "app_name": "Bench"}, timeout=30)
+        return "ack", True, entry
+
+    async def heartbeat(entry):
+        i, sio = entry
+        await sio.call("heartbeat", {"user_id": f"bench_user_{i % args.users}"}, timeout=30)
+        return "ack", True, entry
+
+    async def disconnect(entry):
+        await entry[1].disconnect()
+        return "ok", True, None
+
+    phases["socket_connect"] = PhaseRecorder("socket_connect")
+    clients = await run_phase(phases["socket_connect"], range(args.sockets), connect, args.concurrency)
+    clients = [c for c in clients if c]
+    try:
+        phases["socket_join"] = PhaseRecorder("socket_join")
+        await run_phase(phases["socket_join"], clients, join, args.concurrency)
+        phases["socket_heartbeat"] = PhaseRecorder("socket_heartbeat")
+        beats = [entry for _ in range(args.heartbeats) for entry in clients]
+        await run_phase(phases["socket_heartbeat"], beats, heartbeat, args.concurrency)
+    finally:
+        phases["socket_disconnect"] = PhaseRecorder("socket_disconnect")
+        await run_phase(phases["socket_disconnect"], clients, disconnect, args.concurrency)
+
+async def run(args):
+    phases = {}
+    port = free_port()
+    # uvicorn also runs the lifespan (sweeper, risk workers, pub/sub) for the HTTP side
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    transport = httpx.ASGITransport(app=app, client=("127.0.0.1", 50000))
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60.0) as client:
+            sessions = await http_phases(client, args, phases)
+            if args.sockets:
+                await socket_phases(f"http://127.0.0.1:{port}", args, phases)
+            await revoke_phase(client, args, phases, sessions)
+    finally:
+        server.should_exit = True
+        await server_task
+    return {name: recorder.summary() for name, recorder in phases.items()}
+
+def print_table(results, baseline=None):
+    header = f"{'phase':<18}{'count':>7}{'err':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}"
+    if baseline:
+        header += f"{'p95 vs base':>13}"
+    print(header)
+    for name, r in results.items():
+        line = (f"{name:<18}{r['count']:>7}{r['errors']:>6}{r['p50_ms']:>10.2f}"
+                f"{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['throughput_rps']:>10.0f}")
+        base = (baseline or {}).get(name)
+        if base and base.get("p95_ms"):
+            line += f"{(r['p95_ms'] / base['p95_ms'] - 1) * 100:>+12.1f}%"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=200, help="HTTP login sessions")
+    parser.add_argument("--users", type=int, default=50, help="distinct user ids for socket joins")
+    parser.add_argument("--sockets", type=int, default=100, help="socket clients (0 to skip)")
+    parser.add_argument("--heartbeats", type=int, default=5, help="heartbeats per socket")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--compare", default="", help="previous results file to diff p95 against")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's own logging")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.ERROR)
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        results = asyncio.run(run(args))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    print_table(results, baseline)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "store": "redis" if settings.REDIS_URL else "in-memory",
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.out}")
+
+if __name__ == "__main__":
+    main()
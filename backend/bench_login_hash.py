@@ -0,0 +1,105 @@
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+import bcrypt
+
+from app.auth.credentials import CredentialStore, PasswordHasher
+
+# Concurrent password logins per core: CredentialStore.authenticate() with
+# bcrypt inline on the event loop (the naive version) vs on the hash pool.
+# A ticker task measures how long the loop stalls while logins are in flight,
+# which is what every other request on the worker would feel.
+#
+#   python bench_login_hash.py --logins 64 --rounds 12
+#   python bench_login_hash.py --logins 64 --rounds 10 --workers 1 2 4
+
+class InlineHasher(PasswordHasher):
+    # Baseline: bcrypt on the loop thread
+    async def _run(self, fn, *args):
+        return fn(*args)
+
+async def loop_lag(stop, samples, interval=0.005):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append((time.perf_counter() - started - interval) * 1000)
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else 0.0
+
+async def run_case(label, hasher, args):
+    store = CredentialStore(hasher, demo_users=["bench"], demo_user_id="bench_user", demo_password="correct horse")
+    await store.seed()
+    stop, lag = asyncio.Event(), []
+    ticker = asyncio.create_task(loop_lag(stop, lag))
+    latencies = []
+
+    async def one(_):
+        started = time.perf_counter()
+        user_id, status = await store.authenticate("bench", "correct horse")
+        if status == "ok":
+            latencies.append((time.perf_counter() - started) * 1000)
+        return status
+
+    started = time.perf_counter()
+    statuses = await asyncio.gather(*(one(i) for i in range(args.logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker
+    hasher.stop()
+
+    ok = statuses.count("ok")
+    workers = 1 if isinstance(hasher, InlineHasher) else hasher.workers
+    cores = min(workers, os.cpu_count() or 1)
+    print(f"{label:<16} {ok:>5} {statuses.count('busy'):>5} {ok / elapsed:>9.1f} {ok / elapsed / cores:>10.1f}"
+          f" {percentile(latencies, 50):>9.0f} {percentile(latencies, 99):>9.0f} {max(lag or [0]):>11.0f}")
+
+async def unknown_users(args):
+    # A guess at an account that does not exist must cost as much as a wrong
+    # password, or response times reveal which usernames exist
+    store = CredentialStore(PasswordHasher(rounds=args.rounds), demo_users=["bench"],
+                            demo_user_id="bench_user", demo_password="correct horse")
+    await store.seed()
+    await store.authenticate("nobody", "x") # builds the dummy hash
+
+    async def mean_ms(username):
+        started = time.perf_counter()
+        for _ in range(args.unknown):
+            await store.authenticate(username, "wrong")
+        return (time.perf_counter() - started) / args.unknown * 1000
+
+    wrong_ms, unknown_ms = await mean_ms("bench"), await mean_ms("nobody")
+    print(f"wrong password {wrong_ms:.1f} ms vs unknown user {unknown_ms:.1f} ms per attempt"
+          f" ({store.stats['negative_hits']} negative-cache hits skipped the store read)")
+    store.stop()
+
+async def main(args):
+    hashed = bcrypt.hashpw(b"correct horse", bcrypt.gensalt(args.rounds))
+    started = time.perf_counter()
+    bcrypt.checkpw(b"correct horse", hashed)
+    single_ms = (time.perf_counter() - started) * 1000
+    print(f"cores {os.cpu_count()} | bcrypt cost {args.rounds} | one verify {single_ms:.0f} ms | {args.logins} concurrent logins")
+    print(f"{'mode':<16} {'ok':>5} {'busy':>5} {'logins/s':>9} {'per core':>10} {'p50 ms':>9} {'p99 ms':>9} {'loop lag ms':>11}")
+
+    await run_case("inline", InlineHasher(rounds=args.rounds, max_pending=args.logins), args)
+    for kind in args.kinds:
+        for workers in args.workers or [os.cpu_count() or 1]:
+            hasher = PasswordHasher(rounds=args.rounds, workers=workers, max_pending=args.max_pending, kind=kind)
+            await run_case(f"{kind} x{workers}", hasher, args)
+    await unknown_users(args)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--workers", type=int, nargs="*", help="pool sizes to try (default: one per core)")
+    parser.add_argument("--kinds", nargs="*", default=["thread", "process"])
+    parser.add_argument("--max-pending", type=int, default=64, help="queue-depth limit; logins beyond it are refused")
+    parser.add_argument("--unknown", type=int, default=20, help="sequential attempts per case in the timing comparison")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(main(args))
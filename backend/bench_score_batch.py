@@ -0,0 +1,70 @@
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from app.agents.risk import risk_detector
+from app.agents.rules import BatchFeatures, RiskContext
+from app.agents.decision import decision_agent, ACTIONS
+
+# Throughput of the vectorized re-scoring path.
+#   python bench_score_batch.py --sessions 1000000
+
+COUNTRIES = ["India", "Russia", "United States", "Germany", "Singapore"]
+
+def make_features(n, seed=7):
+    rng = np.random.default_rng(seed)
+    country_codes = rng.choice(len(COUNTRIES), size=n, p=[0.9, 0.025, 0.025, 0.025, 0.025])
+    session_counts = rng.integers(1, 8, size=n)
+    hours = rng.integers(0, 24, size=n)
+    switch_intervals = rng.exponential(60.0, size=n)
+    switch_intervals[rng.random(n) < 0.3] = np.nan # no previous switch
+    return BatchFeatures(country_codes, COUNTRIES, session_counts, hours, switch_intervals)
+
+async def scalar_score(features, i):
+    """
+    Reference: the per-session rules + evaluate_risk thresholds, without the store.
+    """
+    ctx = RiskContext(f"user_{i}", f"session_{i}", {"country": features.countries[features.country_codes[i]]})
+    ctx.hour = int(features.hours[i])
+    ctx.reads[("scard", ctx.resolve("user:{user_id}:live_sessions"))] = int(features.session_counts[i])
+    interval = features.switch_intervals[i]
+    if not np.isnan(interval):
+        ctx.reads[("get", ctx.resolve("user:{user_id}:last_app_switch"))] = str(ctx.now - interval)
+    score = 0
+    for rule in risk_detector.rules:
+        score += (await rule.evaluate(ctx))[0]
+    return score
+
+async def check_parity(features, result, samples=2000):
+    for i in range(min(samples, len(features))):
+        expected = await scalar_score(features, i)
+        assert expected == result["scores"][i], (i, expected, result["scores"][i])
+        band = decision_agent.classify_batch(np.array([expected]))[0]
+        assert band == result["bands"][i]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    features = make_features(args.sessions)
+    risk_detector.score_batch(features) # warm-up
+
+    timings = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        result = risk_detector.score_batch(features)
+        timings.append(time.perf_counter() - started)
+
+    asyncio.run(check_parity(features, result))
+
+    best = min(timings)
+    counts = np.bincount(result["bands"], minlength=len(ACTIONS))
+    print(f"Sessions: {args.sessions:,} | best {best * 1000:.1f} ms | {args.sessions / best / 1e6:.1f} M sessions/s")
+    print("Bands:", dict(zip(ACTIONS, counts.tolist())))
+
+if __name__ == "__main__":
+    main()
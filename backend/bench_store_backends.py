@@ -0,0 +1,83 @@
+import argparse
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+
+from fastapi.security import OAuth2PasswordRequestForm
+
+# The store is under test, not bcrypt
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+from app.core.redis_client import InMemoryRedisClient
+from app.core.redis_backend import RedisBackendClient
+from app.agents.monitoring import session_monitor
+from app.agents.risk import risk_detector
+from app.agents.decision import decision_agent
+from app.agents.token_lifecycle import token_lifecycle
+from app.auth.admission import AdmissionVerdict
+from app.auth.credentials import credential_store
+from app.auth import oidc
+
+# Compares the in-memory mock against a real (or fake) Redis on the login path.
+#   python bench_store_backends.py                       # uses fakeredis (requirements-dev.txt)
+#   python bench_store_backends.py --redis-url redis://localhost:6379/0
+
+def use_backend(client):
+    # Agents hold a reference to the store singleton; point them at the backend under test
+    session_monitor.redis = client
+    risk_detector.redis = client
+    decision_agent.redis = client
+    token_lifecycle.redis = client
+    # Accounts are read from the backend under test, seeded there on first login
+    credential_store.redis = client
+    credential_store._seeded = False
+
+async def run_logins(client, n, concurrency):
+    use_backend(client)
+    request = SimpleNamespace(client=SimpleNamespace(host="127.0.0.1"))
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one_login(i):
+        form = OAuth2PasswordRequestForm(username="user", password="password")
+        async with semaphore:
+            started = time.perf_counter()
+            await oidc.login(request, form, redis=client, admission=AdmissionVerdict())
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_login(i) for i in range(n)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "logins_per_sec": n / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+    }
+
+def make_redis_backend(redis_url):
+    if redis_url:
+        return RedisBackendClient(redis_url)
+    from fakeredis import FakeAsyncRedis
+    return RedisBackendClient(client=FakeAsyncRedis(decode_responses=True))
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--redis-url", default="")
+    args = parser.parse_args()
+
+    backends = {
+        "in-memory": InMemoryRedisClient(),
+        "redis" if args.redis_url else "fakeredis": make_redis_backend(args.redis_url),
+    }
+    for name, client in backends.items():
+        result = await run_logins(client, args.logins, args.concurrency)
+        print(f"{name:>10}: {result['logins_per_sec']:8.0f} logins/s | "
+              f"p50 {result['p50_ms']:.2f} ms | p99 {result['p99_ms']:.2f} ms")
+
+if __name__ == "__main__":
+    asyncio.run(main())
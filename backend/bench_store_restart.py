@@ -0,0 +1,88 @@
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from app.core.persistence import StorePersistence
+from app.core.redis_client import InMemoryRedisClient
+
+# Warm-restart benchmark for the in-memory store's persistence:
+#   1. fills the store with session hashes, blacklist strings and session sets
+#   2. writes a snapshot, then a log tail of extra writes (half of them short-lived)
+#   3. clears the keyspace and times StorePersistence.load() (mmap snapshot + tail replay)
+#
+#   python bench_store_restart.py --keys 1000000 --tail 100000
+
+def clear(client):
+    for store in (client._store, client._hash_store, client._set_store, client._ttls, client._prefix_index):
+        store.clear()
+    client._expiry_heap.clear()
+    client._session_table.clear()
+
+async def populate(client, keys, tail, persistence):
+    sessions = keys // 2
+    for i in range(sessions):
+        await client.hset(f"session:user_{i % 50000}:{i}", {
+            "start_time": 1700000000, "last_heartbeat": 1700000000, "risk_score": 0,
+            "status": "ACTIVE", "ip": "10.0.0.1", "app_name": "HR", "country": "US",
+        })
+    for i in range(keys - sessions - keys // 10):
+        await client.setex(f"blacklist:jti_{i}", 3600, "revoked")
+    for i in range(keys // 10):
+        await client.sadd(f"user_sessions:user_{i}", str(i))
+
+    started = time.perf_counter()
+    await persistence.snapshot()
+    snapshot_s = time.perf_counter() - started
+
+    for i in range(tail):
+        # Every other tail write expires before the restart and must be skipped
+        await client.set(f"tail:{i}", "x", ex=1 if i % 2 else 3600)
+        await client.hincrby(f"session:user_{i % 50000}:{i % sessions}", "risk_score", 1)
+    await persistence.flush()
+    return snapshot_s
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--keys", type=int, default=1000000)
+    parser.add_argument("--tail", type=int, default=100000, help="log records written after the snapshot")
+    parser.add_argument("--dir", default="", help="persistence directory (default: temp dir, removed)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    directory = args.dir or tempfile.mkdtemp(prefix="store-bench-")
+    client = InMemoryRedisClient()
+    clear(client)
+    persistence = StorePersistence(client, directory, fsync=False)
+    try:
+        persistence.load()
+        client._journal = []
+        persistence._snapshot_lock = asyncio.Lock()
+
+        started = time.perf_counter()
+        snapshot_s = asyncio.run(populate(client, args.keys, args.tail, persistence))
+        fill_s = time.perf_counter() - started
+        client._journal = None
+        live_before = len(client._store) + len(client._hash_store) + len(client._set_store)
+        snap_mb = os.path.getsize(os.path.join(directory, "store.snap")) / 1e6
+
+        time.sleep(1.1) # let the short-lived tail keys expire
+        clear(client)
+        restored = StorePersistence(client, directory, fsync=False)
+        restored.load()
+        stats = restored.stats
+
+        print(f"keys before restart   {live_before}")
+        print(f"fill + snapshot       {fill_s:.2f} s (snapshot {snapshot_s:.2f} s, {snap_mb:.1f} MB)")
+        print(f"restored keys         {stats['loaded_keys']}")
+        print(f"replayed / skipped    {stats['replayed_records']} / {stats['skipped_records']}")
+        print(f"load time             {stats['load_ms'] / 1000:.2f} s")
+    finally:
+        if not args.dir:
+            shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
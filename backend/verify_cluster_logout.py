@@ -0,0 +1,106 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+import socketio
+
+# Multi-node check: N uvicorn workers share a local Redis stand-in (fakeredis TCP server,
+# pip install -r requirements-dev.txt).
+# A global revoke sent to worker 0 must reach sockets connected to every worker.
+#   python verify_cluster_logout.py [workers] [sockets_per_worker]
+
+MAX_FANOUT_LATENCY = 2.0 # seconds
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_redis_stand_in(port):
+    from fakeredis import TcpFakeServer
+    server = TcpFakeServer(("127.0.0.1", port), server_type="redis")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def start_worker(port, redis_url):
+    env = {**os.environ, "REDIS_URL": redis_url}
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+async def wait_ready(url, timeout=20):
+    deadline = time.time() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.time() < deadline:
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Worker at {url} did not start")
+
+async def verify(workers, sockets_per_worker):
+    redis_port = free_port()
+    redis_server = start_redis_stand_in(redis_port)
+    redis_url = f"redis://127.0.0.1:{redis_port}/0"
+    ports = [free_port() for _ in range(workers)]
+    procs = [start_worker(port, redis_url) for port in ports]
+    clients = []
+    try:
+        await asyncio.gather(*(wait_ready(f"http://127.0.0.1:{port}/") for port in ports))
+
+        received = {}
+        for port in ports:
+            for i in range(sockets_per_worker):
+                client = socketio.AsyncClient()
+                name = f"worker:{port}/socket:{i}"
+
+                def on_logout(data, name=name):
+                    received.setdefault(name, time.perf_counter())
+                client.on('LOGOUT_ALL', on_logout)
+
+                await client.connect(f"http://127.0.0.1:{port}", transports=['websocket'])
+                await client.emit('join', {'user_id': 'user_123', 'app_name': f'Verifier {name}'})
+                clients.append(client)
+
+        # Let joins land on every worker before revoking
+        await asyncio.sleep(1.0)
+
+        started = time.perf_counter()
+        async with httpx.AsyncClient() as http:
+            response = await http.post(f"http://127.0.0.1:{ports[0]}/api/v1/auth/global-revoke")
+            response.raise_for_status()
+
+        expected = len(clients)
+        while len(received) < expected and time.perf_counter() - started < MAX_FANOUT_LATENCY:
+            await asyncio.sleep(0.01)
+
+        latencies = sorted(t - started for t in received.values())
+        print(f"Workers: {workers} | Sockets: {expected} | Received LOGOUT_ALL: {len(received)}")
+        if latencies:
+            print(f"Fan-out latency: max {latencies[-1] * 1000:.1f} ms")
+        if len(received) == expected:
+            print("✅ Global logout reached every worker")
+            return True
+        print("❌ Some sockets never received LOGOUT_ALL")
+        return False
+    finally:
+        for client in clients:
+            await client.disconnect()
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+        redis_server.shutdown()
+
+if __name__ == "__main__":
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    sockets_per_worker = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    ok = asyncio.run(verify(workers, sockets_per_worker))
+    sys.exit(0 if ok else 1)
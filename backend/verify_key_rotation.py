@@ -0,0 +1,60 @@
+import os
+import sys
+import tempfile
+import time
+
+from jose import JWTError
+
+from app.auth.keys import KeyRing
+
+# Signing-key rotation without downtime.
+#   python verify_key_rotation.py
+#
+# Two key rings share one keys directory, like two workers.
+# 1. A token is signed with a key that is already older than retire_after.
+# 2. Rotating keeps that key: it retires now, not when it was created.
+# 3. The other worker verifies the token (it rescans on the unknown kid).
+# 4. retire_after past the rotation the old key and its file are pruned.
+# 5. A key older than rotate_after is replaced on the next sign.
+
+RETIRE_AFTER = 100
+
+def check_all():
+    directory = tempfile.mkdtemp(prefix="keys-verify-")
+    signer = KeyRing("ES256", keys_dir=directory, retire_after=RETIRE_AFTER)
+    verifier = KeyRing("ES256", keys_dir=directory, retire_after=RETIRE_AFTER)
+    signer.ensure_loaded()
+    verifier.ensure_loaded()
+    checks = []
+
+    old = signer.active
+    old.created_at -= RETIRE_AFTER + 1
+    token = signer.sign({"sub": "user_123"})
+    signer._rotate_unless(lambda: False)
+    new = signer.active
+    checks.append(("rotation switches the signing key", new.kid != old.kid, new.kid))
+    checks.append(("old key survives the rotation", old.kid in signer.keys and os.path.exists(os.path.join(directory, f"{old.kid}.pem")), old.kid))
+
+    try:
+        claims = verifier.verify(token)
+        checks.append(("token signed before the rotation verifies", claims.get("sub") == "user_123", claims))
+    except JWTError as e:
+        checks.append(("token signed before the rotation verifies", False, e))
+
+    signer._prune(new.created_at + RETIRE_AFTER + 1)
+    gone = old.kid not in signer.keys and not os.path.exists(os.path.join(directory, f"{old.kid}.pem"))
+    checks.append(("old key pruned retire_after past the rotation", gone, sorted(signer.keys)))
+
+    aging = KeyRing("ES256", keys_dir=directory, retire_after=RETIRE_AFTER, rotate_after=50)
+    aging.ensure_loaded()
+    before = aging.active.kid
+    aging.active.created_at = time.time() - 60
+    aging.sign({"sub": "user_123"})
+    checks.append(("key older than rotate_after is replaced on sign", aging.active.kid != before, aging.active.kid))
+
+    for name, ok, detail in checks:
+        print(f"{'✅' if ok else '❌'} {name} ({detail})")
+    return all(ok for _, ok, _ in checks)
+
+if __name__ == "__main__":
+    sys.exit(0 if check_all() else 1)
@@ -0,0 +1,90 @@
+import asyncio
+import os
+import socket
+import sys
+import time
+
+import socketio
+import uvicorn
+
+# Hashing cost is irrelevant here
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+from app.main import app
+from app.agents.decision import decision_agent
+from app.core.redis_client import redis_client
+
+# Re-authentication must open the grace period.
+#   python verify_reauth_grace.py
+#
+# 1. A score in the re-auth band is REQUIRE_REAUTH for a user without a recent re-auth.
+# 2. A joined socket answers verify_password correctly and gets REAUTH_SUCCESS.
+# 3. last_reauth is now stored, and the same score is downgraded to WARNING.
+# 4. A wrong password gets REAUTH_FAILED.
+# 5. A socket that never joined is refused even with the right password and a user_id.
+
+USER_ID = "user_123"
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def reauth(client, password):
+    answer = asyncio.get_running_loop().create_future()
+    client.on('REAUTH_SUCCESS', lambda data: answer.done() or answer.set_result('REAUTH_SUCCESS'))
+    client.on('REAUTH_FAILED', lambda data: answer.done() or answer.set_result('REAUTH_FAILED'))
+    await client.emit('verify_password', {'user_id': USER_ID, 'password': password})
+    return await asyncio.wait_for(answer, timeout=10)
+
+async def verify():
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    client = socketio.AsyncClient()
+    stranger = socketio.AsyncClient()
+    checks = []
+    try:
+        await redis_client.delete(decision_agent.last_reauth_key(USER_ID))
+        decision_agent.grace.invalidate(USER_ID)
+        policy = decision_agent.current_policy()
+        score = policy.reauth + 1 # inside the re-auth band
+
+        before = await decision_agent.evaluate_risk(USER_ID, "verifier", score)
+        checks.append(("no grace period before re-auth", before == "REQUIRE_REAUTH", before))
+
+        await client.connect(f"http://127.0.0.1:{port}", transports=['websocket'])
+        await client.emit('join', {'user_id': USER_ID, 'app_name': 'Verifier'})
+        await asyncio.sleep(0.2)
+
+        answer = await reauth(client, "wrong password")
+        checks.append(("wrong password is refused", answer == "REAUTH_FAILED", answer))
+
+        answer = await reauth(client, "password")
+        checks.append(("correct password is verified", answer == "REAUTH_SUCCESS", answer))
+
+        stored = await redis_client.get(decision_agent.last_reauth_key(USER_ID))
+        fresh = stored is not None and time.time() - float(stored) < 10
+        checks.append(("last_reauth written", fresh, stored))
+
+        after = await decision_agent.evaluate_risk(USER_ID, "verifier", score)
+        checks.append(("grace period downgrades re-auth", after == "WARNING", after))
+
+        await stranger.connect(f"http://127.0.0.1:{port}", transports=['websocket'])
+        answer = await reauth(stranger, "password")
+        checks.append(("socket that never joined is refused", answer == "REAUTH_FAILED", answer))
+    finally:
+        await client.disconnect()
+        await stranger.disconnect()
+        server.should_exit = True
+        await server_task
+
+    for name, ok, detail in checks:
+        print(f"{'✅' if ok else '❌'} {name} ({detail})")
+    return all(ok for _, ok, _ in checks)
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(verify()) else 1)
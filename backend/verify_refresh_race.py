@@ -0,0 +1,86 @@
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+# One client hammering a couple of accounts from one address: lift the login
+# and refresh rate limits before the app (and its settings) is imported
+for name in ("LOGIN_RATE_LIMIT_IP", "LOGIN_RATE_LIMIT_USER", "REFRESH_RATE_LIMIT_IP"):
+    os.environ.setdefault(name, "0")
+# bcrypt cost is measured by bench_login_hash.py; here it would only dominate every login
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("PASSWORD_HASH_MAX_PENDING", "100000")
+
+# Concurrency stress test for refresh-token rotation.
+#   python verify_refresh_race.py                 (in-process app, store from settings)
+#   python verify_refresh_race.py --url http://localhost:8000
+#   REDIS_URL=redis://localhost:6379/0 python verify_refresh_race.py
+#
+# 1. Same token, N parallel refreshes: exactly one may succeed, and the reuse
+#    must revoke the family (the winner's new refresh token stops working too).
+# 2. N distinct sessions refreshed in parallel: every one must succeed.
+
+PREFIX = "/api/v1/auth"
+
+def make_client(url):
+    if url:
+        return httpx.AsyncClient(base_url=url, timeout=30.0)
+    from app.main import app
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test", timeout=30.0)
+
+async def login(client):
+    response = await client.post(f"{PREFIX}/login", data={"username": "user", "password": "password"})
+    response.raise_for_status()
+    return response.json()
+
+async def refresh(client, token):
+    return await client.post(f"{PREFIX}/refresh", params={"refresh_token": token})
+
+async def same_token_race(client, n):
+    tokens = await login(client)
+    started = time.perf_counter()
+    responses = await asyncio.gather(*(refresh(client, tokens["refresh_token"]) for _ in range(n)))
+    elapsed = time.perf_counter() - started
+    winners = [r for r in responses if r.status_code == 200]
+    rejected = sum(1 for r in responses if r.status_code == 401)
+    print(f"Same token x{n}: {len(winners)} rotated, {rejected} rejected ({n / elapsed:.0f} req/s)")
+    ok = len(winners) == 1 and rejected == n - 1
+
+    if winners and n > 1:
+        follow_up = await refresh(client, winners[0].json()["refresh_token"])
+        family_revoked = follow_up.status_code == 401
+        print(f"  winner's token after reuse: {follow_up.status_code} (family revoked: {family_revoked})")
+        ok = ok and family_revoked
+    return ok
+
+async def distinct_sessions(client, n):
+    sessions = await asyncio.gather(*(login(client) for _ in range(n)))
+    started = time.perf_counter()
+    responses = await asyncio.gather(*(refresh(client, s["refresh_token"]) for s in sessions))
+    elapsed = time.perf_counter() - started
+    succeeded = sum(1 for r in responses if r.status_code == 200)
+    print(f"Distinct sessions x{n}: {succeeded} rotated ({n / elapsed:.0f} req/s)")
+    return succeeded == n
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="", help="running server; default is the app in-process")
+    parser.add_argument("--parallel", type=int, default=2000)
+    parser.add_argument("--sessions", type=int, default=500)
+    args = parser.parse_args()
+
+    async with make_client(args.url) as client:
+        results = [
+            await same_token_race(client, args.parallel),
+            await distinct_sessions(client, args.sessions),
+        ]
+    if all(results):
+        print("✅ Rotation is race-free")
+    else:
+        print("❌ Rotation race detected")
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
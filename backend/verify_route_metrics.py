@@ -0,0 +1,37 @@
+import asyncio
+import sys
+
+import httpx
+
+from app.main import app
+
+# Per-route request latency must carry the route template, not "unmatched".
+#   python verify_route_metrics.py
+#
+# Requests go through the full ASGI stack (middleware, router, included
+# routers); /metrics must then list each route's template once, and a path
+# no route matches as "unmatched".
+
+EXPECTED = [
+    ('GET', '/health/store', '/health/store'),
+    ('GET', '/api/v1/auth/me', '/api/v1/auth/me'), # 401 without a token, still the route
+    ('GET', '/no/such/page', 'unmatched'),
+]
+
+async def verify():
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://verifier") as client:
+        for method, path, _ in EXPECTED:
+            await client.request(method, path)
+        exposition = (await client.get("/metrics")).text
+
+    checks = []
+    for method, path, route in EXPECTED:
+        series = f'http_request_seconds_count{{method="{method}",route="{route}"}}'
+        checks.append((f"{path} -> route=\"{route}\"", series in exposition, series))
+    for name, ok, detail in checks:
+        print(f"{'✅' if ok else '❌'} {name} ({detail})")
+    return all(ok for _, ok, _ in checks)
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(verify()) else 1)
@@ -23,7 +23,7 @@ const useSocketListener = (navigate, token, onLogout) => {
 
             const joinRoom = () => {
                 console.log(`Attempting to join room for user: ${userId} as ${appName}`);
-                socket.emit('join', { user_id: userId, app_name: appName });
+                socket.emit('join', { user_id: userId, app_name: appName, token });
             };
 
             if (socket.connected) {